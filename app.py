@@ -1,10 +1,23 @@
-from flask import Flask, render_template, request, redirect, flash, send_file
+from flask import Flask, Response, render_template, request, redirect, flash, send_file, send_from_directory, session, url_for
 import os
 import json
-import re
+import uuid
 import subprocess
-import shutil
-from draw_keymap import draw_layers
+from draw_keymap import draw_layers, draw_sheet, read_sprite_map
+from keycodes import KEY_MAP_VERSION
+from convert_vil import convert_file
+import conversion_cache
+import uf2
+from mount_watcher import MountWatcher
+import flash_session
+from build_orchestrator import BuildOrchestrator, BuildStore
+from build_catalog import BuildCatalog
+from binding_index import BindingIndex, DEFAULT_LIMIT as SEARCH_LIMIT, TEMPLATE, KEYMAP, BUILD
+from artifact_store import ArtifactStore
+from build_backends import RemoteBackend, LocalWestBackend
+from build_inputs import inputs_hash
+from atomic_io import FileLock, LockBusy, atomic_copy, atomic_write, prune
+from job_queue import JobQueue, DONE, FAILED, FINISHED
 
 app = Flask(__name__)
 app.secret_key = 'zmk_secret_key'
@@ -13,214 +26,188 @@ UPLOAD_FOLDER = 'vail_templates'
 KEYMAP_FILE = 'config/corne.keymap'
 FIRMWARE_DIR = 'firmware_latest'
 BUILDS_DIR = 'builds'
+IMAGES_DIR = 'static/images'
+
+# Each browser session converts into its own workspace (keymap, layer images,
+# build log) and only publishes to config/ under keymap_lock, so concurrent
+# sessions and WSGI worker processes never see each other's half-written files.
+SESSIONS_DIR = '.cache/sessions'
+SESSION_IMAGES_DIR = os.path.join(IMAGES_DIR, 'sessions')
+SESSION_MAX_AGE = 7 * 24 * 3600
+keymap_lock = FileLock('keymap') # Guards config/ and the git tree while publishing/pushing
+
+def load_config():
+    try:
+        with open('config.json', 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+CONFIG = load_config()
+
+# Layer previews: "png" (one image per layer), "svg" (all layers in one SVG) or
+# "sprite" (one PNG plus a JSON offset map); config.json "render_mode"
+RENDER_MODE = CONFIG.get('render_mode', 'png')
+
+# Bootloader drive: <mount_root>/<bootloader_volume>, e.g. /Volumes/NICENANO on macOS
+mount_watcher = MountWatcher(CONFIG.get('mount_root'), CONFIG.get('bootloader_volume'))
+
+# Chip family every flashed UF2 must be built for (uf2.FAMILIES); config.json "uf2_family"
+UF2_FAMILY = CONFIG.get('uf2_family', uf2.DEFAULT_FAMILY)
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(BUILDS_DIR, exist_ok=True)
 
-# Mapping QMK/VIAL keycodes to ZMK
-KEY_MAP = {
-    "KC_TRNS": "&trans",
-    "KC_NO": "&none",
-    "KC_ENT": "&kp RET",
-    "KC_ENTER": "&kp RET",
-    "KC_BSPACE": "&kp BSPC",
-    "KC_SPC": "&kp SPACE",
-    "KC_SPACE": "&kp SPACE",
-    "KC_MINUS": "&kp MINUS",
-    "KC_EQUAL": "&kp EQUAL",
-    "KC_LBRC": "&kp LBKT",
-    "KC_LBRACKET": "&kp LBKT",
-    "KC_RBRC": "&kp RBKT",
-    "KC_RBRACKET": "&kp RBKT",
-    "KC_BSLASH": "&kp BSLH",
-    "KC_SCOLON": "&kp SEMI",
-    "KC_QUOTE": "&kp SQT",
-    "KC_GRAVE": "&kp GRAVE",
-    "KC_COMMA": "&kp COMMA",
-    "KC_DOT": "&kp DOT",
-    "KC_SLASH": "&kp FSLH",
-    "KC_CAPS": "&kp CAPS",
-    "KC_LCTRL": "&kp LCTRL",
-    "KC_LSHIFT": "&kp LSHIFT",
-    "KC_LALT": "&kp LALT",
-    "KC_LGUI": "&kp LGUI",
-    "KC_RCTRL": "&kp RCTRL",
-    "KC_RSHIFT": "&kp RSHIFT",
-    "KC_RALT": "&kp RALT",
-    "KC_RGUI": "&kp RGUI",
-    "KC_APP": "&kp K_APP",
-    "KC_ESC": "&kp ESC",
-    "KC_GESC": "&kp ESC", 
-    "KC_TAB": "&kp TAB",
-    "KC_UP": "&kp UP",
-    "KC_DOWN": "&kp DOWN",
-    "KC_LEFT": "&kp LEFT",
-    "KC_RIGHT": "&kp RIGHT",
-    "KC_PGUP": "&kp PG_UP",
-    "KC_PGDOWN": "&kp PG_DN",
-    "KC_HOME": "&kp HOME",
-    "KC_END": "&kp END",
-    "KC_INS": "&kp INS",
-    "KC_DEL": "&kp DEL",
-    "KC_DELETE": "&kp DEL",
-    "KC_PSCR": "&kp PSCRN",
-    "KC_SLCK": "&kp SLCK",
-    "KC_PAUSE": "&kp PAUSE",
-    "KC_BTN1": "&mkp LCLK",
-    "KC_BTN2": "&mkp RCLK",
-    "KC_BTN3": "&mkp MCLK",
-    "KC_WH_U": "&msc SCRL_UP",
-    "KC_WH_D": "&msc SCRL_DOWN",
-    "KC_WH_L": "&msc SCRL_LEFT",
-    "KC_WH_R": "&msc SCRL_RIGHT",
-    "KC_MS_U": "&mmv MOVE_UP",
-    "KC_MS_D": "&mmv MOVE_DOWN",
-    "KC_MS_L": "&mmv MOVE_LEFT",
-    "KC_MS_R": "&mmv MOVE_RIGHT",
-    "KC_MPLY": "&kp C_PP",
-    "KC_MUTE": "&kp C_MUTE",
-    "KC_VOLD": "&kp C_VOL_DN",
-    "KC_VOLU": "&kp C_VOL_UP",
-    "KC_MNXT": "&kp C_NEXT",
-    "KC_MPRV": "&kp C_PREV",
-    "KC_MSTP": "&kp C_STOP",
-    "KC_MFFD": "&kp C_FF",
-    "KC_MRWD": "&kp C_RW",
-    "KC_BRIU": "&kp C_BRI_UP",
-    "KC_BRID": "&kp C_BRI_DN",
-    "KC_UNDO": "&kp LC(Z)",
-    "KC_CUT": "&kp LC(X)",
-    "KC_COPY": "&kp LC(C)",
-    "KC_PSTE": "&kp LC(V)",
-    "KC_AGIN": "&kp LC(Y)",
-    "KC_KP_PLUS": "&kp KP_PLUS",
-    "KC_KP_ASTERISK": "&kp KP_MULTIPLY",
-    "KC_KP_MINUS": "&kp KP_MINUS",
-    "KC_KP_SLASH": "&kp KP_SLASH",
-    "KC_KP_EQUAL": "&kp KP_EQUAL",
-    "KC_KP_DOT": "&kp KP_DOT",
-    "KC_KP_ENTER": "&kp KP_ENTER"
-}
-
-def parse_keycode(qc):
-    if isinstance(qc, int):
-        if qc == -1: return ""
-        return f"&kp {qc}"
-
-    if qc in KEY_MAP:
-        return KEY_MAP[qc]
-
-    if qc.startswith("KC_"):
-        suffix = qc[3:]
-        if len(suffix) == 1 and suffix.isalnum(): return f"&kp {suffix}"
-        if re.match(r"F\d+", suffix): return f"&kp {suffix}"
-        if suffix.isdigit(): return f"&kp N{suffix}"
-
-    mod_map = {
-        "LCTL": "LC", "RCTL": "RC", "LSFT": "LS", "RSFT": "RS",
-        "LALT": "LA", "RALT": "RA", "LGUI": "LG", "RGUI": "RG"
-    }
-
-    match = re.match(r"^([A-Z0-9_]+)\((.+)\)$", qc)
-    if match:
-        func = match.group(1)
-        arg = match.group(2)
-
-        if func == "MO": return f"&mo {arg}"
-        if func.startswith("LT"):
-            layer = func.replace("LT", "")
-            if not layer: layer = parse_keycode(arg).replace("&kp ", "") # Handle LT(layer, key) if formatted differently
-            else: # LT1(KC_X)
-                 inner_key = parse_keycode(arg).replace("&kp ", "")
-                 return f"&lt {layer} {inner_key}"
-
-        if func in mod_map:
-            zmk_mod = mod_map[func]
-            inner_key = parse_keycode(arg).replace("&kp ", "")
-            return f"&kp {zmk_mod}({inner_key})"
-
-        if func == "DF": return f"&to {arg}"
-
-    return f"&none /* {qc} */"
-
-def convert_vil_to_keymap(filepath):
-    with open(filepath, "r") as f:
-        data = json.load(f)
-    layers = data.get("layout", [])
-    output = """/*
- * Copyright (c) 2020 The ZMK Contributors
- *
- * SPDX-License-Identifier: MIT
- */
-
-#include <behaviors.dtsi>
-#include <dt-bindings/zmk/keys.h>
-#include <dt-bindings/zmk/bt.h>
-#include <dt-bindings/zmk/outputs.h>
-#include <dt-bindings/zmk/pointing.h>
-
-/ {
-        keymap {
-                compatible = "zmk,keymap";
-"""
-    for i, layer in enumerate(layers):
-        # Flatten and filter -1
-        flat_keys = [k for row in layer for k in row if k != -1]
-        zmk_keys = [parse_keycode(k) for k in flat_keys]
-        
-        # Corne Layout assumed 42 keys: 12, 12, 12, 6 (3+3)
-        # VIL might have more or fewer, we take first 42 if available
-        # But wait, User VIL has 4 rows.
-        # Row 3 in VIL often is 12 length with gaps.
-        # We will trust the flatten order and split into 12, 12, 12, 6
-        
-        row1 = zmk_keys[0:12] if len(zmk_keys) >= 12 else zmk_keys
-        row2 = zmk_keys[12:24] if len(zmk_keys) >= 24 else zmk_keys[12:]
-        row3 = zmk_keys[24:36] if len(zmk_keys) >= 36 else zmk_keys[24:]
-        thumbs = zmk_keys[36:] 
-
-        output += f"                layer_{i} {{\n                        bindings = <\n"
-        output += "   " + " ".join(row1) + "\n"
-        output += "   " + " ".join(row2) + "\n"
-        output += "   " + " ".join(row3) + "\n"
-        output += "                    " + " ".join(thumbs) + "\n"
-        output += "                        >;\n                };\n"
-
-    output += "        };\n};\n"
-    with open(KEYMAP_FILE, "w") as f:
-        f.write(output)
-    
-    return len(layers)
+build_catalog = BuildCatalog(BUILDS_DIR)
+binding_index = BindingIndex(UPLOAD_FOLDER, os.path.dirname(KEYMAP_FILE), BUILDS_DIR)
+SEARCH_MAX_LIMIT = 500
+
+# Conversions and build pushes run here; config.json "job_workers" sizes the pool
+jobs = JobQueue(workers=CONFIG.get('job_workers', 2))
+
+def session_id():
+    if 'sid' not in session:
+        session['sid'] = uuid.uuid4().hex
+        # New session: a good moment to drop workspaces nobody has used in a while
+        prune(SESSIONS_DIR, SESSION_MAX_AGE)
+        prune(SESSION_IMAGES_DIR, SESSION_MAX_AGE)
+    return session['sid']
+
+def session_path(name=''):
+    folder = os.path.join(SESSIONS_DIR, session_id())
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, name)
+
+def session_keymap():
+    return session_path(os.path.basename(KEYMAP_FILE))
+
+def session_images():
+    return os.path.join(SESSION_IMAGES_DIR, session_id())
+
+def session_log():
+    return session_path(BUILD_LOG_FILE)
+
+def publish_keymap(keymap_file):
+    # Atomically make this session's keymap the one config/ builds from
+    with keymap_lock:
+        atomic_copy(keymap_file, KEYMAP_FILE)
+
+def convert_vil_to_keymap(filepath, keymap_file=KEYMAP_FILE):
+    # Same translation and layout as `python3 convert_vil.py`
+    return len(convert_file(filepath, keymap_file))
+
+def convert_job(filepath, keymap_file, images_dir, image_prefix):
+    # Runs on the job queue: convert (or restore from the cache), render, publish
+    # Same bytes, KEY_MAP and converter/renderer code -> reuse the previous keymap and images
+    with open(filepath, 'rb') as f:
+        cache_key = conversion_cache.cache_key(f.read(), KEY_MAP_VERSION, RENDER_MODE)
+    cached = conversion_cache.lookup(cache_key)
+
+    if cached:
+        layer_count = cached['layer_count']
+        try:
+            conversion_cache.restore(cached, keymap_file, images_dir)
+        except OSError: # Evicted by another worker in the meantime
+            cached = None
+    if not cached:
+        layer_count = convert_vil_to_keymap(filepath, keymap_file)
+
+    # Generate Images
+    if cached:
+        layer_images = list(cached['images'])
+    else:
+        if RENDER_MODE == 'png':
+            layer_images = draw_layers(keymap_file, images_dir, parallel=True)
+        else:
+            layer_images = draw_sheet(keymap_file, images_dir, RENDER_MODE, parallel=True)
+        conversion_cache.store(cache_key, keymap_file, images_dir, layer_images, layer_count)
+
+    publish_keymap(keymap_file)
+    binding_index.update(filepath) # New or replaced uploads become searchable right away
+    result = {"source": os.path.basename(filepath), "layer_count": layer_count, "keymap_file": keymap_file,
+              "images": [f"{image_prefix}/{name}" for name in layer_images], "cached": bool(cached),
+              "render_mode": RENDER_MODE}
+    if RENDER_MODE == 'sprite':
+        result['sprite'] = read_sprite_map(images_dir)
+    return result
+
+def list_templates():
+    if os.path.exists(UPLOAD_FOLDER):
+        return sorted([f for f in os.listdir(UPLOAD_FOLDER) if f.endswith('.vil')])
+    return []
+
+def conversion_context(job_id):
+    # Template variables for a conversion job of this session: the report when it
+    # is done, `pending_job` while it is still queued or running
+    job = jobs.get(job_id)
+    if job is None or job['kind'] != 'convert' or job['owner'] != session.get('sid'):
+        flash('Unknown conversion job')
+        return {}
+    if job['state'] == FAILED:
+        flash(f"Error converting file: {job['error']}")
+        return {}
+    if job['state'] != DONE:
+        return {'pending_job': job_id}
+
+    result = job['result']
+    try:
+        with open(result['keymap_file'], 'r') as f:
+            keymap_content = f.read()
+    except OSError as e: # Workspace pruned since
+        flash(f'Error converting file: {str(e)}')
+        return {}
+    filename = result['source']
+    flash(f'Successfully converted {filename}!')
+    # Save last VIL filename for build naming
+    session['last_vil'] = filename.replace('.vil', '')
+
+    conversion_stats = f"Source: {filename}\nLayers Found: {result['layer_count']}\nOutput Target: {KEYMAP_FILE}\nImages Generated: {len(result['images'])}\nCache: {'hit' if result['cached'] else 'miss'}"
+    context = {'conversion_stats': conversion_stats, 'keymap_content': keymap_content}
+    mode = result.get('render_mode', 'png')
+    if mode == 'svg':
+        context['layer_sheet'] = result['images'][0]
+    elif mode == 'sprite':
+        context['layer_sprite'] = sprite_context(result['images'][0], result['sprite'])
+    else:
+        context['layer_images'] = result['images']
+    return context
+
+@app.template_global()
+def preview_url(name):
+    # Previews are redrawn under the same name on every conversion; the mtime in
+    # the query string lets browsers and nginx (deploy/nginx.conf) cache each
+    # version without ever serving an old one after an upload
+    try:
+        version = format(os.stat(os.path.join(IMAGES_DIR, name)).st_mtime_ns, 'x')
+    except OSError:
+        version = None
+    return url_for('static', filename='images/' + name, v=version)
+
+def sprite_context(image, sprite):
+    # CSS percentages that show one layer of the sheet in a box that scales with the page
+    sheet_w, sheet_h = sprite['size']
+    layers = []
+    for layer in sprite['layers']:
+        layers.append({
+            'name': layer['name'],
+            'aspect': f"{layer['w']} / {layer['h']}",
+            'size': f"{sheet_w / layer['w'] * 100:g}% {sheet_h / layer['h'] * 100:g}%",
+            'position': (f"{layer['x'] / (sheet_w - layer['w']) * 100 if sheet_w > layer['w'] else 0:g}% "
+                         f"{layer['y'] / (sheet_h - layer['h']) * 100 if sheet_h > layer['h'] else 0:g}%"),
+        })
+    return {'image': image, 'layers': layers}
 
 @app.route('/')
 def index():
-    templates = []
-    if os.path.exists(UPLOAD_FOLDER):
-        templates = sorted([f for f in os.listdir(UPLOAD_FOLDER) if f.endswith('.vil')])
+    templates = list_templates()
     
     # Get available builds
-    builds = []
-    if os.path.exists(BUILDS_DIR):
-        for build_name in sorted(os.listdir(BUILDS_DIR), reverse=True):  # Newest first
-            build_path = os.path.join(BUILDS_DIR, build_name)
-            if os.path.isdir(build_path):
-                info_file = os.path.join(build_path, 'build_info.json')
-                if os.path.exists(info_file):
-                    try:
-                        with open(info_file) as f:
-                            info = json.load(f)
-                            builds.append({
-                                'name': build_name,
-                                'run_number': info.get('run_number', '?'),
-                                'title': info.get('title', build_name),
-                                'timestamp': info.get('timestamp', '')
-                            })
-                    except:
-                        builds.append({'name': build_name, 'run_number': '?', 'title': build_name, 'timestamp': ''})
-                else:
-                    builds.append({'name': build_name, 'run_number': '?', 'title': build_name, 'timestamp': ''})
+    builds, _ = build_catalog.query()
+
+    # /upload redirects here with ?job=<id>
+    context = conversion_context(request.args['job']) if request.args.get('job') else {}
     
-    return render_template('index.html', templates=templates, builds=builds)
+    return render_template('index.html', templates=templates, builds=builds, **context)
 
 @app.route('/upload', methods=['POST'])
 def convert_layout():
@@ -232,137 +219,292 @@ def convert_layout():
     # Handle file upload first (save to templates folder)
     if uploaded_file and uploaded_file.filename != '':
         filepath = os.path.join(UPLOAD_FOLDER, uploaded_file.filename)
-        uploaded_file.save(filepath)
+        with atomic_write(filepath, 'wb') as f:
+            uploaded_file.save(f)
         flash(f'File "{uploaded_file.filename}" saved to templates!')
     elif selected_file:
         filepath = os.path.join(UPLOAD_FOLDER, selected_file)
     
-    # Re-fetch templates AFTER saving (so new upload appears in list)
-    templates = []
-    if os.path.exists(UPLOAD_FOLDER):
-        templates = sorted([f for f in os.listdir(UPLOAD_FOLDER) if f.endswith('.vil')])
-    
     if not filepath or not os.path.exists(filepath):
         flash('No valid file provided')
-        return render_template('index.html', templates=templates)
+        # Re-fetch templates AFTER saving (so new upload appears in list)
+        return render_template('index.html', templates=list_templates())
 
-    conversion_stats = None
-    keymap_content = None
-    layer_images = []
-
-    try:
-        layer_count = convert_vil_to_keymap(filepath)
-        filename = os.path.basename(filepath)
-        flash(f'Successfully converted {filename}!')
-        
-        # Save last VIL filename for build naming
-        with open('last_vil.txt', 'w') as f:
-            f.write(filename.replace('.vil', ''))
-        
-        # Generate Images
-        layer_images = draw_layers(KEYMAP_FILE, 'static/images')
-        
-        conversion_stats = f"Source: {filename}\nLayers Found: {layer_count}\nOutput Target: {KEYMAP_FILE}\nImages Generated: {len(layer_images)}"
-        
-        if os.path.exists(KEYMAP_FILE):
-             with open(KEYMAP_FILE, 'r') as f:
-                 keymap_content = f.read()
-                 
-    except Exception as e:
-        flash(f'Error converting file: {str(e)}')
-        
-    return render_template('index.html', templates=templates, conversion_stats=conversion_stats, keymap_content=keymap_content, layer_images=layer_images)
+    # Conversion and rendering run in the background; the page shows the
+    # report once the job is done
+    job_id = jobs.submit('convert', convert_job, filepath, session_keymap(), session_images(),
+                         f"sessions/{session_id()}", owner=session_id())
+    if request.accept_mimetypes.best == 'application/json':
+        return {"status": "queued", "job_id": job_id}, 202
+    return redirect(url_for('index', job=job_id))
 
 import time
 
-BUILD_LOG_FILE = 'build_progress.log'
-LAST_VIL_FILE = 'last_vil.txt'  # Track the last converted VIL file
-build_start_time = None
+BUILD_LOG_FILE = 'build_progress.log' # Default log; web builds log into their session's workspace
+
+def record_build(build):
+    if build.build_dir:
+        build_catalog.add(os.path.basename(build.build_dir))
+        binding_index.update_build(build.build_dir)
+
+artifact_store = ArtifactStore()
+build_store = BuildStore() # Shared by every worker, so any of them can answer /build_jobs
+
+# Follows pushed builds on GitHub Actions and downloads their firmware. resume()
+# adopts builds a reloaded or recycled worker was still following.
+build_orchestrator = BuildOrchestrator(log_file=BUILD_LOG_FILE, builds_dir=BUILDS_DIR, latest_dir=FIRMWARE_DIR,
+                                       on_complete=record_build, artifact_store=artifact_store,
+                                       store=build_store)
+build_orchestrator.resume()
+
+# "remote" pushes and waits for GitHub Actions, "local" runs the build.yaml matrix with west here.
+# config.json: "build_backend", "west_workspace", "build_container" (e.g. "zmkfirmware/zmk-build-arm:stable")
+build_backends = {
+    'remote': RemoteBackend(build_orchestrator, BUILD_LOG_FILE),
+    'local': LocalWestBackend(BUILD_LOG_FILE, builds_dir=BUILDS_DIR, latest_dir=FIRMWARE_DIR,
+                              workspace=CONFIG.get('west_workspace', '.west-workspace'),
+                              container=CONFIG.get('build_container'),
+                              artifact_store=artifact_store, on_complete=record_build,
+                              find_artifact=build_catalog.find_artifact, store=build_store),
+}
+DEFAULT_BUILD_BACKEND = CONFIG.get('build_backend', 'remote')
+
+def push_job(backend_name, log_file, keymap_file, vil_name, force):
+    # Runs on the job queue, so a slow `git push` doesn't hold the request
+    try:
+        # Publish, hash and push as one step so another session's conversion
+        # can't slip into this build's commit
+        with keymap_lock:
+            if os.path.exists(keymap_file):
+                atomic_copy(keymap_file, KEYMAP_FILE)
+
+            # Identical config/ + build.yaml -> identical firmware: reuse the earlier
+            # build instead of pushing, unless the caller asks for a rebuild
+            current_inputs = inputs_hash()
+            previous = None if force else build_catalog.find_by_inputs(current_inputs)
+            if previous:
+                artifact_store.link_tree(os.path.join(BUILDS_DIR, previous), FIRMWARE_DIR)
+                with open(log_file, 'a') as f:
+                    f.write(f"Inputs unchanged ({current_inputs[:12]}), reusing build {previous}\n"
+                            f"Also copied to: {FIRMWARE_DIR}/\n"
+                            "--- Build Complete ---\n")
+                return {"message": "Inputs unchanged, reused existing build",
+                        "skipped": True, "build": previous, "inputs_hash": current_inputs}
+
+            commit_msg = f"Build {vil_name} keymap"
+            build = build_backends[backend_name].start(commit_msg, inputs_hash=current_inputs,
+                                                       force=force, log_file=log_file)
+
+        return {"message": "Build triggered successfully", "build_id": build.id, "backend": backend_name}
+
+    except LockBusy:
+        with open(log_file, 'a') as f:
+            f.write("\nAnother build is already running, try again when it finishes.\n--- Build Complete ---\n")
+        raise RuntimeError("Another build is already running") from None
+    except Exception as e:
+        with open(log_file, 'a') as f:
+            f.write(f"\nCRITICAL ERROR: {str(e)}\n")
+        raise
 
 @app.route('/git_push', methods=['POST'])
 def git_push():
-    global build_start_time
-    build_start_time = time.time()
+    data = request.get_json(silent=True) or {}
+    backend_name = data.get('backend') or DEFAULT_BUILD_BACKEND
+    if backend_name not in build_backends:
+        return {"status": "error", "message": f"Unknown build backend: {backend_name}"}, 400
+
+    log_file = session_log()
+    session['build_started'] = time.time()
     
     # Initialize Log
-    with open(BUILD_LOG_FILE, 'w') as f:
+    with open(log_file, 'w') as f:
         f.write("--- Starting Build Process ---\n")
 
-    def log_cmd(args):
-        with open(BUILD_LOG_FILE, 'a') as f:
-            f.write(f"\n> {' '.join(args)}\n")
-        subprocess.run(args, stdout=open(BUILD_LOG_FILE, 'a'), stderr=subprocess.STDOUT, check=False)
-
-    try:
-        # Get last VIL filename for commit message
-        vil_name = "manual"
-        if os.path.exists(LAST_VIL_FILE):
-            with open(LAST_VIL_FILE, 'r') as f:
-                vil_name = f.read().strip() or "manual"
-        
-        commit_msg = f"Build {vil_name} keymap"
-        
-        log_cmd(["git", "add", "."])
-        log_cmd(["git", "commit", "--allow-empty", "-m", commit_msg])
-        # Check if push succeeds
-        with open(BUILD_LOG_FILE, 'a') as f:
-            f.write("\n> git push\n")
-        subprocess.run(["git", "push"], stdout=open(BUILD_LOG_FILE, 'a'), stderr=subprocess.STDOUT, check=True)
-        
-        # Start Watcher (it will append to the same log)
-        subprocess.Popen(["nohup", "./watch_build.sh", "&"], shell=False)
-        
-        return {"status": "success", "message": "Build triggered successfully"}
-        
-    except Exception as e:
-        with open(BUILD_LOG_FILE, 'a') as f:
-            f.write(f"\nCRITICAL ERROR: {str(e)}\n")
-        return {"status": "error", "message": str(e)}, 500
+    # Last VIL converted in this session names the commit
+    vil_name = session.get('last_vil') or "manual"
+    job_id = jobs.submit('build', push_job, backend_name, log_file, session_keymap(), vil_name,
+                         bool(data.get('force')), owner=session_id())
+    return {"status": "queued", "message": "Build queued", "job_id": job_id}, 202
+
+@app.route('/jobs')
+def list_jobs():
+    return {"jobs": jobs.list(owner=session_id())}
+
+def session_job(job_id):
+    # Jobs are only visible to the session that queued them
+    job = jobs.get(job_id)
+    if job is None or job['owner'] != session.get('sid'):
+        return None
+    return job
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = session_job(job_id)
+    if job is None:
+        return {"status": "error", "message": "Unknown job"}, 404
+    return job
+
+JOB_STREAM_INTERVAL = 0.5
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    # Server-Sent Events: one message per state or progress change, the last one when the job finishes
+    if session_job(job_id) is None:
+        return {"status": "error", "message": "Unknown job"}, 404
+
+    def generate():
+        last_seen = None
+        while True:
+            job = jobs.get(job_id)
+            if job is None:
+                return
+            if (job['state'], job['progress']) != last_seen:
+                yield f"data: {json.dumps(job)}\n\n"
+                last_seen = (job['state'], job['progress'])
+            if job['state'] in FINISHED:
+                return
+            time.sleep(JOB_STREAM_INTERVAL)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def read_log_from(offset, log_file=BUILD_LOG_FILE):
+    # -> (text, new_offset, reset). Only the bytes after `offset` are read; if the
+    # log shrank (a new build truncated it) we start over from the beginning.
+    if not os.path.exists(log_file):
+        return "", 0, offset > 0
+
+    reset = False
+    with open(log_file, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if offset > size:
+            offset = 0
+            reset = True
+        f.seek(offset)
+        data = f.read(size - offset)
+
+    # Hold back a trailing, partially written UTF-8 character until the next read
+    for cut in range(min(3, len(data)) + 1):
+        try:
+            text = data[:len(data) - cut].decode('utf-8')
+            return text, offset + len(data) - cut, reset
+        except UnicodeDecodeError:
+            continue
+    return data.decode('utf-8', errors='replace'), offset + len(data), reset
+
+def build_duration(started):
+    if started:
+        return int(time.time() - started)
+    return 0
 
 @app.route('/build_status')
 def build_status():
-    logs = ""
-    duration = 0
-    if os.path.exists(BUILD_LOG_FILE):
-        with open(BUILD_LOG_FILE, 'r') as f:
-            logs = f.read()
-    
-    if build_start_time:
-        duration = int(time.time() - build_start_time)
-        
-    return {"logs": logs, "duration": duration}
+    offset = request.args.get('offset', 0, type=int)
+    logs, offset, reset = read_log_from(max(offset, 0), session_log())
+    return {"logs": logs, "offset": offset, "reset": reset, "duration": build_duration(session.get('build_started'))}
+
+LOG_STREAM_INTERVAL = 0.5
+LOG_STREAM_HEARTBEAT = 2
+
+@app.route('/build_log_stream')
+def build_log_stream():
+    # Server-Sent Events: tail the build log and push new text as it is written
+    start_offset = max(request.args.get('offset', 0, type=int), 0)
+    # The generator runs outside the request context, so read the session now
+    log_file = session_log()
+    started = session.get('build_started')
+
+    def generate(offset):
+        last_sent = 0
+        while True:
+            logs, offset, reset = read_log_from(offset, log_file)
+            now = time.time()
+            # New text goes out right away, otherwise a heartbeat keeps the timer ticking
+            if logs or reset or now - last_sent >= LOG_STREAM_HEARTBEAT:
+                payload = {"logs": logs, "offset": offset, "reset": reset, "duration": build_duration(started)}
+                yield f"data: {json.dumps(payload)}\n\n"
+                last_sent = now
+            time.sleep(LOG_STREAM_INTERVAL)
+
+    return Response(generate(start_offset), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/build_jobs')
+def build_jobs():
+    builds = [b for backend in build_backends.values() for b in backend.list()]
+    builds.sort(key=lambda b: b.created, reverse=True)
+    return {"builds": [b.to_dict() for b in builds]}
+
+@app.route('/build_jobs/<build_id>')
+def build_job(build_id):
+    for backend in build_backends.values():
+        build = backend.get(build_id)
+        if build is not None:
+            return build.to_dict()
+    return {"status": "error", "message": "Unknown build"}, 404
 
 @app.route('/check_mount')
 def check_mount():
-    # Common mount point for Nice!Nano bootloader on macOS
-    mount_point = "/Volumes/NICENANO"
-    if os.path.exists(mount_point):
-        return {"mounted": True, "path": mount_point}
+    if mount_watcher.mounted():
+        return {"mounted": True, "path": mount_watcher.path}
     return {"mounted": False}
 
+MOUNT_STREAM_HEARTBEAT = 15
+
+@app.route('/mount_events')
+def mount_events():
+    # Server-Sent Events: the current drive state, then one message per mount/unmount
+    def generate():
+        mounted, version = mount_watcher.changes()
+        while True:
+            yield f"data: {json.dumps({'mounted': mounted, 'path': mount_watcher.path if mounted else None})}\n\n"
+            previous = version
+            while version == previous:
+                mounted, version = mount_watcher.changes(version, timeout=MOUNT_STREAM_HEARTBEAT)
+                if version == previous:
+                    yield ": heartbeat\n\n" # Notices closed connections, keeps proxies from timing out
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/list_builds')
 def list_builds():
-    builds = []
-    if os.path.exists(BUILDS_DIR):
-        for build_name in sorted(os.listdir(BUILDS_DIR), reverse=True):
-            build_path = os.path.join(BUILDS_DIR, build_name)
-            if os.path.isdir(build_path):
-                info_file = os.path.join(build_path, 'build_info.json')
-                if os.path.exists(info_file):
-                    try:
-                        with open(info_file) as f:
-                            info = json.load(f)
-                            builds.append({
-                                'name': build_name,
-                                'run_number': info.get('run_number', '?'),
-                                'title': info.get('title', build_name),
-                                'timestamp': info.get('timestamp', '')
-                            })
-                    except:
-                        builds.append({'name': build_name, 'run_number': '?', 'title': build_name, 'timestamp': ''})
-                else:
-                    builds.append({'name': build_name, 'run_number': '?', 'title': build_name, 'timestamp': ''})
-    return {"builds": builds}
+    # Optional filters: ?title=&run_number=&since=YYYY-MM-DD&until=YYYY-MM-DD
+    # and pagination: ?page=1&per_page=50 (all builds when per_page is omitted)
+    per_page = request.args.get('per_page', type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
+    builds, total = build_catalog.query(
+        title=request.args.get('title') or None,
+        run_number=request.args.get('run_number', type=int),
+        since=request.args.get('since') or None,
+        until=request.args.get('until') or None,
+        limit=per_page,
+        offset=(page - 1) * per_page if per_page else 0,
+    )
+    return {"builds": builds, "total": total, "page": page, "per_page": per_page}
+
+@app.route('/search_bindings')
+def search_bindings():
+    # Which templates, committed keymaps and builds use a binding or keycode:
+    # ?q=&kp C_MUTE (or &kp, or C_MUTE) with optional &layer=2&kind=template|keymap|build&limit=50
+    query = (request.args.get('q') or '').strip()
+    kind = request.args.get('kind') or None
+    if not query:
+        return {"status": "error", "message": "Missing q"}, 400
+    if kind not in (None, TEMPLATE, KEYMAP, BUILD):
+        return {"status": "error", "message": f"Unknown kind: {kind}"}, 400
+    limit = min(max(request.args.get('limit', SEARCH_LIMIT, type=int), 1), SEARCH_MAX_LIMIT)
+    matches, truncated = binding_index.search(query, layer=request.args.get('layer', type=int), kind=kind, limit=limit)
+    return {"query": query, "matches": matches, "truncated": truncated}
+
+@app.route('/firmware/<build_name>/<path:filename>')
+def download_firmware(build_name, filename):
+    # UF2 download. Behind nginx (deploy/nginx.conf) these URLs are served from
+    # disk and never reach a worker; this route covers the dev server.
+    if build_name.startswith('.') or not filename.endswith('.uf2'):
+        return {"status": "error", "message": "Not found"}, 404
+    folder = FIRMWARE_DIR if build_name == 'firmware_latest' else os.path.join(BUILDS_DIR, build_name)
+    return send_from_directory(folder, filename, as_attachment=True)
 
 @app.route('/flash/<side>', methods=['POST'])
 def flash_firmware(side):
@@ -388,16 +530,22 @@ def flash_firmware(side):
     
     if not os.path.exists(uf2_path):
         return {"status": "error", "message": f"Firmware file not found: {uf2_file}"}, 404
+
+    # Refuse truncated or wrong-chip images before touching the bootloader drive
+    try:
+        uf2.check(uf2_path, UF2_FAMILY)
+    except uf2.UF2Error as e:
+        return {"status": "error", "message": f"Invalid firmware {uf2_file}: {e}"}, 422
         
     # Verify mount
-    mount_point = "/Volumes/NICENANO"
+    mount_point = mount_watcher.path
     if not os.path.exists(mount_point):
         return {"status": "error", "message": "Device not found! Did it disconnect?"}, 404
     
     try:
-        # Copy firmware directly
+        # Chunked, fsync'd copy; the bootloader resets once it has the whole image
         dest_path = os.path.join(mount_point, uf2_file)
-        shutil.copy(uf2_path, dest_path)
+        flash_session.copy_uf2(uf2_path, dest_path)
         return {"status": "success", "message": f"{side.capitalize()} side flashed with {build_name}!"}
     except FileNotFoundError as e:
         # The device unmounts immediately after receiving the UF2 - this is EXPECTED!
@@ -408,12 +556,24 @@ def flash_firmware(side):
     except Exception as e:
         return {"status": "error", "message": f"Flash Error: {str(e)}"}, 500
 
+@app.route('/flash_session', methods=['POST'])
+def start_flash_session():
+    # Unattended: flash each half in turn as its bootloader drive appears.
+    # Progress (side, stage, bytes/total) is on /jobs/<id> and /jobs/<id>/events.
+    data = request.get_json(silent=True) or {}
+    build_name = data.get('build') or FIRMWARE_DIR
+    sides = data.get('sides') or list(flash_session.SIDES)
+    if build_name.startswith('.') or '/' in build_name:
+        return {"status": "error", "message": "Invalid build"}, 400
+    if any(side not in flash_session.SIDES for side in sides):
+        return {"status": "error", "message": "Invalid side"}, 400
+    if not os.path.exists(flash_session.firmware_dir(build_name)):
+        return {"status": "error", "message": f"Build folder not found: {build_name}"}, 404
+
+    job_id = jobs.submit('flash', flash_session.run_session, build_name, sides, watcher=mount_watcher,
+                         family=UF2_FAMILY, report=jobs.report, owner=session_id())
+    return {"status": "queued", "message": "Flashing session started", "job_id": job_id}, 202
+
 if __name__ == '__main__':
-    try:
-        with open('config.json', 'r') as f:
-            config = json.load(f)
-            port = config.get('port', 5000)
-    except FileNotFoundError:
-        port = 5000
-        
+    port = CONFIG.get('port', 5000)
     app.run(debug=True, port=port)
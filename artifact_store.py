@@ -0,0 +1,186 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from atomic_io import atomic_write, replace_dir
+
+# Content-addressed store for firmware files. Every UF2 is kept once under
+# STORE_DIR/<sha256[:2]>/<sha256>.uf2 and build folders (and firmware_latest)
+# hold hardlinks to those blobs, so identical halves across builds cost no
+# extra disk. Each folder also gets an artifacts.json manifest
+# ({relative path: sha256}); gc() drops blobs that no folder references.
+STORE_DIR = '.artifacts'
+MANIFEST_FILE = 'artifacts.json'
+ARTIFACT_EXTENSIONS = ('.uf2',)
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _replace_with_link(blob, path):
+    # Atomically swap `path` for a hardlink to `blob`; keep the plain copy if
+    # hardlinks aren't possible (e.g. store on another filesystem)
+    tmp = path + '.link'
+    try:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        os.link(blob, tmp)
+    except OSError:
+        return False
+    os.replace(tmp, path)
+    return True
+
+class ArtifactStore:
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest + '.uf2')
+
+    def ingest(self, path):
+        # -> sha256 of `path`, which now points at the stored blob
+        digest = file_hash(path)
+        blob = self.blob_path(digest)
+        if os.path.exists(blob):
+            if not os.path.samefile(blob, path):
+                _replace_with_link(blob, path)
+            return digest
+
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            os.link(path, blob)
+        except OSError:
+            shutil.copy2(path, blob)
+        return digest
+
+    def ingest_tree(self, folder):
+        # Dedupe every artifact below `folder` and write its manifest
+        manifest = {}
+        for root, _, files in os.walk(folder):
+            for name in sorted(files):
+                if name.endswith(ARTIFACT_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    manifest[os.path.relpath(path, folder)] = self.ingest(path)
+        write_manifest(folder, manifest)
+        return manifest
+
+    def materialize(self, manifest, folder):
+        # Build `folder` from blobs only (hardlinks, or copies as a fallback)
+        os.makedirs(folder, exist_ok=True)
+        for rel_path, digest in manifest.items():
+            dest = os.path.join(folder, rel_path)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            blob = self.blob_path(digest)
+            if os.path.exists(dest):
+                os.remove(dest)
+            try:
+                os.link(blob, dest)
+            except OSError:
+                shutil.copy2(blob, dest)
+        write_manifest(folder, manifest)
+
+    def link_tree(self, src_folder, dest_folder):
+        # Replace dest_folder with a hardlinked mirror of src_folder's artifacts
+        # plus its other small files (e.g. build_info.json); replaces `rm -rf && cp -r`
+        manifest = read_manifest(src_folder)
+        if manifest is None:
+            manifest = self.ingest_tree(src_folder)
+
+        dest_folder = dest_folder.rstrip('/')
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(dest_folder)),
+                               prefix=f".{os.path.basename(dest_folder)}.", suffix='.tmp')
+        self.materialize(manifest, tmp)
+        for root, _, files in os.walk(src_folder):
+            for name in files:
+                rel_path = os.path.relpath(os.path.join(root, name), src_folder)
+                if rel_path in manifest or rel_path == MANIFEST_FILE:
+                    continue
+                os.makedirs(os.path.join(tmp, os.path.dirname(rel_path)), exist_ok=True)
+                shutil.copy2(os.path.join(root, name), os.path.join(tmp, rel_path))
+
+        replace_dir(tmp, dest_folder)
+
+    def referenced(self, folders):
+        digests = set()
+        for folder in folders:
+            manifest = read_manifest(folder)
+            if manifest:
+                digests.update(manifest.values())
+        return digests
+
+    def gc(self, folders, dry_run=False):
+        # -> (removed blob count, bytes freed). A blob survives if any manifest
+        # lists it or something outside the store still hardlinks to it.
+        keep = self.referenced(folders)
+        removed = 0
+        freed = 0
+        if not os.path.isdir(self.root):
+            return removed, freed
+
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                digest = name.split('.')[0]
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                if digest in keep or st.st_nlink > 1:
+                    continue
+                removed += 1
+                freed += st.st_size
+                if not dry_run:
+                    os.remove(path)
+        return removed, freed
+
+def read_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_manifest(folder, manifest):
+    with atomic_write(os.path.join(folder, MANIFEST_FILE)) as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+def build_folders(builds_dir='builds', latest_dir='firmware_latest'):
+    folders = []
+    if os.path.isdir(builds_dir):
+        folders += [os.path.join(builds_dir, n) for n in sorted(os.listdir(builds_dir))
+                    if os.path.isdir(os.path.join(builds_dir, n))]
+    if os.path.isdir(latest_dir):
+        folders.append(latest_dir)
+    return folders
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicated firmware artifact store")
+    parser.add_argument('command', choices=['dedupe', 'gc'],
+                        help="dedupe: hardlink all build artifacts into the store; gc: drop unreferenced blobs")
+    parser.add_argument('--builds-dir', default='builds')
+    parser.add_argument('--latest-dir', default='firmware_latest')
+    parser.add_argument('--store', default=STORE_DIR)
+    parser.add_argument('--dry-run', action='store_true', help="gc only: report without deleting")
+    args = parser.parse_args()
+
+    store = ArtifactStore(args.store)
+    folders = build_folders(args.builds_dir, args.latest_dir)
+
+    if args.command == 'dedupe':
+        files = 0
+        blobs = set()
+        for folder in folders:
+            manifest = store.ingest_tree(folder)
+            files += len(manifest)
+            blobs.update(manifest.values())
+        print(f"{files} artifacts in {len(folders)} folders -> {len(blobs)} unique blobs in {args.store}")
+    else:
+        removed, freed = store.gc(folders, dry_run=args.dry_run)
+        verb = "Would remove" if args.dry_run else "Removed"
+        print(f"{verb} {removed} unreferenced blobs ({freed / 1024:.0f} KB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import contextlib
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Helpers for files that several requests, worker processes or build threads
+# touch at once: write-then-rename so readers only ever see complete files,
+# and flock-based locks that work across processes as well as threads.
+LOCK_DIR = '.cache/locks'
+
+@contextlib.contextmanager
+def atomic_write(path, mode='w', **kwargs):
+    # Write to a unique temp file next to `path`, then rename it over `path`
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        # mkstemp creates 0600; keep the replaced file's mode, or a plain 0644
+        try:
+            os.fchmod(fd, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            os.fchmod(fd, 0o644)
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+        raise
+
+def atomic_copy(src, dest):
+    with atomic_write(dest, 'wb') as out, open(src, 'rb') as f:
+        shutil.copyfileobj(f, out)
+    shutil.copystat(src, dest)
+
+def replace_dir(tmp_dir, dest_dir):
+    # Swap a fully built directory into place. Two renames instead of
+    # rmtree + rename, so dest_dir is missing only between them.
+    old = None
+    if os.path.exists(dest_dir):
+        old = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(dest_dir)),
+                               prefix=f".{os.path.basename(dest_dir)}.", suffix='.old')
+        os.rename(dest_dir, os.path.join(old, 'dir'))
+    os.rename(tmp_dir, dest_dir)
+    if old:
+        shutil.rmtree(old, ignore_errors=True)
+
+class LockBusy(Exception):
+    pass
+
+class FileLock:
+    # Exclusive lock on LOCK_DIR/<name>.lock. Every acquisition opens its own
+    # descriptor, so it serializes threads of one process as well as separate
+    # worker processes. Usable as `with lock:` or acquire()/release() when the
+    # lock is handed to another thread.
+    def __init__(self, name, lock_dir=LOCK_DIR):
+        os.makedirs(lock_dir, exist_ok=True)
+        self.path = os.path.join(lock_dir, f"{name}.lock")
+        self._local = threading.local()
+
+    def acquire(self, blocking=True, timeout=None):
+        # -> a handle for release(); raises LockBusy when not blocking (or timed out)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (fcntl.LOCK_NB if not blocking or deadline else 0))
+                return fd
+            except BlockingIOError:
+                if not blocking or time.time() >= deadline:
+                    os.close(fd)
+                    raise LockBusy(self.path)
+                time.sleep(0.05)
+
+    def release(self, handle):
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        os.close(handle)
+
+    def __enter__(self):
+        self._local.handle = self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release(self._local.handle)
+
+def prune(root, max_age):
+    # Remove entries under `root` not modified for `max_age` seconds
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if os.stat(path).st_mtime < cutoff:
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,155 @@
+import argparse
+import tempfile
+import time
+from PIL import Image, ImageDraw
+import draw_keymap
+
+# Per-layer draw time of the precomputed-geometry renderer versus the old
+# approach (font load, blank canvas, get_key_coords and unmemoized label
+# cleanup for every layer), then the per-key cost of the label pipeline and
+# key drawing, cached versus not.
+#   python3 bench_draw_keymap.py [--keymap config/corne.keymap] [--repeat 20]
+
+def legacy_draw_layer_image(layer_name, keys):
+    font = draw_keymap.load_font()
+    img = Image.new('RGB', (900, 350), color=(30, 30, 30))
+    d = ImageDraw.Draw(img)
+
+    for i, key in enumerate(keys):
+        if i >= 42: break
+
+        x, y = draw_keymap.get_key_coords(i)
+        label, key_color, text_color = draw_keymap.key_style(legacy_clean_label(key))
+        d.rectangle([x, y, x + draw_keymap.KEY_W, y + draw_keymap.KEY_H], fill=key_color, outline=(100, 100, 100))
+
+        bbox = d.textbbox((0,0), label, font=font)
+        text_w = bbox[2] - bbox[0]
+        text_h = bbox[3] - bbox[1]
+        d.text((x + (draw_keymap.KEY_W - text_w)/2, y + (draw_keymap.KEY_H - text_h)/2), label, fill=text_color, font=font)
+
+    d.text((10, 10), layer_name.upper().replace('_', ' '), fill=(255, 255, 255), font=font)
+    return img
+
+def legacy_clean_label(keycode):
+    # The label path as it was before memoization and the one-pass regex: the
+    # replacement list is rebuilt and applied one str.replace at a time, per key
+    k = keycode.strip()
+
+    replacements = [
+        ("&kp ", ""),
+        ("&trans", ""),
+        ("&none", ""),
+        ("LSHIFT", "Shift"), ("RSHIFT", "Shift"),
+        ("LCTRL", "Ctrl"), ("RCTRL", "Ctrl"),
+        ("LALT", "Alt"), ("RALT", "Alt"),
+        ("LGUI", "Gui"), ("RGUI", "Gui"),
+        ("BSPC", "Bksp"), ("SPACE", "Spc"), ("RET", "Ent"), ("ESC", "Esc"),
+        ("TAB", "Tab"), ("SQT", "'"), ("SEMI", ";"), ("COMMA", ","), ("DOT", "."),
+        ("FSLH", "/"), ("BSLH", "\\"), ("LBKT", "["), ("RBKT", "]"),
+        ("MINUS", "-"), ("EQUAL", "="), ("GRAVE", "`"), ("TILDE", "~"),
+        ("PG_UP", "PgUp"), ("PG_DN", "PgDn"), ("PSCRN", "PrtSc"),
+        ("C_VOL_UP", "Vol+"), ("C_VOL_DN", "Vol-"), ("C_MUTE", "Mute"),
+        ("C_PP", "Play"), ("C_NEXT", "Next"), ("C_PREV", "Prev"),
+        ("&mkp LCLK", "Click L"), ("&mkp RCLK", "Click R"), ("&mkp MCLK", "Click M"),
+        ("&msc SCRL_UP", "Scrl ^"), ("&msc SCRL_DOWN", "Scrl v"),
+        ("&mmv MOVE_UP", "Ms ^"), ("&mmv MOVE_DOWN", "Ms v"),
+        ("&mmv MOVE_LEFT", "Ms <"), ("&mmv MOVE_RIGHT", "Ms >"),
+        ("LC(", "C-"), ("LS(", "S-"), ("LA(", "A-"), ("LG(", "G-"), (")", "")
+    ]
+
+    if k.startswith("&lt "):
+        parts = k.split()
+        if len(parts) >= 3:
+            layer = parts[1]
+            key = parts[2].replace("&kp", "").strip()
+            for old, new in replacements: key = key.replace(old, new)
+            return f"L{layer}\n{key}"
+
+    if k.startswith("&mo "):
+        return f"L{k.split()[1]}"
+
+    if k.startswith("&to "):
+        return f"TO {k.split()[1]}"
+
+    for old, new in replacements:
+        k = k.replace(old, new)
+
+    return k.strip()
+
+def legacy_draw_key(d, x, y, label, key_color, text_color, font):
+    d.rectangle([x + 1, y + 1, x + draw_keymap.KEY_W - 1, y + draw_keymap.KEY_H - 1], fill=key_color)
+    bbox = d.textbbox((0,0), label, font=font)
+    d.text((x + (draw_keymap.KEY_W - (bbox[2] - bbox[0]))/2, y + (draw_keymap.KEY_H - (bbox[3] - bbox[1]))/2),
+           label, fill=text_color, font=font)
+
+def tile_draw_key(img, x, y, label, key_color, text_color, font):
+    tile, dx, dy = draw_keymap.label_tile(label, font, key_color, text_color, False)
+    img.paste(tile, (x + dx, y + dy), tile)
+
+def time_per_key(fn, keys, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for key in keys:
+            fn(key)
+    return (time.perf_counter() - start) / (repeat * len(keys))
+
+def per_key_costs(layers, layout, repeat):
+    # Label pipeline and key drawing on their own, per key, in microseconds
+    keys = [key for _, layer_keys in layers for key in layer_keys]
+    font = draw_keymap._font
+    img = draw_keymap.base_image(layout).copy()
+    d = ImageDraw.Draw(img)
+    styled = [draw_keymap.key_style(draw_keymap.clean_label(key)) for key in keys]
+
+    label_before = time_per_key(legacy_clean_label, keys, repeat)
+    label_after = time_per_key(draw_keymap.clean_label, keys, repeat)
+    draw_before = time_per_key(lambda s: legacy_draw_key(d, 10, 10, *s, font), styled, repeat)
+    draw_after = time_per_key(lambda s: tile_draw_key(img, 10, 10, *s, font), styled, repeat)
+
+    print(f"Per key ({len(keys)} keys, {len(set(keys))} distinct):")
+    print(f"  clean_label  sequential replace: {label_before * 1e6:7.2f} us   one-pass + memoized: {label_after * 1e6:7.2f} us")
+    print(f"  draw key     rect + bbox + text: {draw_before * 1e6:7.2f} us   cached tile paste:   {draw_after * 1e6:7.2f} us")
+    info = draw_keymap.label_tile.cache_info()
+    print(f"  label tiles cached: {info.currsize} (max {info.maxsize})")
+
+def time_per_layer(draw, layers, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for layer_name, keys in layers:
+            draw(layer_name, keys)
+    return (time.perf_counter() - start) / (repeat * len(layers))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-layer keymap drawing")
+    parser.add_argument('--keymap', default='config/corne.keymap')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with open(args.keymap) as f:
+        layers = draw_keymap.parse_layers(f.read())
+    if not layers:
+        print(f"No layers found in {args.keymap}")
+        return
+
+    layout = draw_keymap.detect_layout(args.keymap, layers)
+    # Warm up fonts and the base canvas so both sides measure steady state
+    draw_keymap.draw_layer_image(*layers[0], layout)
+
+    before = time_per_layer(legacy_draw_layer_image, layers, args.repeat)
+    after = time_per_layer(lambda n, k: draw_keymap.draw_layer_image(n, k, layout), layers, args.repeat)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        for layer_name, keys in layers:
+            draw_keymap.render_layer(layer_name, keys, tmp, layout)
+        with_save = (time.perf_counter() - start) / len(layers)
+
+    print(f"Keymap: {args.keymap} ({len(layers)} layers, layout {layout})")
+    print(f"Before (blank canvas + per-key geometry + labels): {before * 1000:.2f} ms/layer")
+    print(f"After  (base image + geometry table + label cache): {after * 1000:.2f} ms/layer")
+    print(f"Speedup: {before / after:.2f}x")
+    print(f"After incl. PNG encode: {with_save * 1000:.2f} ms/layer")
+    per_key_costs(layers, layout, args.repeat)
+
+if __name__ == "__main__":
+    main()
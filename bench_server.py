@@ -0,0 +1,170 @@
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+# Load test: N client threads with keep-alive connections hammer one endpoint
+# at a time and report throughput and latency percentiles. By default the
+# server is gunicorn (gunicorn.conf.py) started on a throwaway copy of this
+# tree, because /upload publishes to config/ and fills the caches; --url
+# points it at a server that is already running, read-only endpoints only.
+#   python3 bench_server.py [--duration 10] [--concurrency 16] [--workers 4]
+#   python3 bench_server.py --url http://127.0.0.1:6040 --endpoints index list_builds
+
+ENDPOINTS = {
+    'index': ('GET', '/', None),
+    'list_builds': ('GET', '/list_builds', None),
+    # Converts a bundled template; each request is timed until its job is done
+    'upload': ('POST', '/upload', 'existing_file'),
+}
+WRITES = {'upload'}
+
+# Left out of the server copy: history, caches and build output
+COPY_IGNORE = shutil.ignore_patterns('.git', '.cache', '.artifacts', '.west-workspace', 'builds',
+                                     'firmware_latest', 'sessions', '__pycache__', '*.log')
+JOB_POLL_INTERVAL = 0.05
+
+class Client:
+    # One keep-alive connection plus the Flask session cookie, like a browser tab
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        self.cookie = None
+
+    def request(self, method, path, form=None):
+        # -> (status, parsed JSON body or None)
+        headers = {'Accept': 'application/json'}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        if response.getheader('Content-Type', '').startswith('application/json'):
+            return response.status, json.loads(data)
+        return response.status, None
+
+    def wait_job(self, job_id):
+        # -> final job state, polled through /jobs/<id> with this client's session
+        while True:
+            status, job = self.request('GET', f'/jobs/{job_id}')
+            if status != 200:
+                return None
+            if job['state'] in ('done', 'failed'):
+                return job['state']
+            time.sleep(JOB_POLL_INTERVAL)
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0
+
+def run_endpoint(url, name, duration, concurrency, template):
+    method, path, field = ENDPOINTS[name]
+    form = {field: template} if field else None
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        client = Client(url)
+        local = []
+        failed = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status, body = client.request(method, path, form)
+                if body and body.get('job_id'):
+                    # Queued work counts until the job finishes, not just the enqueue
+                    status = 200 if client.wait_job(body['job_id']) == 'done' else None
+            except (OSError, http.client.HTTPException, ValueError):
+                status = None
+                client = Client(url)
+            local.append(time.perf_counter() - start)
+            if status is None or status >= 400:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:12s} {len(latencies):7d} req  {len(latencies) / elapsed:8.1f} req/s  "
+          f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  p95 {percentile(latencies, 95) * 1000:7.1f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:7.1f} ms  errors {errors[0]}")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(workers):
+    # -> (process, url, copy dir) of gunicorn serving a copy of this tree
+    root = os.path.dirname(os.path.abspath(__file__))
+    copy = os.path.join(tempfile.mkdtemp(prefix='bench_server_'), 'app')
+    shutil.copytree(root, copy, ignore=COPY_IGNORE)
+    url = f"http://127.0.0.1:{free_port()}"
+    env = dict(os.environ, BIND=urlsplit(url).netloc, WEB_WORKERS=str(workers))
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'], cwd=copy, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if Client(url).request('GET', '/')[0] == 200:
+                return proc, url, copy
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    shutil.rmtree(os.path.dirname(copy), ignore_errors=True)
+    sys.exit("gunicorn didn't come up within 30s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of /, /list_builds and /upload")
+    parser.add_argument('--url', help="Already running server to test (read-only endpoints only)")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn workers when the bench starts the server")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per endpoint")
+    parser.add_argument('--concurrency', type=int, default=16, help="Client threads")
+    parser.add_argument('--template', default='three_layers.vil', help="vail_templates/ file /upload converts")
+    parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS))
+    args = parser.parse_args()
+
+    endpoints = args.endpoints or [e for e in ENDPOINTS if not (args.url and e in WRITES)]
+    if args.url and WRITES & set(endpoints):
+        parser.error("upload changes config/ and the caches of the server it hits; run it without --url")
+
+    proc = copy = None
+    url = args.url
+    if url is None:
+        proc, url, copy = start_server(args.workers)
+    try:
+        print(f"{url}: {args.concurrency} clients, {args.duration:.0f}s per endpoint")
+        for name in endpoints:
+            run_endpoint(url, name, args.duration, args.concurrency, args.template)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+            shutil.rmtree(os.path.dirname(copy), ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
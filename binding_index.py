@@ -0,0 +1,312 @@
+import argparse
+import contextlib
+import functools
+import glob
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+
+import keymap_dt
+from build_orchestrator import KEYMAPS_DIR
+from convert_vil import translate_file
+
+# Inverted index from bindings and keycodes to (source, layer, key position)
+# across the .vil templates, the committed config/*.keymap files and the keymap
+# copies in builds/<name>/config/. Answers "which template or build put
+# &kp C_MUTE on layer 2?" without opening every file:
+#   python3 binding_index.py "&kp C_MUTE" --layer 2
+# A search term is a whole binding ("&kp C_MUTE"), a behavior ("&kp") or a
+# keycode anywhere in the parameters ("C_MUTE", also inside "LC(C_MUTE)").
+# Sources are re-read only when their mtime/size changed, and the source
+# directories are only rescanned when one of their mtimes changed (atomic
+# writes and new build folders both change it); uploads and finished builds
+# are indexed right away through update() / update_build().
+INDEX_DB = '.cache/binding_index.sqlite3'
+SCHEMA_VERSION = 1 # Bump when the tables or the term rules change; the index is rebuilt from disk
+DEFAULT_LIMIT = 50
+
+TEMPLATE, KEYMAP, BUILD = 'template', 'keymap', 'build'
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    mtime INTEGER,
+    size INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS layers (
+    source INTEGER NOT NULL,
+    layer INTEGER NOT NULL,
+    name TEXT,
+    PRIMARY KEY (source, layer)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS keys (
+    source INTEGER NOT NULL,
+    layer INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    binding TEXT NOT NULL,
+    PRIMARY KEY (source, layer, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT NOT NULL COLLATE NOCASE,
+    layer INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    source INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (term, layer, kind, source, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS terms_source ON terms(source);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+_KEYCODE_RE = re.compile(r'[A-Za-z_]\w*')
+
+def binding_terms(binding):
+    # Binding -> the terms it is found by
+    terms = {str(binding), '&' + binding.behavior}
+    for param in binding.params:
+        terms.add(param)
+        terms.update(_KEYCODE_RE.findall(param))
+    return terms
+
+def normalize_query(query):
+    # "&kp   c_mute" -> "&kp c_mute" (terms compare case-insensitively)
+    query = ' '.join(query.split())
+    if query.startswith('&'):
+        bindings = keymap_dt.parse_bindings(query)
+        if len(bindings) == 1:
+            return str(bindings[0])
+    return query
+
+@functools.lru_cache(maxsize=4096)
+def key_binding(key):
+    # Translated key text -> Binding, or None if it isn't exactly one binding.
+    # The same few hundred keys make up nearly every template.
+    parsed = keymap_dt.parse_bindings(key)
+    return parsed[0] if len(parsed) == 1 else None
+
+def template_layers(path):
+    # .vil -> [(layer name, [Binding])], translated exactly like a conversion
+    _, layers = translate_file(path)
+    # Named like the converter names them; a key that isn't one binding leaves its position empty
+    return [(f"layer_{i}", [key_binding(key) for key in keys]) for i, keys in enumerate(layers)]
+
+def keymap_layers(path):
+    # .keymap -> [(layer name, [Binding])]
+    return [(layer.name, layer.bindings) for layer in keymap_dt.load(path).layers()]
+
+class BindingIndex:
+    def __init__(self, templates_dir='vail_templates', config_dir='config', builds_dir='builds', db_path=INDEX_DB):
+        self.templates_dir = templates_dir
+        self.config_dir = config_dir
+        self.builds_dir = builds_dir
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._seen = None # Directory mtimes this process last found the index up to date for
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with self._connect() as db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                # Only derived from files on disk: drop it and rescan
+                db.executescript("DROP TABLE IF EXISTS sources; DROP TABLE IF EXISTS layers; DROP TABLE IF EXISTS keys; "
+                                 "DROP TABLE IF EXISTS terms; DROP TABLE IF EXISTS meta;")
+                db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            db.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One short-lived connection per call, committed on success and always closed
+        db = sqlite3.connect(self.db_path, timeout=10)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _dirs_mtime(self):
+        # A build folder's keymaps are written once, after the folder appears;
+        # the build pipeline calls update_build() for those
+        stamps = []
+        for path in (self.templates_dir, self.config_dir, self.builds_dir):
+            try:
+                stamps.append(f"{path}:{os.stat(path).st_mtime_ns}")
+            except FileNotFoundError:
+                pass
+        return '|'.join(stamps)
+
+    def _sources(self):
+        # -> {path: kind} of everything that should be indexed
+        sources = {}
+        for path in glob.glob(os.path.join(self.templates_dir, '*.vil')):
+            sources[path] = TEMPLATE
+        for path in glob.glob(os.path.join(self.config_dir, '*.keymap')):
+            sources[path] = KEYMAP
+        for path in glob.glob(os.path.join(self.builds_dir, '*', KEYMAPS_DIR, '*.keymap')):
+            sources[path] = BUILD
+        return sources
+
+    def _kind(self, path):
+        parent = os.path.dirname(path)
+        if path.endswith('.vil'):
+            return TEMPLATE
+        if os.path.basename(parent) == KEYMAPS_DIR and os.path.dirname(os.path.dirname(parent)) == self.builds_dir:
+            return BUILD
+        return KEYMAP
+
+    def refresh(self, force=False):
+        # Bring the index up to date with the files on disk -> True if it rescanned.
+        # Cheap when nothing changed: a stat of the watched directories.
+        dirs_mtime = self._dirs_mtime()
+        if not force and dirs_mtime == self._seen:
+            return False
+        with self._lock, self._connect() as db:
+            db.execute("BEGIN IMMEDIATE") # Check and rewrite as one step: other processes index too
+            stored = db.execute("SELECT value FROM meta WHERE key = 'dirs_mtime'").fetchone()
+            if not force and stored and stored['value'] == dirs_mtime:
+                self._seen = dirs_mtime
+                return False
+
+            known = {r['path']: (r['mtime'], r['size']) for r in db.execute("SELECT path, mtime, size FROM sources")}
+            present = self._sources()
+            for path, kind in present.items():
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if force or known.get(path) != (st.st_mtime_ns, st.st_size):
+                    self._index(db, path, kind, st)
+            for path in known.keys() - present.keys():
+                self._remove(db, path)
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dirs_mtime', ?)", (dirs_mtime,))
+        self._seen = dirs_mtime
+        return True
+
+    def update(self, path):
+        # Index one file right away if it is new or changed, e.g. an uploaded
+        # template or a finished build's keymap
+        with self._lock, self._connect() as db:
+            # Take the write lock before looking: two workers updating the same
+            # file would otherwise both replace the row they saw
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                self._remove(db, path)
+                return
+            row = db.execute("SELECT mtime, size FROM sources WHERE path = ?", (path,)).fetchone()
+            if not row or (row['mtime'], row['size']) != (st.st_mtime_ns, st.st_size):
+                self._index(db, path, self._kind(path), st)
+
+    def update_build(self, build_dir):
+        for path in glob.glob(os.path.join(build_dir, KEYMAPS_DIR, '*.keymap')):
+            self.update(path)
+
+    def _remove(self, db, path):
+        row = db.execute("SELECT id FROM sources WHERE path = ?", (path,)).fetchone()
+        if row:
+            for table in ('terms', 'keys', 'layers'):
+                db.execute(f"DELETE FROM {table} WHERE source = ?", (row['id'],))
+            db.execute("DELETE FROM sources WHERE id = ?", (row['id'],))
+
+    def _index(self, db, path, kind, st):
+        # Replaces everything known about `path`; a file that can't be read is recorded, not hidden
+        try:
+            layers = template_layers(path) if kind == TEMPLATE else keymap_layers(path)
+            error = None
+        except Exception as e:
+            logger.warning("Can't index %s: %s", path, e)
+            layers, error = [], f"{type(e).__name__}: {e}"
+
+        self._remove(db, path)
+        source = db.execute("INSERT INTO sources (path, kind, mtime, size, error) VALUES (?, ?, ?, ?, ?)",
+                            (path, kind, st.st_mtime_ns, st.st_size, error)).lastrowid
+        keys, terms = [], []
+        for layer, (_, bindings) in enumerate(layers):
+            for position, binding in enumerate(bindings):
+                if binding is None:
+                    continue
+                keys.append((source, layer, position, str(binding)))
+                terms.extend((term, layer, kind, source, position) for term in binding_terms(binding))
+        db.executemany("INSERT INTO layers (source, layer, name) VALUES (?, ?, ?)",
+                       [(source, i, name) for i, (name, _) in enumerate(layers)])
+        db.executemany("INSERT INTO keys (source, layer, position, binding) VALUES (?, ?, ?, ?)", keys)
+        db.executemany("INSERT OR IGNORE INTO terms (term, layer, kind, source, position) VALUES (?, ?, ?, ?, ?)", terms)
+
+    def search(self, query, layer=None, kind=None, limit=DEFAULT_LIMIT, refresh=True):
+        # -> (matches, truncated). Each match: source, kind, layer, layer_name,
+        # position (index into the layer's bindings) and the binding itself.
+        # Ordered like the terms primary key (by layer; builds, then keymaps,
+        # then templates; each in indexing order) so LIMIT stops the scan early.
+        if refresh:
+            self.refresh()
+        sql = """SELECT s.path, t.kind, t.layer, l.name AS layer_name, t.position, k.binding
+                 FROM terms t
+                 JOIN sources s ON s.id = t.source
+                 JOIN keys k ON k.source = t.source AND k.layer = t.layer AND k.position = t.position
+                 LEFT JOIN layers l ON l.source = t.source AND l.layer = t.layer
+                 WHERE t.term = ?"""
+        params = [normalize_query(query)]
+        if layer is not None:
+            sql += " AND t.layer = ?"
+            params.append(layer)
+        if kind:
+            sql += " AND t.kind = ?"
+            params.append(kind)
+        sql += " ORDER BY t.layer, t.kind, t.source, t.position LIMIT ?"
+        params.append(limit + 1)
+        with self._connect() as db:
+            rows = db.execute(sql, params).fetchall()
+        matches = [{'source': r['path'], 'kind': r['kind'], 'layer': r['layer'], 'layer_name': r['layer_name'],
+                    'position': r['position'], 'binding': r['binding']} for r in rows[:limit]]
+        return matches, len(rows) > limit
+
+    def stats(self):
+        with self._connect() as db:
+            return {
+                'sources': db.execute("SELECT COUNT(*) FROM sources").fetchone()[0],
+                'keys': db.execute("SELECT COUNT(*) FROM keys").fetchone()[0],
+                'terms': db.execute("SELECT COUNT(*) FROM terms").fetchone()[0],
+                'errors': [dict(r) for r in db.execute("SELECT path, error FROM sources WHERE error IS NOT NULL")],
+            }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find which templates, keymaps and builds use a binding or keycode")
+    parser.add_argument('query', nargs='?', help='e.g. "&kp C_MUTE", "&mo", "C_MUTE"')
+    parser.add_argument('--layer', type=int, help="Only this layer (0-based)")
+    parser.add_argument('--kind', choices=(TEMPLATE, KEYMAP, BUILD))
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+    parser.add_argument('--rebuild', action='store_true', help="Re-read every source")
+    parser.add_argument('--db', default=INDEX_DB)
+    args = parser.parse_args(argv)
+    if not args.query and not args.rebuild:
+        parser.error("a query (or --rebuild) is required")
+
+    index = BindingIndex(db_path=args.db)
+    if args.rebuild:
+        index.refresh(force=True)
+        stats = index.stats()
+        print(f"Indexed {stats['sources']} sources, {stats['keys']} keys, {stats['terms']} terms")
+        for error in stats['errors']:
+            print(f"  {error['path']}: {error['error']}")
+    if not args.query:
+        return 0
+
+    matches, truncated = index.search(args.query, layer=args.layer, kind=args.kind, limit=args.limit)
+    for m in matches:
+        print(f"{m['source']}  layer {m['layer']} ({m['layer_name']})  key {m['position']}  {m['binding']}")
+    if truncated:
+        print(f"... more than {args.limit} matches, narrow with --layer/--kind or raise --limit")
+    elif not matches:
+        print(f"No matches for {normalize_query(args.query)!r}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from build_orchestrator import Build, RUNNING, SUCCESS, FAILED, build_folder_name, snapshot_keymaps, save_keymaps
+from build_inputs import matrix_hashes, keymap_files
+from atomic_io import FileLock, atomic_write
+
+try:
+    import yaml
+except ImportError: # Only the local backend needs it
+    yaml = None
+
+# Pluggable ways to turn the current config/ into firmware. Every backend has
+# start(title, inputs_hash=None, force=False, log_file=None) -> Build, get(build_id)
+# and list(); builds report into the given log file (or the backend's default)
+# and share the builds/ folder, artifact store and catalog.
+
+class RemoteBackend:
+    # Commit + push, then let GitHub Actions build and the orchestrator fetch the result
+    name = 'remote'
+
+    def __init__(self, orchestrator, log_file, build_yaml='build.yaml'):
+        self.orchestrator = orchestrator
+        self.log_file = log_file
+        self.build_yaml = build_yaml
+        self.git_lock = FileLock('git') # One add/commit/push at a time, across workers
+
+    def _log_cmd(self, args, log_file, check=False):
+        with open(log_file, 'a') as log:
+            log.write(f"\n> {' '.join(args)}\n")
+            log.flush()
+            subprocess.run(args, stdout=log, stderr=subprocess.STDOUT, check=check)
+
+    def start(self, title, inputs_hash=None, force=False, log_file=None):
+        log_file = log_file or self.log_file
+        # GitHub always builds the whole matrix; the entry hashes only let later
+        # local builds reuse these artifacts
+        try:
+            entries = load_matrix(self.build_yaml)
+            matrix = matrix_hashes(entries)
+        except (RuntimeError, OSError):
+            entries, matrix = None, {}
+
+        with self.git_lock:
+            self._log_cmd(["git", "add", "."], log_file)
+            self._log_cmd(["git", "commit", "--allow-empty", "-m", title], log_file)
+            # Check if push succeeds
+            self._log_cmd(["git", "push"], log_file, check=True)
+            commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+            keymaps = snapshot_keymaps(keymap_files(entries)) # What was just committed
+        return self.orchestrator.submit(commit, title, log_file=log_file, inputs_hash=inputs_hash, matrix=matrix,
+                                        keymaps=keymaps)
+
+    def get(self, build_id):
+        return self.orchestrator.get(build_id)
+
+    def list(self):
+        return self.orchestrator.list()
+
+def load_matrix(build_yaml='build.yaml'):
+    # build.yaml `include:` entries -> [{board, shield, snippet, cmake_args, artifact}]
+    if yaml is None:
+        raise RuntimeError("Local builds need PyYAML to read build.yaml (pip install pyyaml)")
+    with open(build_yaml) as f:
+        data = yaml.safe_load(f) or {}
+
+    entries = []
+    for item in data.get('include') or []:
+        board = item['board']
+        shield = item.get('shield') or ''
+        # Same default artifact name as zmk's build-user-config workflow
+        default_name = f"{shield}-{board}-zmk" if shield else f"{board}-zmk"
+        entries.append({
+            'board': board,
+            'shield': shield,
+            'snippet': item.get('snippet') or '',
+            'cmake_args': item.get('cmake-args') or '',
+            'artifact': item.get('artifact-name') or default_name.replace(' ', '-'),
+        })
+    return entries
+
+class LocalWestBackend:
+    # Builds the build.yaml matrix on this machine with west, either directly or
+    # inside the zmk-build container. The west workspace (zmk, zephyr, modules)
+    # and the ccache directory persist between runs, so only the first build
+    # pays for `west update` and a cold compile. Matrix entries whose inputs
+    # (build_inputs.entry_hash) match an earlier build aren't rebuilt at all:
+    # that build's UF2 is carried over into the new build folder. The shared
+    # workspace fits one build at a time: start() raises LockBusy while another
+    # local build (in any worker process) is running. With a BuildStore, builds
+    # are visible to every worker; one whose process died can't be picked up
+    # again (its west run died with it), so it is marked failed.
+    name = 'local'
+
+    def __init__(self, log_file, builds_dir='builds', latest_dir='firmware_latest', config_dir='config',
+                 build_yaml='build.yaml', workspace='.west-workspace', container=None, jobs=None,
+                 artifact_store=None, on_complete=None, find_artifact=None, store=None):
+        self.log_file = log_file
+        self.builds_dir = builds_dir
+        self.latest_dir = latest_dir
+        self.config_dir = config_dir
+        self.build_yaml = build_yaml
+        self.workspace = os.path.abspath(workspace)
+        self.container = container
+        self.jobs = jobs or os.cpu_count() or 1
+        self.artifact_store = artifact_store
+        self.on_complete = on_complete
+        self.find_artifact = find_artifact # (artifact, entry_hash) -> path of a reusable .uf2 or None
+        self._builds = {}
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self.build_lock = FileLock('local_build')
+        self.store = store
+        if store is not None:
+            for build in store.orphans(self.name):
+                build.state = FAILED
+                build.error = 'Interrupted by a server restart'
+                build.finished = time.time()
+                store.save(self.name, build)
+
+    def start(self, title, entries=None, inputs_hash=None, force=False, log_file=None):
+        matrix = load_matrix(self.build_yaml)
+        if entries is not None:
+            matrix = [e for e in matrix if e['artifact'] in entries]
+            inputs_hash = None # A partial build can't stand in for the full matrix
+
+        build = Build(None, title, log_file or self.log_file, inputs_hash)
+        build.matrix = matrix_hashes(matrix)
+        build.keymaps = snapshot_keymaps(os.path.join(self.config_dir, os.path.basename(p)) for p in keymap_files(matrix))
+        build.state = RUNNING
+
+        # Decide what to reuse now, against the config as it was when the build was requested
+        reuse = {}
+        if self.find_artifact and not force:
+            for entry in matrix:
+                path = self.find_artifact(entry['artifact'], build.matrix[entry['artifact']])
+                if path:
+                    reuse[entry['artifact']] = path
+        build.reused = sorted(reuse)
+
+        # Held by the build thread until it finishes; config/ is copied now so
+        # the build uses the keymap as it was when it was requested
+        lock = self.build_lock.acquire(blocking=False)
+        try:
+            if len(reuse) < len(matrix):
+                self._sync_config()
+        except Exception:
+            self.build_lock.release(lock)
+            raise
+
+        with self._lock:
+            self._builds[build.id] = build
+        self._save(build)
+        threading.Thread(target=self._run, args=(build, matrix, reuse, lock), name=f'local-build-{build.id}', daemon=True).start()
+        return build
+
+    def get(self, build_id):
+        # Builds this process runs, else whatever another worker last recorded
+        with self._lock:
+            build = self._builds.get(build_id)
+        if build is None and self.store is not None:
+            build = self.store.get(self.name, build_id)
+        return build
+
+    def list(self):
+        with self._lock:
+            builds = dict(self._builds)
+        if self.store is not None:
+            for build in self.store.list(self.name):
+                builds.setdefault(build.id, build)
+        return sorted(builds.values(), key=lambda b: b.created, reverse=True)
+
+    def _save(self, build):
+        if self.store is not None:
+            self.store.save(self.name, build)
+
+    def _log(self, build, text):
+        with self._log_lock:
+            with open(build.log_file, 'a') as f:
+                f.write(text)
+
+    def _command(self, args):
+        # Run inside the container when configured; the workspace is mounted at /workspace
+        if not self.container:
+            return args
+        return ['docker', 'run', '--rm', '-v', f"{self.workspace}:/workspace", '-w', '/workspace',
+                '-e', 'CCACHE_DIR=/workspace/.ccache', self.container] + args
+
+    def _stream(self, build, args, prefix=''):
+        # Run a command in the workspace, copying its output into the build log line by line
+        env = dict(os.environ, CCACHE_DIR=os.path.join(self.workspace, '.ccache'))
+        proc = subprocess.Popen(self._command(args), cwd=self.workspace, env=env, text=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        for line in proc.stdout:
+            self._log(build, prefix + line)
+        return proc.wait()
+
+    def _sync_config(self):
+        # Keep the workspace's copy of config/ in sync; the manifest's `self: path: config`
+        # makes <workspace>/config the west manifest repository
+        os.makedirs(self.workspace, exist_ok=True)
+        shutil.copytree(self.config_dir, os.path.join(self.workspace, 'config'), dirs_exist_ok=True)
+
+    def _prepare_workspace(self, build):
+        if not os.path.isdir(os.path.join(self.workspace, '.west')):
+            self._log(build, "\n> west init -l config\n")
+            if self._stream(build, ['west', 'init', '-l', 'config']) != 0:
+                raise RuntimeError("west init failed")
+        if not os.path.isdir(os.path.join(self.workspace, 'zmk')):
+            self._log(build, "\n> west update\n")
+            if self._stream(build, ['west', 'update']) != 0:
+                raise RuntimeError("west update failed")
+
+    def _build_entry(self, build, entry, ninja_jobs=None):
+        build_dir = os.path.join('build', entry['artifact'])
+        config_path = '/workspace/config' if self.container else os.path.join(self.workspace, 'config')
+        args = ['west', 'build', '-s', 'zmk/app', '-d', build_dir, '-b', entry['board']]
+        if ninja_jobs:
+            args += [f"-o=-j{ninja_jobs}"]
+        if entry['snippet']:
+            args += ['-S', entry['snippet']]
+        args += ['--', f"-DZMK_CONFIG={config_path}"]
+        if entry['shield']:
+            args.append(f"-DSHIELD={entry['shield']}")
+        if entry['cmake_args']:
+            args += entry['cmake_args'].split()
+
+        prefix = f"[{entry['artifact']}] "
+        self._log(build, f"{prefix}> {' '.join(args)}\n")
+        start = time.time()
+        if self._stream(build, args, prefix) != 0:
+            raise RuntimeError(f"{entry['artifact']} failed")
+        self._log(build, f"{prefix}built in {time.time() - start:.0f}s\n")
+        return entry, os.path.join(self.workspace, build_dir, 'zephyr', 'zmk.uf2')
+
+    def _run(self, build, matrix, reuse, lock):
+        try:
+            to_build = [e for e in matrix if e['artifact'] not in reuse]
+            parallel = min(self.jobs, max(len(to_build), 1))
+            self._log(build, f"--- Local build: {len(to_build)} of {len(matrix)} matrix entries changed, {parallel} in parallel ---\n")
+            for artifact, path in sorted(reuse.items()):
+                self._log(build, f"[{artifact}] unchanged, reusing {os.path.basename(os.path.dirname(path))}\n")
+
+            results = []
+            if to_build:
+                self._prepare_workspace(build)
+                # Build the matrix entries side by side and split the cores between
+                # their ninja runs, so configure/link phases don't leave cores idle
+                ninja_jobs = max(1, (os.cpu_count() or 1) // parallel)
+                with ThreadPoolExecutor(max_workers=parallel) as pool:
+                    results = list(pool.map(partial(self._build_entry, build, ninja_jobs=ninja_jobs), to_build))
+
+            build_dir = os.path.join(self.builds_dir, build_folder_name(build.title, datetime.now().strftime('%Y%m%d%H%M%S')))
+            if os.path.exists(build_dir): # Two quick builds within the same second
+                build_dir += '_' + build.id[:6]
+            os.makedirs(build_dir)
+            for entry, uf2 in results:
+                shutil.copy2(uf2, os.path.join(build_dir, entry['artifact'] + '.uf2'))
+            for artifact, path in reuse.items():
+                # Plain copy; ingesting into the artifact store turns it back into a shared hardlink
+                shutil.copy2(path, os.path.join(build_dir, artifact + '.uf2'))
+            self._finish(build, build_dir)
+        except Exception as e:
+            build.state = FAILED
+            build.error = str(e)
+            build.finished = time.time()
+            self._log(build, f"\nBuild Failed: {e}\n--- Build Complete ---\n")
+            if self.on_complete:
+                self.on_complete(build)
+        finally:
+            self._save(build)
+            self.build_lock.release(lock)
+
+    def _finish(self, build, build_dir):
+        # Same bookkeeping as a downloaded GitHub build
+        if self.artifact_store:
+            self.artifact_store.ingest_tree(build_dir)
+            self.artifact_store.link_tree(build_dir, self.latest_dir)
+        else:
+            shutil.rmtree(self.latest_dir, ignore_errors=True)
+            shutil.copytree(build_dir, self.latest_dir)
+
+        save_keymaps(build, build_dir)
+        with atomic_write(os.path.join(build_dir, 'build_info.json')) as f:
+            json.dump({
+                'run_id': None,
+                'run_number': None,
+                'title': build.title,
+                'backend': self.name,
+                'inputs_hash': build.inputs_hash,
+                'matrix': build.matrix,
+                'reused': build.reused,
+                'timestamp': datetime.now().astimezone().isoformat(timespec='seconds'),
+            }, f)
+
+        build.build_dir = build_dir
+        build.artifacts = sorted(n for n in os.listdir(build_dir) if n.endswith('.uf2'))
+        build.state = SUCCESS
+        build.finished = time.time()
+        self._log(build, f"Firmware saved to: {build_dir}\nAlso copied to: {self.latest_dir}/\n--- Build Complete ---\n")
+        if self.on_complete:
+            self.on_complete(build)
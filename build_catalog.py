@@ -0,0 +1,223 @@
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+# Persistent index of builds/<name>/build_info.json so page loads don't
+# re-open every build folder. The whole catalog is rescanned only when the
+# builds/ directory mtime changes (someone added/removed a folder by hand);
+# the build pipeline calls add() for each finished build.
+CATALOG_DB = '.cache/build_catalog.sqlite3'
+INFO_FILE = 'build_info.json'
+SCHEMA_VERSION = 3 # Bump when the builds table changes; the catalog is rebuilt from disk
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    name TEXT PRIMARY KEY,
+    run_id INTEGER,
+    run_number INTEGER,
+    title TEXT NOT NULL,
+    timestamp TEXT NOT NULL DEFAULT '',
+    info_mtime INTEGER,
+    error TEXT,
+    inputs_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS builds_run_number ON builds(run_number);
+CREATE INDEX IF NOT EXISTS builds_inputs_hash ON builds(inputs_hash);
+CREATE TABLE IF NOT EXISTS build_artifacts (
+    build TEXT NOT NULL,
+    artifact TEXT NOT NULL,
+    entry_hash TEXT NOT NULL,
+    PRIMARY KEY (build, artifact)
+);
+CREATE INDEX IF NOT EXISTS build_artifacts_entry_hash ON build_artifacts(entry_hash);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+def _read_info(build_path, name):
+    # -> row dict for one build folder; corrupt or missing info is recorded, not hidden
+    info_file = os.path.join(build_path, INFO_FILE)
+    row = {'name': name, 'run_id': None, 'run_number': None, 'title': name, 'timestamp': '',
+           'info_mtime': None, 'error': None, 'inputs_hash': None, 'matrix': {}}
+    if not os.path.exists(info_file):
+        return row
+
+    row['info_mtime'] = os.stat(info_file).st_mtime_ns
+    try:
+        with open(info_file) as f:
+            info = json.load(f)
+        if not isinstance(info, dict):
+            raise ValueError("build_info.json is not an object")
+    except (OSError, ValueError) as e:
+        logger.warning("Corrupt %s in %s: %s", INFO_FILE, build_path, e)
+        row['error'] = f"Corrupt {INFO_FILE}: {e}"
+        return row
+
+    run_number = info.get('run_number')
+    row.update({
+        'run_id': info.get('run_id'),
+        'run_number': run_number if isinstance(run_number, int) else None,
+        'title': str(info.get('title') or name),
+        'timestamp': str(info.get('timestamp') or ''),
+        'inputs_hash': info.get('inputs_hash') if isinstance(info.get('inputs_hash'), str) else None,
+        'matrix': info.get('matrix') if isinstance(info.get('matrix'), dict) else {},
+    })
+    return row
+
+def _to_build(row):
+    # Same shape the templates and /list_builds always used
+    build = {
+        'name': row['name'],
+        'run_number': row['run_number'] if row['run_number'] is not None else '?',
+        'title': row['title'],
+        'timestamp': row['timestamp'],
+    }
+    if row['error']:
+        build['error'] = row['error']
+    return build
+
+class BuildCatalog:
+    def __init__(self, builds_dir='builds', db_path=CATALOG_DB):
+        self.builds_dir = builds_dir
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with self._connect() as db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                # Only a cache of build_info.json files: drop it and rescan
+                db.executescript("DROP TABLE IF EXISTS builds; DROP TABLE IF EXISTS build_artifacts; DROP TABLE IF EXISTS meta;")
+                db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            db.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One short-lived connection per call, committed on success and always closed
+        db = sqlite3.connect(self.db_path, timeout=10)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _dir_mtime(self):
+        try:
+            return str(os.stat(self.builds_dir).st_mtime_ns)
+        except FileNotFoundError:
+            return ''
+
+    def refresh(self, force=False):
+        dir_mtime = self._dir_mtime()
+        with self._lock, self._connect() as db:
+            stored = db.execute("SELECT value FROM meta WHERE key = 'dir_mtime'").fetchone()
+            if not force and stored and stored['value'] == dir_mtime:
+                return False
+
+            known = {r['name']: r['info_mtime'] for r in db.execute("SELECT name, info_mtime FROM builds")}
+            present = set()
+            if os.path.isdir(self.builds_dir):
+                for name in os.listdir(self.builds_dir):
+                    build_path = os.path.join(self.builds_dir, name)
+                    if name.startswith('.') or not os.path.isdir(build_path):
+                        continue
+                    present.add(name)
+
+                    # Only re-read folders that are new or whose info file changed
+                    info_file = os.path.join(build_path, INFO_FILE)
+                    info_mtime = os.stat(info_file).st_mtime_ns if os.path.exists(info_file) else None
+                    if force or name not in known or known[name] != info_mtime:
+                        self._upsert(db, _read_info(build_path, name))
+
+            removed = [(n,) for n in known.keys() - present]
+            db.executemany("DELETE FROM builds WHERE name = ?", removed)
+            db.executemany("DELETE FROM build_artifacts WHERE build = ?", removed)
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dir_mtime', ?)", (dir_mtime,))
+            return True
+
+    def _upsert(self, db, row):
+        db.execute("""INSERT OR REPLACE INTO builds (name, run_id, run_number, title, timestamp, info_mtime, error, inputs_hash)
+                      VALUES (:name, :run_id, :run_number, :title, :timestamp, :info_mtime, :error, :inputs_hash)""", row)
+        db.execute("DELETE FROM build_artifacts WHERE build = ?", (row['name'],))
+        db.executemany("INSERT INTO build_artifacts (build, artifact, entry_hash) VALUES (?, ?, ?)",
+                       [(row['name'], artifact, h) for artifact, h in row['matrix'].items() if isinstance(h, str)])
+
+    def add(self, name):
+        # Record (or re-read) a single build folder, e.g. when a build finishes
+        build_path = os.path.join(self.builds_dir, name)
+        with self._lock, self._connect() as db:
+            if os.path.isdir(build_path):
+                self._upsert(db, _read_info(build_path, name))
+            else:
+                db.execute("DELETE FROM builds WHERE name = ?", (name,))
+                db.execute("DELETE FROM build_artifacts WHERE build = ?", (name,))
+        # The next query still sees the new directory mtime, but that rescan
+        # only stats folders; this one is already up to date and isn't re-read.
+
+    def query(self, title=None, run_number=None, since=None, until=None, limit=None, offset=0):
+        # -> (builds, total). Newest folder name first, like the old listdir sort.
+        # since/until are dates (YYYY-MM-DD) compared against the build timestamp.
+        self.refresh()
+
+        where = []
+        params = []
+        if title:
+            where.append("title LIKE ? ESCAPE '\\'")
+            params.append('%' + title.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if run_number is not None:
+            where.append("run_number = ?")
+            params.append(run_number)
+        if since:
+            where.append("timestamp != '' AND substr(timestamp, 1, 10) >= ?")
+            params.append(since)
+        if until:
+            where.append("timestamp != '' AND substr(timestamp, 1, 10) <= ?")
+            params.append(until)
+        clause = f"WHERE {' AND '.join(where)}" if where else ''
+
+        with self._connect() as db:
+            total = db.execute(f"SELECT COUNT(*) FROM builds {clause}", params).fetchone()[0]
+            sql = f"SELECT * FROM builds {clause} ORDER BY name DESC"
+            if limit is not None:
+                sql += " LIMIT ? OFFSET ?"
+                params = params + [limit, offset]
+            rows = db.execute(sql, params).fetchall()
+        return [_to_build(r) for r in rows], total
+
+    def find_by_inputs(self, inputs_hash):
+        # -> name of the newest build made from these exact inputs that still has
+        # firmware for every matrix entry, or None. A build without a recorded
+        # matrix can't show it is complete, so it never counts.
+        self.refresh()
+        with self._connect() as db:
+            rows = db.execute(
+                """SELECT b.name, a.artifact FROM builds b JOIN build_artifacts a ON a.build = b.name
+                   WHERE b.inputs_hash = ? AND b.error IS NULL
+                   ORDER BY b.timestamp DESC, b.name DESC""", (inputs_hash,)).fetchall()
+        expected = {}
+        for r in rows:
+            expected.setdefault(r['name'], set()).add(r['artifact'] + '.uf2')
+        for name, uf2s in expected.items():
+            build_path = os.path.join(self.builds_dir, name)
+            present = {f for _, _, files in os.walk(build_path) for f in files}
+            if uf2s <= present:
+                return name
+        return None
+
+    def find_artifact(self, artifact, entry_hash):
+        # -> path of <artifact>.uf2 from the newest build whose matrix entry had
+        # this exact entry hash (build_inputs.entry_hash), or None
+        self.refresh()
+        with self._connect() as db:
+            names = [r['name'] for r in db.execute(
+                """SELECT b.name FROM build_artifacts a JOIN builds b ON b.name = a.build
+                   WHERE a.artifact = ? AND a.entry_hash = ? AND b.error IS NULL
+                   ORDER BY b.timestamp DESC, b.name DESC""", (artifact, entry_hash))]
+        for name in names:
+            path = os.path.join(self.builds_dir, name, artifact + '.uf2')
+            if os.path.isfile(path):
+                return path
+        return None
@@ -0,0 +1,61 @@
+import glob
+import hashlib
+import json
+import os
+
+# Files that decide what the firmware looks like. Two builds with the same
+# inputs hash produce the same UF2s, so the second one can be skipped.
+INPUT_PATTERNS = ['config/*.keymap', 'config/*.conf', 'config/west.yml', 'build.yaml']
+
+def input_files(root='.', patterns=INPUT_PATTERNS):
+    files = set()
+    for pattern in patterns:
+        files.update(glob.glob(os.path.join(root, pattern)))
+    return sorted(os.path.relpath(f, root) for f in files)
+
+def _hash_files(h, root, rel_paths):
+    for rel_path in rel_paths:
+        with open(os.path.join(root, rel_path), 'rb') as f:
+            data = f.read()
+        # Path and length framing so renames/moves change the hash too
+        h.update(f"{rel_path}\0{len(data)}\0".encode())
+        h.update(data)
+    return h.hexdigest()
+
+def inputs_hash(root='.', patterns=INPUT_PATTERNS):
+    return _hash_files(hashlib.sha256(), root, input_files(root, patterns))
+
+# Which config files a single build.yaml entry reads. ZMK picks up
+# <name>.keymap / .conf / .overlay from the config dir for the board and every
+# shield, with and without the _left/_right suffix, so e.g. eyelash_corne.keymap
+# feeds both halves but not settings_reset.
+ENTRY_EXTENSIONS = ('.keymap', '.conf', '.overlay')
+SHARED_INPUTS = ['config/west.yml']
+
+def _base_names(entry):
+    names = set()
+    for name in [entry['board']] + entry['shield'].split():
+        names.add(name)
+        for side in ('_left', '_right'):
+            if name.endswith(side):
+                names.add(name[:-len(side)])
+    return names
+
+def entry_input_files(entry, root='.'):
+    candidates = SHARED_INPUTS + [f"config/{name}{ext}" for name in _base_names(entry) for ext in ENTRY_EXTENSIONS]
+    return sorted(p for p in set(candidates) if os.path.isfile(os.path.join(root, p)))
+
+def keymap_files(entries=None, root='.'):
+    # -> config/*.keymap paths the given entries read; every keymap without entries
+    if entries is None:
+        return input_files(root, ['config/*.keymap'])
+    return sorted({p for entry in entries for p in entry_input_files(entry, root) if p.endswith('.keymap')})
+
+def entry_hash(entry, root='.'):
+    # Changes when the entry itself (board, shield, snippet, cmake args) or any file it reads changes
+    h = hashlib.sha256(json.dumps(entry, sort_keys=True).encode())
+    return _hash_files(h, root, entry_input_files(entry, root))
+
+def matrix_hashes(entries, root='.'):
+    # -> {artifact name: entry_hash}
+    return {entry['artifact']: entry_hash(entry, root) for entry in entries}
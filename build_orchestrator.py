@@ -0,0 +1,484 @@
+import contextlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from atomic_io import atomic_write
+
+# Build states
+WAITING = 'waiting_for_run'
+RUNNING = 'running'
+DOWNLOADING = 'downloading'
+SUCCESS = 'success'
+FAILED = 'failed'
+FINISHED_STATES = (SUCCESS, FAILED)
+
+# Poll backoff: start fast, slow down while nothing changes, reset on any change
+INITIAL_DELAY = 3
+MAX_DELAY = 30
+BACKOFF = 1.5
+RUN_LOOKUP_TIMEOUT = 120 # Seconds to wait for GitHub Actions to pick up the commit
+
+# Copies of the keymaps a build was made from, kept in its build folder so
+# binding_index can tell which build had which bindings
+KEYMAPS_DIR = 'config'
+
+# Build state lives in SQLite so every WSGI worker can report on any build, and
+# builds survive a reload: on startup (and every ADOPT_INTERVAL after) a poller
+# takes over the unfinished builds of processes that are gone.
+BUILDS_DB = '.cache/builds.sqlite3'
+SCHEMA_VERSION = 1 # Bump when the builds table or Build.state_dict changes; in-flight builds are dropped
+ADOPT_INTERVAL = 60
+BUILD_MAX_AGE = 7 * 24 * 3600 # Finished builds older than this are dropped on startup
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    id TEXT PRIMARY KEY,
+    backend TEXT NOT NULL,
+    state TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    created REAL NOT NULL,
+    finished REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS builds_created ON builds(created);
+"""
+
+class GhCli:
+    # Thin wrapper around the GitHub CLI. Any object with the same three
+    # methods (find_run, run_status, download) can stand in for it, e.g. a
+    # local fake in tests.
+    def __init__(self, gh='gh'):
+        self.gh = gh
+        self.env = dict(os.environ, GH_NO_COLOR='1')
+
+    def _json(self, args):
+        result = subprocess.run([self.gh] + args, capture_output=True, text=True, env=self.env, check=True)
+        return json.loads(result.stdout) if result.stdout.strip() else None
+
+    def find_run(self, commit):
+        runs = self._json(['run', 'list', '-c', commit, '--limit', '1',
+                           '--json', 'databaseId,number,url,displayTitle,workflowName'])
+        if not runs:
+            return None
+        run = runs[0]
+        return {
+            'run_id': run['databaseId'],
+            'run_number': run.get('number'),
+            'url': run.get('url'),
+            'title': run.get('displayTitle'),
+            'workflow': run.get('workflowName'),
+        }
+
+    def run_status(self, run_id):
+        run = self._json(['run', 'view', str(run_id), '--json', 'status,conclusion,jobs'])
+        return {
+            'status': run.get('status'),
+            'conclusion': run.get('conclusion') or None,
+            'jobs': [{'name': j.get('name'), 'status': j.get('status'), 'conclusion': j.get('conclusion') or None}
+                     for j in run.get('jobs') or []],
+        }
+
+    def download(self, run_id, dest, log_file):
+        with open(log_file, 'a') as log:
+            subprocess.run([self.gh, 'run', 'download', str(run_id), '-n', 'firmware', '-D', dest],
+                           stdout=log, stderr=subprocess.STDOUT, env=self.env, check=True)
+
+class Build:
+    def __init__(self, commit, title, log_file, inputs_hash=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.commit = commit
+        self.title = title
+        self.log_file = log_file
+        self.inputs_hash = inputs_hash # build_inputs.inputs_hash() of what was built
+        self.matrix = {} # artifact name -> build_inputs.entry_hash()
+        self.reused = [] # artifacts carried over from an earlier build instead of rebuilt
+        self.keymaps = {} # keymap file name -> text, as it was when the build was requested
+        self.state = WAITING
+        self.run_id = None
+        self.run_number = None
+        self.url = None
+        self.status = None
+        self.conclusion = None
+        self.jobs = {}
+        self.build_dir = None
+        self.artifacts = []
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.next_poll = self.created
+        self.delay = INITIAL_DELAY
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'commit': self.commit,
+            'title': self.title,
+            'inputs_hash': self.inputs_hash,
+            'matrix': self.matrix,
+            'reused': self.reused,
+            'state': self.state,
+            'run_id': self.run_id,
+            'run_number': self.run_number,
+            'url': self.url,
+            'status': self.status,
+            'conclusion': self.conclusion,
+            'build_dir': self.build_dir,
+            'artifacts': self.artifacts,
+            'error': self.error,
+            'created': self.created,
+            'finished': self.finished,
+        }
+
+    def state_dict(self):
+        # Everything needed to carry on with the build in another process
+        return dict(self.to_dict(), log_file=self.log_file, keymaps=self.keymaps, jobs=self.jobs,
+                    next_poll=self.next_poll, delay=self.delay)
+
+    @classmethod
+    def from_state(cls, data):
+        build = cls.__new__(cls)
+        build.__dict__.update(data)
+        build.jobs = {name: tuple(job) for name, job in data['jobs'].items()}
+        return build
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class BuildStore:
+    # Builds of every backend, one JSON row each, written by whichever process
+    # drives the build (its pid marks ownership)
+    def __init__(self, db_path=BUILDS_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with self._connect() as db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                db.execute("DROP TABLE IF EXISTS builds")
+                db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            db.executescript(SCHEMA)
+            db.execute("DELETE FROM builds WHERE finished IS NOT NULL AND finished < ?", (time.time() - BUILD_MAX_AGE,))
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One short-lived connection per call, committed on success and always closed
+        db = sqlite3.connect(self.db_path, timeout=10)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def save(self, backend, build):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO builds (id, backend, state, pid, created, finished, data) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (build.id, backend, build.state, os.getpid(), build.created, build.finished,
+                        json.dumps(build.state_dict())))
+
+    def get(self, backend, build_id):
+        with self._connect() as db:
+            row = db.execute("SELECT data FROM builds WHERE id = ? AND backend = ?", (build_id, backend)).fetchone()
+        return Build.from_state(json.loads(row['data'])) if row else None
+
+    def list(self, backend, limit=50):
+        with self._connect() as db:
+            rows = db.execute("SELECT data FROM builds WHERE backend = ? ORDER BY created DESC LIMIT ?",
+                              (backend, limit)).fetchall()
+        return [Build.from_state(json.loads(r['data'])) for r in rows]
+
+    def orphans(self, backend):
+        # -> unfinished builds whose owning process is gone, now owned by this one.
+        # The pid check in the UPDATE makes the takeover atomic: of several
+        # workers adopting at once, exactly one gets each build.
+        adopted = []
+        with self._connect() as db:
+            rows = db.execute("SELECT id, pid, data FROM builds WHERE backend = ? AND state NOT IN (?, ?)",
+                              (backend, *FINISHED_STATES)).fetchall()
+            for row in rows:
+                if row['pid'] != os.getpid() and not _alive(row['pid']):
+                    claimed = db.execute("UPDATE builds SET pid = ? WHERE id = ? AND pid = ?",
+                                         (os.getpid(), row['id'], row['pid'])).rowcount
+                    if claimed:
+                        adopted.append(Build.from_state(json.loads(row['data'])))
+        return adopted
+
+def snapshot_keymaps(paths):
+    # -> {file name: text} of keymaps a build is about to use
+    keymaps = {}
+    for path in paths:
+        try:
+            with open(path, encoding='utf-8') as f:
+                keymaps[os.path.basename(path)] = f.read()
+        except OSError:
+            pass
+    return keymaps
+
+def save_keymaps(build, build_dir):
+    if not build.keymaps:
+        return
+    os.makedirs(os.path.join(build_dir, KEYMAPS_DIR), exist_ok=True)
+    for name, text in build.keymaps.items():
+        with atomic_write(os.path.join(build_dir, KEYMAPS_DIR, name)) as f:
+            f.write(text)
+
+def build_folder_name(title, run_id):
+    # Sanitize the title: lowercase, replace spaces with underscores, remove special chars
+    safe_title = ''.join(c for c in title.lower().replace(' ', '_') if c.isalnum() or c == '_')[:30]
+    return f"{safe_title}_{run_id}"
+
+class BuildOrchestrator:
+    # Tracks every pushed build as a small state machine
+    # (waiting_for_run -> running -> downloading -> success/failed) and drives
+    # all of them from one background poller thread. With a BuildStore, each
+    # step is persisted and resume() picks up builds a dead process left behind.
+    name = 'remote'
+
+    def __init__(self, forge=None, log_file='build_progress.log', builds_dir='builds',
+                 latest_dir='firmware_latest', on_complete=None, open_browser=None, artifact_store=None,
+                 store=None):
+        self.forge = forge or GhCli()
+        self.artifact_store = artifact_store
+        self.log_file = log_file
+        self.builds_dir = builds_dir
+        self.latest_dir = latest_dir
+        self.on_complete = on_complete
+        self.open_browser = sys.platform == 'darwin' if open_browser is None else open_browser
+        self.store = store
+        self._builds = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._log_lock = threading.Lock()
+        self._thread = None
+        self._next_adopt = 0
+
+    def submit(self, commit, title, log_file=None, inputs_hash=None, matrix=None, keymaps=None):
+        build = Build(commit, title, log_file or self.log_file, inputs_hash)
+        build.matrix = matrix or {}
+        build.keymaps = keymaps or {}
+        self._log(build, f"--- Build Triggered for Commit {commit} ---\n")
+        self._log(build, "Waiting for GitHub Actions to start...\n")
+        self._save(build)
+        with self._wake:
+            self._builds[build.id] = build
+            self._start_thread()
+            self._wake.notify()
+        return build
+
+    def resume(self):
+        # Start polling now, adopting unfinished builds of processes that are
+        # gone (a reload or recycled worker) rather than waiting for a submit
+        if self.store is None:
+            return
+        with self._wake:
+            self._start_thread()
+            self._wake.notify()
+
+    def _start_thread(self):
+        # Caller holds self._lock
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='build-orchestrator', daemon=True)
+            self._thread.start()
+
+    def _save(self, build):
+        if self.store is not None:
+            self.store.save(self.name, build)
+
+    def _adopt(self):
+        for build in self.store.orphans(self.name):
+            if build.state == DOWNLOADING:
+                build.state = RUNNING # Download again; _download starts from an empty folder
+            build.next_poll = time.time()
+            self._log(build, f"\n--- Resuming build {build.id} after a server restart ---\n")
+            with self._lock:
+                self._builds[build.id] = build
+
+    def get(self, build_id):
+        # Builds this process drives, else whatever another worker last recorded
+        with self._lock:
+            build = self._builds.get(build_id)
+        if build is None and self.store is not None:
+            build = self.store.get(self.name, build_id)
+        return build
+
+    def list(self):
+        with self._lock:
+            builds = dict(self._builds)
+        if self.store is not None:
+            for build in self.store.list(self.name):
+                builds.setdefault(build.id, build)
+        return sorted(builds.values(), key=lambda b: b.created, reverse=True)
+
+    def wait(self, build_id, timeout=None):
+        # Block until a build finishes (mainly for scripts and tests)
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            build = self.get(build_id)
+            if build is None or build.state in FINISHED_STATES:
+                return build
+            if deadline is not None and time.time() >= deadline:
+                return build
+            time.sleep(0.1)
+
+    def _log(self, build, text):
+        with self._log_lock:
+            with open(build.log_file, 'a') as f:
+                f.write(text)
+
+    def _run(self):
+        while True:
+            if self.store is not None and time.time() >= self._next_adopt:
+                self._next_adopt = time.time() + ADOPT_INTERVAL
+                try:
+                    self._adopt()
+                except sqlite3.Error:
+                    pass # Try again next interval
+
+            with self._wake:
+                now = time.time()
+                active = [b for b in self._builds.values() if b.state not in FINISHED_STATES]
+                due = [b for b in active if b.next_poll <= now]
+                if not due:
+                    wake_at = min((b.next_poll for b in active), default=None)
+                    if self.store is not None:
+                        wake_at = min(wake_at or self._next_adopt, self._next_adopt)
+                    self._wake.wait(None if wake_at is None else max(wake_at - now, 0))
+                    continue
+
+            # Forge calls happen outside the lock so submit()/get() never wait on the network
+            for build in due:
+                self._step(build)
+
+    def _reschedule(self, build, changed):
+        build.delay = INITIAL_DELAY if changed else min(build.delay * BACKOFF, MAX_DELAY)
+        build.next_poll = time.time() + build.delay
+
+    def _step(self, build):
+        try:
+            if build.state == WAITING:
+                self._step_waiting(build)
+            elif build.state == RUNNING:
+                self._step_running(build)
+        except Exception as e:
+            self._fail(build, f"CRITICAL ERROR: {e}")
+        self._save(build)
+
+    def _step_waiting(self, build):
+        run = self.forge.find_run(build.commit)
+        if not run or not run.get('run_id'):
+            if time.time() - build.created > RUN_LOOKUP_TIMEOUT:
+                self._fail(build, f"Error: Could not find run for commit {build.commit} after {RUN_LOOKUP_TIMEOUT} seconds.")
+                return
+            self._log(build, ".")
+            self._reschedule(build, changed=False)
+            return
+
+        build.run_id = run['run_id']
+        build.run_number = run.get('run_number')
+        build.url = run.get('url')
+        if run.get('title'):
+            build.title = run['title']
+        build.state = RUNNING
+
+        self._log(build,
+                  f"\n\nFound Run ID: {build.run_id} (Build #{build.run_number})\n"
+                  f"Workflow: {run.get('workflow')}\n"
+                  f"Action: {build.title}\n"
+                  f"URL: {build.url}\n")
+        if self.open_browser and build.url:
+            subprocess.Popen(['open', build.url], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self._reschedule(build, changed=True)
+
+    def _step_running(self, build):
+        status = self.forge.run_status(build.run_id)
+        changed = (status['status'], status['conclusion']) != (build.status, build.conclusion)
+        build.status = status['status']
+        build.conclusion = status['conclusion']
+
+        stamp = datetime.now().strftime('%H:%M:%S')
+        for job in status.get('jobs', []):
+            job_state = (job['status'], job['conclusion'])
+            if build.jobs.get(job['name']) != job_state:
+                build.jobs[job['name']] = job_state
+                changed = True
+                self._log(build, f"[{stamp}] {job['name']}: {job['status']}"
+                                 f"{' / ' + job['conclusion'] if job['conclusion'] else ''}\n")
+        if changed:
+            self._log(build, f"[{stamp}] Check -> [Status: {build.status} / Result: {build.conclusion or 'Running'}]\n")
+
+        if build.status != 'completed':
+            self._reschedule(build, changed)
+            return
+
+        if build.conclusion == 'success':
+            self._download(build)
+        else:
+            self._fail(build, "Build Failed.")
+
+    def _download(self, build):
+        build.state = DOWNLOADING
+        self._log(build, "Downloading firmware...\n")
+
+        self._save(build)
+
+        # A folder already there is an interrupted earlier download of this run
+        build_dir = os.path.join(self.builds_dir, build_folder_name(build.title, build.run_id))
+        shutil.rmtree(build_dir, ignore_errors=True)
+        os.makedirs(build_dir)
+        self.forge.download(build.run_id, build_dir, build.log_file)
+
+        # Also update firmware_latest for convenience: hardlinks into the
+        # artifact store when there is one, otherwise a plain copy
+        if self.artifact_store:
+            self.artifact_store.ingest_tree(build_dir)
+            self.artifact_store.link_tree(build_dir, self.latest_dir)
+        else:
+            shutil.rmtree(self.latest_dir, ignore_errors=True)
+            shutil.copytree(build_dir, self.latest_dir)
+
+        # Save build metadata
+        save_keymaps(build, build_dir)
+        with atomic_write(os.path.join(build_dir, 'build_info.json')) as f:
+            json.dump({
+                'run_id': build.run_id,
+                'run_number': build.run_number,
+                'title': build.title,
+                'inputs_hash': build.inputs_hash,
+                'matrix': build.matrix,
+                'timestamp': datetime.now().astimezone().isoformat(timespec='seconds'),
+            }, f)
+
+        build.build_dir = build_dir
+        build.artifacts = sorted(
+            os.path.relpath(os.path.join(root, name), build_dir)
+            for root, _, files in os.walk(build_dir) for name in files if name.endswith('.uf2')
+        )
+        build.state = SUCCESS
+        build.finished = time.time()
+        self._log(build,
+                  f"Firmware saved to: {build_dir}\n"
+                  f"Also copied to: {self.latest_dir}/\n"
+                  "--- Build Complete ---\n")
+        if self.on_complete:
+            self.on_complete(build)
+
+    def _fail(self, build, message):
+        build.state = FAILED
+        build.error = message
+        build.finished = time.time()
+        self._log(build, f"\n{message}\n--- Build Complete ---\n")
+        if self.on_complete:
+            self.on_complete(build)
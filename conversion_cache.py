@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import convert_vil
+import draw_keymap
+import keycodes
+import keymap_dt
+import vil_behaviors
+import vil_reader
+from draw_keymap import SHEET_FILES, read_manifest, write_manifest, read_sheet_manifest, write_sheet_manifest
+from atomic_io import atomic_copy
+
+# On-disk cache of converted keymaps and their layer previews.
+# Entries are keyed by the hash of the raw .vil bytes plus the KEY_MAP version,
+# the preview format (per-layer PNGs, SVG or sprite sheet) and the source of
+# the modules that produce the output, so re-selecting a template is a lookup
+# and a file copy instead of a full convert-and-draw, and a change to the
+# converter or the renderer (layouts, base image, labels) is never served
+# stale. Bump CACHE_VERSION when the entry format itself changes.
+CACHE_DIR = '.cache/conversions'
+CACHE_VERSION = 3
+MAX_ENTRIES = 32
+
+META_FILE = 'meta.json'
+KEYMAP_NAME = 'keymap'
+IMAGES_NAME = 'images'
+
+# Everything that turns a .vil into the cached keymap and images
+GENERATOR_MODULES = (vil_reader, keycodes, vil_behaviors, convert_vil, keymap_dt, draw_keymap)
+
+def generator_version(modules=GENERATOR_MODULES):
+    # -> short hash of the modules' source files
+    h = hashlib.sha256()
+    for module in modules:
+        with open(module.__file__, 'rb') as f:
+            h.update(f.read())
+        h.update(b'\0')
+    return h.hexdigest()[:16]
+
+GENERATOR_VERSION = generator_version()
+
+def cache_key(vil_bytes, key_map_version, render_mode='png', generator=GENERATOR_VERSION):
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_VERSION}\0{key_map_version}\0{render_mode}\0{generator}\0".encode())
+    h.update(vil_bytes)
+    return h.hexdigest()
+
+def lookup(key, cache_dir=CACHE_DIR):
+    entry = os.path.join(cache_dir, key)
+    meta_file = os.path.join(entry, META_FILE)
+    if not os.path.exists(meta_file):
+        return None
+
+    try:
+        with open(meta_file) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        # Half-written or corrupt entry, drop it and convert again
+        shutil.rmtree(entry, ignore_errors=True)
+        return None
+
+    # Touch the entry so LRU eviction sees it as recently used
+    os.utime(meta_file)
+    meta['path'] = entry
+    return meta
+
+def store(key, keymap_file, images_dir, image_files, layer_count, cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES):
+    entry = os.path.join(cache_dir, key)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Unique temp dir: two workers may store the same key at once
+    tmp_entry = tempfile.mkdtemp(dir=cache_dir, prefix=f"{key}.", suffix='.tmp')
+    os.makedirs(os.path.join(tmp_entry, IMAGES_NAME))
+
+    shutil.copy(keymap_file, os.path.join(tmp_entry, KEYMAP_NAME))
+    for name in image_files:
+        shutil.copy(os.path.join(images_dir, name), os.path.join(tmp_entry, IMAGES_NAME, name))
+
+    # Keep the drawer's layer fingerprints so a restore leaves its manifest truthful
+    manifest = {name: fp for name, fp in read_manifest(images_dir).items() if f"{name}.png" in image_files}
+    sheet = {fmt: fp for fmt, fp in read_sheet_manifest(images_dir).items()
+             if fmt in SHEET_FILES and SHEET_FILES[fmt][0] in image_files}
+
+    with open(os.path.join(tmp_entry, META_FILE), 'w') as f:
+        json.dump({'layer_count': layer_count, 'images': image_files, 'manifest': manifest,
+                   'sheet': sheet, 'created': time.time()}, f)
+
+    # Swap the finished entry into place so readers never see a partial one;
+    # if another worker got there first, its identical entry wins
+    if os.path.isdir(entry) and not os.path.exists(os.path.join(entry, META_FILE)):
+        shutil.rmtree(entry, ignore_errors=True) # Leftover from an interrupted store
+    try:
+        os.rename(tmp_entry, entry)
+    except OSError:
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+    evict(cache_dir, max_entries)
+
+def restore(meta, keymap_file, images_dir):
+    os.makedirs(images_dir, exist_ok=True)
+    atomic_copy(os.path.join(meta['path'], KEYMAP_NAME), keymap_file)
+    for name in meta['images']:
+        atomic_copy(os.path.join(meta['path'], IMAGES_NAME, name), os.path.join(images_dir, name))
+    write_manifest(images_dir, meta.get('manifest', {}))
+    write_sheet_manifest(images_dir, meta.get('sheet', {}))
+    return list(meta['images'])
+
+def evict(cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES):
+    if not os.path.exists(cache_dir):
+        return
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        meta_file = os.path.join(cache_dir, name, META_FILE)
+        if name.endswith('.tmp') or not os.path.exists(meta_file):
+            continue
+        entries.append((os.path.getmtime(meta_file), name))
+
+    # Newest (most recently used) first, drop everything past the limit
+    entries.sort(reverse=True)
+    for _, name in entries[max_entries:]:
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
@@ -1,174 +1,21 @@
-
-import json
-import re
+import argparse
+import glob
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from keycodes import parse_layer, unknown_keycodes
+from vil_reader import iter_layers, load_sections
+from atomic_io import atomic_write
+import keymap_dt
+from vil_behaviors import SECTIONS as BEHAVIOR_SECTIONS, behaviors_source
 
 VIL_FILE = "vail_templates/three_layers.vil"
 KEYMAP_FILE = "config/corne.keymap"
+BATCH_OUTPUT_DIR = "keymaps"
 
-# Mapping QMK/VIAL keycodes to ZMK
-KEY_MAP = {
-    "KC_TRNS": "&trans",
-    "KC_NO": "&none",
-    "KC_ENT": "&kp RET",
-    "KC_ENTER": "&kp RET",
-    "KC_BSPACE": "&kp BSPC",
-    "KC_SPC": "&kp SPACE",
-    "KC_SPACE": "&kp SPACE",
-    "KC_MINUS": "&kp MINUS",
-    "KC_EQUAL": "&kp EQUAL",
-    "KC_LBRC": "&kp LBKT",
-    "KC_LBRACKET": "&kp LBKT",
-    "KC_RBRC": "&kp RBKT",
-    "KC_RBRACKET": "&kp RBKT",
-    "KC_BSLASH": "&kp BSLH",
-    "KC_SCOLON": "&kp SEMI",
-    "KC_QUOTE": "&kp SQT",
-    "KC_GRAVE": "&kp GRAVE",
-    "KC_COMMA": "&kp COMMA",
-    "KC_DOT": "&kp DOT",
-    "KC_SLASH": "&kp FSLH",
-    "KC_CAPS": "&kp CAPS",
-    "KC_LCTRL": "&kp LCTRL",
-    "KC_LSHIFT": "&kp LSHIFT",
-    "KC_LALT": "&kp LALT",
-    "KC_LGUI": "&kp LGUI",
-    "KC_RCTRL": "&kp RCTRL",
-    "KC_RSHIFT": "&kp RSHIFT",
-    "KC_RALT": "&kp RALT",
-    "KC_RGUI": "&kp RGUI",
-    "KC_APP": "&kp K_APP",
-    "KC_ESC": "&kp ESC",
-    "KC_GESC": "&kp ESC", # Graze ESC
-    "KC_TAB": "&kp TAB",
-    "KC_UP": "&kp UP",
-    "KC_DOWN": "&kp DOWN",
-    "KC_LEFT": "&kp LEFT",
-    "KC_RIGHT": "&kp RIGHT",
-    "KC_PGUP": "&kp PG_UP",
-    "KC_PGDOWN": "&kp PG_DN",
-    "KC_HOME": "&kp HOME",
-    "KC_END": "&kp END",
-    "KC_INS": "&kp INS",
-    "KC_DEL": "&kp DEL",
-    "KC_DELETE": "&kp DEL",
-    "KC_PSCR": "&kp PSCRN",
-    "KC_SLCK": "&kp SLCK",
-    "KC_PAUSE": "&kp PAUSE",
-    # Mouse keys
-    "KC_BTN1": "&mkp LCLK",
-    "KC_BTN2": "&mkp RCLK",
-    "KC_BTN3": "&mkp MCLK",
-    "KC_WH_U": "&msc SCRL_UP",
-    "KC_WH_D": "&msc SCRL_DOWN",
-    "KC_WH_L": "&msc SCRL_LEFT",
-    "KC_WH_R": "&msc SCRL_RIGHT",
-    "KC_MS_U": "&mmv MOVE_UP",
-    "KC_MS_D": "&mmv MOVE_DOWN",
-    "KC_MS_L": "&mmv MOVE_LEFT",
-    "KC_MS_R": "&mmv MOVE_RIGHT",
-     # Media
-    "KC_MPLY": "&kp C_PP",
-    "KC_MUTE": "&kp C_MUTE",
-    "KC_VOLD": "&kp C_VOL_DN",
-    "KC__VOLDOWN": "&kp C_VOL_DN",
-    "KC_VOLU": "&kp C_VOL_UP",
-    "KC__VOLUP": "&kp C_VOL_UP",
-    "KC_MNXT": "&kp C_NEXT",
-    "KC_MPRV": "&kp C_PREV",
-    "KC_MSTP": "&kp C_STOP",
-    "KC_MFFD": "&kp C_FF",
-    "KC_MRWD": "&kp C_RW",
-    "KC_BRIU": "&kp C_BRI_UP",
-    "KC_BRID": "&kp C_BRI_DN",
-    
-}
-
-def parse_keycode(qc):
-    if isinstance(qc, int):
-        if qc == -1: return "" # Skip gaps
-        return f"&kp {qc}" # Fallback for raw ints if needed
-
-    # Basic mapping
-    if qc in KEY_MAP:
-        return KEY_MAP[qc]
-    
-    # Simple KC_ prefix strip for letters/numbers/F-keys
-    if qc.startswith("KC_"):
-        suffix = qc[3:]
-        if len(suffix) == 1 and suffix.isalnum():
-             return f"&kp {suffix}"
-        if re.match(r"F\d+", suffix):
-             return f"&kp {suffix}"
-        if suffix.isdigit():
-             return f"&kp N{suffix}"
-
-    # Modifiers: LCTL(KC_X) -> &kp LC(X)
-    # ZMK modifiers are: LS(x), LC(x), LA(x), LG(x)
-    mod_map = {
-        "LCTL": "LC", "RCTL": "RC",
-        "LSFT": "LS", "RSFT": "RS",
-        "LALT": "LA", "RALT": "RA",
-        "LGUI": "LG", "RGUI": "RG"
-    }
-
-    match = re.match(r"([A-Z]+)\((.+)\)", qc)
-    if match:
-        func = match.group(1)
-        arg = match.group(2)
-        
-        # Layer MO(1) -> &mo 1
-        if func == "MO":
-            return f"&mo {arg}"
-        
-        # Layer Tap LT2(KC_SPACE) -> &lt 2 SPACE
-        if func.startswith("LT"):
-            layer = func[2:]
-            inner_key = parse_keycode(arg).replace("&kp ", "")
-            return f"&lt {layer} {inner_key}"
-
-        # Modifiers
-        if func in mod_map:
-            zmk_mod = mod_map[func]
-            inner_key = parse_keycode(arg).replace("&kp ", "")
-            return f"&kp {zmk_mod}({inner_key})"
-            
-        # Default Layer DF(1) -> &to 1
-        if func == "DF":
-            return f"&to {arg}"
-
-    return f"&none /* {qc} */"
-
-def convert_layer(layer_data):
-    zmk_bindings = []
-    
-    # Flatten rows to a simple list of keys
-    flat_keys = []
-    for row in layer_data:
-        for k in row:
-            if k == -1: continue # Skip visual gaps
-            flat_keys.append(k)
-            
-    # Process 42 keys for Corne
-    # The VIL has 4 rows. 
-    # Row 0,1,2: 12 keys each (6 left + 6 right) = 36 keys
-    # Row 3: Thumb row. Corne has 6 thumbs (3 left + 3 right).
-    # VIL Row 3 seems to have gaps or more keys.
-    # Let's verify count.
-    
-    zmk_keys = []
-    for k in flat_keys:
-        zmk_keys.append(parse_keycode(k))
-        
-    return zmk_keys
-
-def generate_keymap():
-    with open(VIL_FILE, "r") as f:
-        data = json.load(f)
-        
-    layers = data.get("layout", [])
-    
-    # Header
-    output = """/*
+KEYMAP_HEADER = """/*
  * Copyright (c) 2020 The ZMK Contributors
  *
  * SPDX-License-Identifier: MIT
@@ -181,38 +28,186 @@ def generate_keymap():
 #include <dt-bindings/zmk/pointing.h>
 
 / {
-        keymap {
+"""
+KEYMAP_OPEN = """        keymap {
                 compatible = "zmk,keymap";
 """
 
-    for i, layer in enumerate(layers):
-        zmk_keys = convert_layer(layer)
-        
+def convert_layer(layer_data):
+    # Flatten rows to a simple list of keys (skipping -1 visual gaps) and translate.
+    # The VIL has 4 rows.
+    # Row 0,1,2: 12 keys each (6 left + 6 right) = 36 keys
+    # Row 3: Thumb row. Corne has 6 thumbs (3 left + 3 right).
+    return parse_layer(layer_data)
+
+def keymap_source(layers, behaviors=""):
+    # Translated layers (+ behaviors/macros/combos nodes) -> .keymap text.
+    # Used by the web app and both CLI modes.
+    output = KEYMAP_HEADER + behaviors + KEYMAP_OPEN
+
+    for i, zmk_keys in enumerate(layers):
         # Format into lines of 12 keys roughly
         # Corne 42 keys: 12, 12, 12, 6
-        
+
         layer_str = f"                layer_{i} {{\n                        bindings = <\n"
-        
+
         # Main rows
         row1 = zmk_keys[0:12]
         row2 = zmk_keys[12:24]
         row3 = zmk_keys[24:36]
         thumbs = zmk_keys[36:]
-        
+
         layer_str += "   " + " ".join(row1) + "\n"
         layer_str += "   " + " ".join(row2) + "\n"
         layer_str += "   " + " ".join(row3) + "\n"
         layer_str += "                    " + " ".join(thumbs) + "\n"
-        
+
         layer_str += "                        >;\n                };\n"
         output += layer_str
 
     output += "        };\n};\n"
-    
-    with open(KEYMAP_FILE, "w") as f:
-        f.write(output)
-        
+    return output
+
+def translate_file(vil_file):
+    # -> (behaviors devicetree, translated layers). Only the behavior sections
+    # are decoded up front; layout layers are translated one at a time as they
+    # stream in, and encoder_layout, settings etc. are skipped.
+    sections = load_sections(vil_file, BEHAVIOR_SECTIONS)
+    layers = [convert_layer(layer) for layer in iter_layers(vil_file)]
+    return behaviors_source(sections, layers)
+
+def convert_file(vil_file, keymap_file):
+    # -> translated layers, after writing keymap_file
+    behaviors, layers = translate_file(vil_file)
+    source = keymap_source(layers, behaviors)
+    check_keymap(source, layers)
+    with atomic_write(keymap_file) as f:
+        f.write(source)
+    return layers
+
+def check_keymap(source, layers):
+    # Parse the generated text back before it replaces the old keymap: a
+    # keycode comment or macro that breaks the devicetree, or a binding naming
+    # a behavior node that wasn't emitted, would otherwise only show up as a
+    # failed firmware build (or keys silently merged)
+    doc = keymap_dt.parse(source)
+    undefined = doc.undefined_references()
+    if undefined:
+        raise ValueError(f"Generated keymap uses undefined behaviors: {', '.join('&' + r for r in sorted(undefined))}")
+    parsed = doc.layers()
+    if len(parsed) != len(layers):
+        raise ValueError(f"Generated keymap has {len(parsed)} layers, expected {len(layers)}")
+    for i, (layer, keys) in enumerate(zip(parsed, layers)):
+        if len(layer.bindings) != len(keys):
+            raise ValueError(f"Generated layer {i} has {len(layer.bindings)} bindings, expected {len(keys)}")
+
+def generate_keymap():
+    layers = convert_file(VIL_FILE, KEYMAP_FILE)
     print(f"Generated {KEYMAP_FILE} with {len(layers)} layers.")
 
+# --- Batch mode: regenerate a whole template library -------------------------
+
+def find_vil_files(inputs):
+    # Directories contribute their *.vil files, anything else is a path or glob
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            files += glob.glob(os.path.join(item, "*.vil"))
+        else:
+            files += glob.glob(item) or ([item] if os.path.exists(item) else [])
+    return sorted(set(files))
+
+def output_names(vil_files):
+    # -> {vil file: output name without extension}: the path relative to the
+    # inputs' common directory, so a/corne.vil and b/corne.vil don't collide
+    # (files from one directory keep their plain names)
+    if not vil_files:
+        return {}
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in vil_files])
+    return {f: os.path.splitext(os.path.relpath(os.path.abspath(f), base))[0] for f in vil_files}
+
+def convert_one(vil_file, output_dir, images=False, name=None):
+    # Runs in a pool worker; returns a picklable summary instead of raising
+    start = time.perf_counter()
+    name = name or os.path.splitext(os.path.basename(vil_file))[0]
+    keymap_file = os.path.join(output_dir, name + ".keymap")
+    result = {'source': vil_file, 'keymap': keymap_file, 'layers': 0, 'images': 0, 'unknown': {}, 'error': None}
+    try:
+        os.makedirs(os.path.dirname(keymap_file), exist_ok=True)
+        layers = convert_file(vil_file, keymap_file)
+        result['layers'] = len(layers)
+        result['unknown'] = dict(Counter(k for layer in layers for k in unknown_keycodes(layer)))
+        if images:
+            # Imported lazily so plain conversions don't need Pillow; rendered
+            # serially because this is already one process per file
+            from draw_keymap import draw_layers
+            result['images'] = len(draw_layers(keymap_file, os.path.join(output_dir, "images", name)))
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def convert_batch(vil_files, output_dir=BATCH_OUTPUT_DIR, images=False, jobs=None):
+    os.makedirs(output_dir, exist_ok=True)
+    names = output_names(vil_files)
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(convert_one, f, output_dir, images, names[f]) for f in vil_files]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result['error']:
+                print(f"FAIL {result['source']}: {result['error']}")
+            else:
+                extra = f", {result['images']} images" if images else ""
+                print(f"{result['seconds'] * 1000:7.1f} ms  {result['source']} -> {result['keymap']} "
+                      f"({result['layers']} layers{extra}, {sum(result['unknown'].values())} unknown)")
+    return sorted(results, key=lambda r: r['source'])
+
+def print_unknown_summary(results):
+    counts = Counter()
+    sources = {}
+    for result in results:
+        for keycode, n in result['unknown'].items():
+            counts[keycode] += n
+            sources.setdefault(keycode, []).append(os.path.basename(result['source']))
+
+    if not counts:
+        print("No unknown keycodes.")
+        return
+    print(f"\nUnknown keycodes ({len(counts)}):")
+    for keycode, n in counts.most_common():
+        print(f"  {n:4d}  {keycode}  [{', '.join(sources[keycode])}]")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert Vial .vil layouts to ZMK keymaps. "
+                                                 f"Without inputs converts {VIL_FILE} -> {KEYMAP_FILE}.")
+    parser.add_argument('inputs', nargs='*', help="Directories, .vil files or glob patterns to convert in batch")
+    parser.add_argument('-o', '--output-dir', default=BATCH_OUTPUT_DIR, help="Where batch keymaps are written (<name>.keymap, "
+                                                                            "in subfolders when inputs come from several directories)")
+    parser.add_argument('--images', action='store_true', help="Also render layer PNGs to <output-dir>/images/<name>/")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--strict', action='store_true', help="Exit non-zero if any keycode could not be translated")
+    args = parser.parse_args(argv)
+
+    if not args.inputs:
+        generate_keymap()
+        return 0
+
+    vil_files = find_vil_files(args.inputs)
+    if not vil_files:
+        print("No .vil files found.")
+        return 1
+
+    start = time.perf_counter()
+    results = convert_batch(vil_files, args.output_dir, args.images, args.jobs)
+    failed = [r for r in results if r['error']]
+    print(f"\nConverted {len(results) - len(failed)}/{len(results)} files in {time.perf_counter() - start:.2f}s")
+    print_unknown_summary(results)
+
+    if failed or (args.strict and any(r['unknown'] for r in results)):
+        return 1
+    return 0
+
 if __name__ == "__main__":
-    generate_keymap()
+    sys.exit(main())
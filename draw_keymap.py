@@ -1,12 +1,35 @@
 import re
 import os
+import json
+import html
+import hashlib
+import functools
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from PIL import Image, ImageDraw, ImageFont
+from atomic_io import atomic_write
+import keymap_dt
+
+# Per-layer binding fingerprints of the images in an output folder.
+# Bump RENDER_VERSION when the drawing itself changes so old images get redrawn.
+MANIFEST_FILE = '.layers.json'
+RENDER_VERSION = 2
+
+# Single-file output: every layer in one SVG, or one sprite-sheet PNG plus a
+# JSON map of where each layer sits in it. The page then loads one image per
+# conversion instead of one per layer. .sheet.json fingerprints the sheet.
+SHEET_FILES = {'svg': ['layers.svg'], 'sprite': ['layers.png', 'layers.json']}
+SHEET_MANIFEST_FILE = '.sheet.json'
 
 # Basic Corne Layout Configuration
 KEY_W = 60
 KEY_H = 60
 GAP = 5
 MARGIN = 10
+TITLE_H = 20 # Space above keys for the layer title (physical layouts only)
 
 def get_key_coords(index):
     # Index 0-41 (42 keys total) based on ZMK Corne definition:
@@ -72,32 +95,85 @@ def get_key_coords(index):
             
     return final_x, final_y
 
+def _coords_from_physical_layout(path):
+    # QMK-style info JSON (x/y in key units), e.g. config/eyelash_corne.json.
+    # Rotations are ignored, keys are drawn axis-aligned at their x/y.
+    with open(path) as f:
+        data = json.load(f)
+    layout = next(iter(data['layouts'].values()))['layout']
+    unit = KEY_W + GAP
+    return [(round(MARGIN + k['x'] * unit), round(MARGIN + TITLE_H + k['y'] * unit)) for k in layout]
+
+def _layout(coords, size=None):
+    if size is None:
+        size = (max(x for x, _ in coords) + KEY_W + MARGIN, max(y for _, y in coords) + KEY_H + MARGIN)
+    # Keys overlapping an earlier key (Corne thumbs vs the staggered bottom row)
+    # get their outline redrawn, since the earlier key's fill covers it on the base image
+    overlapping = {
+        j for j, (xj, yj) in enumerate(coords)
+        for (xi, yi) in coords[:j]
+        if abs(xi - xj) <= KEY_W and abs(yi - yj) <= KEY_H
+    }
+    return {'coords': coords, 'size': size, 'overlapping': overlapping}
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config')
+
+# Key geometry precomputed once per supported layout: (x, y) per binding index + canvas size
+LAYOUTS = {'corne': _layout([tuple(round(v) for v in get_key_coords(i)) for i in range(42)], (900, 350))}
+if os.path.exists(os.path.join(CONFIG_DIR, 'eyelash_corne.json')):
+    LAYOUTS['eyelash_corne'] = _layout(_coords_from_physical_layout(os.path.join(CONFIG_DIR, 'eyelash_corne.json')))
+    # config/totem.keymap binds the same 48-key eyelash matrix (5-way switch in the middle)
+    LAYOUTS['totem'] = LAYOUTS['eyelash_corne']
+
+def detect_layout(keymap_file, layers):
+    # Prefer the layout named after the keymap file, then any layout with
+    # exactly as many keys as the largest layer, otherwise plain Corne.
+    most_keys = max((len(keys) for _, keys in layers), default=0)
+    name = os.path.splitext(os.path.basename(keymap_file))[0]
+    candidates = [name] + list(LAYOUTS) if name in LAYOUTS else list(LAYOUTS)
+    for name in candidates:
+        if len(LAYOUTS[name]['coords']) == most_keys:
+            return name
+    return 'corne'
+
+# Binding text -> key label substitutions, applied in one regex pass
+LABEL_REPLACEMENTS = [
+    ("&kp ", ""), 
+    ("&trans", ""), 
+    ("&none", ""), 
+    ("LSHIFT", "Shift"), ("RSHIFT", "Shift"), 
+    ("LCTRL", "Ctrl"), ("RCTRL", "Ctrl"),
+    ("LALT", "Alt"), ("RALT", "Alt"), 
+    ("LGUI", "Gui"), ("RGUI", "Gui"),
+    ("BSPC", "Bksp"), ("SPACE", "Spc"), ("RET", "Ent"), ("ESC", "Esc"),
+    ("TAB", "Tab"), ("SQT", "'"), ("SEMI", ";"), ("COMMA", ","), ("DOT", "."),
+    ("FSLH", "/"), ("BSLH", "\\"), ("LBKT", "["), ("RBKT", "]"),
+    ("MINUS", "-"), ("EQUAL", "="), ("GRAVE", "`"), ("TILDE", "~"),
+    ("PG_UP", "PgUp"), ("PG_DN", "PgDn"), ("PSCRN", "PrtSc"),
+    ("C_VOL_UP", "Vol+"), ("C_VOL_DN", "Vol-"), ("C_MUTE", "Mute"),
+    ("C_PP", "Play"), ("C_NEXT", "Next"), ("C_PREV", "Prev"),
+    ("&mkp LCLK", "Click L"), ("&mkp RCLK", "Click R"), ("&mkp MCLK", "Click M"),
+    ("&msc SCRL_UP", "Scrl ^"), ("&msc SCRL_DOWN", "Scrl v"),
+    ("&mmv MOVE_UP", "Ms ^"), ("&mmv MOVE_DOWN", "Ms v"), 
+    ("&mmv MOVE_LEFT", "Ms <"), ("&mmv MOVE_RIGHT", "Ms >"),
+    ("LC(", "C-"), ("LS(", "S-"), ("LA(", "A-"), ("LG(", "G-"), (")", "")
+]
+_LABEL_SUBS = dict(LABEL_REPLACEMENTS)
+_LABEL_RE = re.compile('|'.join(re.escape(old) for old, _ in LABEL_REPLACEMENTS))
+
+def replace_labels(text):
+    # Scans left to right, replacing at each position the first listed
+    # pattern that matches there; replaced text is never rescanned. That only
+    # differs from applying LABEL_REPLACEMENTS one after another when matches
+    # overlap ("C_NEXTAB": sequential turns TAB into Tab first), which no
+    # ZMK binding the converter writes does.
+    return _LABEL_RE.sub(lambda m: _LABEL_SUBS[m.group(0)], text)
+
+# Bindings repeat across keys, layers and conversions, so each distinct one is cleaned once
+@functools.lru_cache(maxsize=4096)
 def clean_label(keycode):
     k = keycode.strip()
     
-    # Define replacements for common parts
-    replacements = [
-        ("&kp ", ""), 
-        ("&trans", ""), 
-        ("&none", ""), 
-        ("LSHIFT", "Shift"), ("RSHIFT", "Shift"), 
-        ("LCTRL", "Ctrl"), ("RCTRL", "Ctrl"),
-        ("LALT", "Alt"), ("RALT", "Alt"), 
-        ("LGUI", "Gui"), ("RGUI", "Gui"),
-        ("BSPC", "Bksp"), ("SPACE", "Spc"), ("RET", "Ent"), ("ESC", "Esc"),
-        ("TAB", "Tab"), ("SQT", "'"), ("SEMI", ";"), ("COMMA", ","), ("DOT", "."),
-        ("FSLH", "/"), ("BSLH", "\\"), ("LBKT", "["), ("RBKT", "]"),
-        ("MINUS", "-"), ("EQUAL", "="), ("GRAVE", "`"), ("TILDE", "~"),
-        ("PG_UP", "PgUp"), ("PG_DN", "PgDn"), ("PSCRN", "PrtSc"),
-        ("C_VOL_UP", "Vol+"), ("C_VOL_DN", "Vol-"), ("C_MUTE", "Mute"),
-        ("C_PP", "Play"), ("C_NEXT", "Next"), ("C_PREV", "Prev"),
-        ("&mkp LCLK", "Click L"), ("&mkp RCLK", "Click R"), ("&mkp MCLK", "Click M"),
-        ("&msc SCRL_UP", "Scrl ^"), ("&msc SCRL_DOWN", "Scrl v"),
-        ("&mmv MOVE_UP", "Ms ^"), ("&mmv MOVE_DOWN", "Ms v"), 
-        ("&mmv MOVE_LEFT", "Ms <"), ("&mmv MOVE_RIGHT", "Ms >"),
-        ("LC(", "C-"), ("LS(", "S-"), ("LA(", "A-"), ("LG(", "G-"), (")", "")
-    ]
-    
     # Logic for Layer Taps and Mod Taps
     if k.startswith("&lt "):
         # &lt 1 SPACE
@@ -105,9 +181,7 @@ def clean_label(keycode):
         if len(parts) >= 3:
             layer = parts[1]
             key = parts[2].replace("&kp", "").strip()
-            # Recursively clean the key part if complex? simpler to just Map
-            for old, new in replacements: key = key.replace(old, new)
-            return f"L{layer}\n{key}"
+            return f"L{layer}\n{replace_labels(key)}"
             
     if k.startswith("&mo "):
         return f"L{k.split()[1]}"
@@ -115,98 +189,384 @@ def clean_label(keycode):
     if k.startswith("&to "):
         return f"TO {k.split()[1]}"
         
-    for old, new in replacements:
-        k = k.replace(old, new)
-        
-    return k.strip()
+    return replace_labels(k).strip()
 
-def draw_layers(keymap_file, output_folder):
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-        
-    with open(keymap_file, 'r') as f:
-        content = f.read()
-        
-    # Extract Layers
-    pattern = re.compile(r'(layer_[0-9a-zA-Z_]+)\s*\{\s*bindings\s*=\s*<(.*?)>;', re.DOTALL)
-    matches = pattern.findall(content)
-    
-    generated_files = []
-    
-    for layer_name, bindings_raw in matches:
-        # 1. Remove comments
-        bindings_clean = re.sub(r'/\*.*?\*/', '', bindings_raw, flags=re.DOTALL)
-        
-        # 2. Split by '&' to separate bindings (since all ZMK bindings start with &)
-        # This approach avoids splitting parameters like "&kp SPACE" into two keys.
-        # " &kp A &mo 1 " -> [" ", "kp A ", "mo 1 "]
-        raw_tokens = bindings_clean.split('&')
-        keys = []
-        for t in raw_tokens:
-            if not t.strip(): continue
-            # Add the '&' back
-            keys.append('&' + t.strip())
-            
-        # 3. Draw
-        if len(keys) == 0: continue
-        
-        img_w = 900
-        img_h = 350
-        img = Image.new('RGB', (img_w, img_h), color=(30, 30, 30))
+def load_font():
+    try:
+        return ImageFont.truetype("Arial.ttf", 16)
+    except OSError:
+        # Try specific paths for Mac/Linux if Arial not found default
+        try:
+            return ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 16)
+        except OSError:
+            return ImageFont.load_default()
+
+# Per-process render state, loaded once instead of once per layer
+_font = None
+_base_images = {}
+
+def _init_worker():
+    global _font
+    _font = load_font()
+
+def base_image(layout_name):
+    # Background + every key outline, drawn once per layout and copied per layer
+    if layout_name not in _base_images:
+        layout = LAYOUTS[layout_name]
+        img = Image.new('RGB', layout['size'], color=(30, 30, 30))
         d = ImageDraw.Draw(img)
+        for x, y in layout['coords']:
+            d.rectangle([x, y, x + KEY_W, y + KEY_H], outline=(100, 100, 100))
+        _base_images[layout_name] = img
+    return _base_images[layout_name]
+
+def parse_layers(content):
+    # -> [(layer name, [binding text])] for every layer of the keymap node,
+    # comments dropped and whitespace normalized ("&kp LC(A)")
+    return keymap_dt.parse(content).layer_bindings()
+
+def layer_fingerprint(layer_name, keys, layout_name='corne'):
+    h = hashlib.sha1(f"{RENDER_VERSION}\0{layout_name}\0{layer_name}\0".encode())
+    h.update("\0".join(keys).encode())
+    return h.hexdigest()
+
+def read_manifest(output_folder):
+    try:
+        with open(os.path.join(output_folder, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+def write_manifest(output_folder, manifest):
+    # Delete images for layers that no longer exist
+    for layer_name in read_manifest(output_folder):
+        if layer_name not in manifest:
+            stale = os.path.join(output_folder, f"{layer_name}.png")
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    with atomic_write(os.path.join(output_folder, MANIFEST_FILE)) as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+def key_style(label):
+    # -> (label, key_color, text_color)
+    # Highlight modifiers/layers
+    if "L" in label and len(label) < 4 and label[1:].isdigit(): # L1, L2...
+         return label, (200, 200, 255), (20, 20, 20)
+    elif "TO" in label:
+         return label, (255, 200, 200), (20, 20, 20)
+    elif label == "" or label == "trans": # &trans
+         return "▽", (60, 60, 60), (100, 100, 100)
+    elif label == "X" or label == "&none": # &none
+         return "", (40, 40, 40), (80, 80, 80)
+    return label, (250, 250, 250), (20, 20, 20)
+
+# Pre-rasterized key tiles (fill, outline and centred label) keyed by label,
+# font and colours, so drawing a key is one paste. Bounded: labels are few,
+# but raw unknown bindings are not.
+LABEL_TILE_CACHE_SIZE = 1024
+
+@functools.lru_cache(maxsize=LABEL_TILE_CACHE_SIZE)
+def label_tile(label, font, key_color, text_color, outlined):
+    # -> (RGBA tile, dx, dy) to paste at (x + dx, y + dy). Covers the key and
+    # any label overflow; outside the key only the text is opaque.
+    bbox = ImageDraw.Draw(Image.new('L', (1, 1))).textbbox((0, 0), label, font=font)
+    text_x = (KEY_W - (bbox[2] - bbox[0])) / 2
+    text_y = (KEY_H - (bbox[3] - bbox[1])) / 2
+    left = min(0, math.floor(text_x + bbox[0]))
+    top = min(0, math.floor(text_y + bbox[1]))
+    right = max(KEY_W + 1, math.ceil(text_x + bbox[2]) + 1)
+    bottom = max(KEY_H + 1, math.ceil(text_y + bbox[3]) + 1)
+
+    tile = Image.new('RGBA', (right - left, bottom - top), (0, 0, 0, 0))
+    d = ImageDraw.Draw(tile)
+    # shape (otherwise the outline is already on the base image)
+    if outlined:
+        d.rectangle([-left, -top, KEY_W - left, KEY_H - top], fill=key_color, outline=(100, 100, 100))
+    else:
+        d.rectangle([1 - left, 1 - top, KEY_W - 1 - left, KEY_H - 1 - top], fill=key_color)
+    d.text((text_x - left, text_y - top), label, fill=text_color, font=font)
+    return tile, left, top
+
+def draw_layer_image(layer_name, keys, layout_name='corne'):
+    if _font is None:
+        _init_worker()
+    font = _font
+    coords = LAYOUTS[layout_name]['coords']
+    overlapping = LAYOUTS[layout_name]['overlapping']
+
+    img = base_image(layout_name).copy()
         
-        try:
-            font = ImageFont.truetype("Arial.ttf", 16)
-        except:
-            # Try specific paths for Mac/Linux if Arial not found default
-            try:
-                font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 16)
-            except:
-                font = ImageFont.load_default()
-            
-        for i, key in enumerate(keys):
-            if i >= 42: break 
-            
-            x, y = get_key_coords(i)
-            label = clean_label(key)
-            
-            # Key Style
-            key_color = (250, 250, 250)
-            text_color = (20, 20, 20)
-            
-            # Highlight modifiers/layers
-            if "L" in label and len(label) < 4 and label[1:].isdigit(): # L1, L2...
-                 key_color = (200, 200, 255)
-            elif "TO" in label:
-                 key_color = (255, 200, 200)
-            elif label == "" or label == "trans": # &trans
-                 key_color = (60, 60, 60)
-                 text_color = (100, 100, 100)
-                 label = "▽"
-            elif label == "X" or label == "&none": # &none
-                 key_color = (40, 40, 40)
-                 text_color = (80, 80, 80)
-                 label = ""
-                 
-            # shape
-            rect = [x, y, x + KEY_W, y + KEY_H]
-            d.rectangle(rect, fill=key_color, outline=(100, 100, 100))
-            
-            # text
-            bbox = d.textbbox((0,0), label, font=font)
-            text_w = bbox[2] - bbox[0]
-            text_h = bbox[3] - bbox[1]
-            d.text((x + (KEY_W - text_w)/2, y + (KEY_H - text_h)/2), label, fill=text_color, font=font)
-            
-        # Draw Layer Title
-        d.text((10, 10), layer_name.upper().replace('_', ' '), fill=(255, 255, 255), font=font)
+    for i, key in enumerate(keys):
+        if i >= len(coords): break 
         
-        filename = f"{layer_name}.png"
-        path = os.path.join(output_folder, filename)
-        img.save(path)
-        generated_files.append(filename)
+        x, y = coords[i]
+        label, key_color, text_color = key_style(clean_label(key))
+        tile, dx, dy = label_tile(label, font, key_color, text_color, i in overlapping)
+        img.paste(tile, (x + dx, y + dy), tile)
         
+    # Draw Layer Title
+    ImageDraw.Draw(img).text((10, 10), layer_name.upper().replace('_', ' '), fill=(255, 255, 255), font=font)
+    return img
+
+def render_layer(layer_name, keys, output_folder, layout_name='corne'):
+    img = draw_layer_image(layer_name, keys, layout_name)
+    filename = f"{layer_name}.png"
+    with atomic_write(os.path.join(output_folder, filename), 'wb') as f:
+        img.save(f, format='PNG')
+    return filename
+
+# Long-lived worker pool so fonts/geometry are loaded once per worker, not per request.
+# Workers come from a forkserver (spawn where there is none), never a plain fork
+# of this process: the web server's threads may hold locks mid-fork.
+_pool = None
+_pool_lock = threading.Lock()
+
+def _pool_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+def _get_pool(workers=None):
+    # Several request threads can get here at once; only one creates the pool
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(), initializer=_init_worker)
+        return _pool
+
+def _run_parallel(fn, calls, workers=None):
+    # -> [fn(*args) for args in calls] computed on the process pool, or None if
+    # the pool broke (e.g. a worker killed by the OS) and the caller should go serial
+    global _pool
+    pool = _get_pool(workers)
+    try:
+        futures = [pool.submit(fn, *args) for args in calls]
+        return [f.result() for f in futures]
+    except BrokenProcessPool:
+        # Shut the broken pool down and start fresh next time, unless another
+        # thread already replaced it
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        return None
+
+def draw_layers(keymap_file, output_folder, parallel=False, workers=None, force=False, layout=None):
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+        
+    layers = keymap_dt.load_layers(keymap_file)
+    layout = layout or detect_layout(keymap_file, layers)
+    generated_files = [f"{name}.png" for name, _ in layers]
+
+    # Only redraw layers whose bindings changed since the last run
+    previous = {} if force else read_manifest(output_folder)
+    manifest = {name: layer_fingerprint(name, keys, layout) for name, keys in layers}
+    todo = [
+        (name, keys) for name, keys in layers
+        if previous.get(name) != manifest[name] or not os.path.exists(os.path.join(output_folder, f"{name}.png"))
+    ]
+
+    # Render layers across the process pool, return once every PNG is written
+    rendered = False
+    if parallel and len(todo) > 1:
+        rendered = _run_parallel(render_layer, [(name, keys, output_folder, layout) for name, keys in todo], workers) is not None
+
+    if not rendered:
+        for name, keys in todo:
+            render_layer(name, keys, output_folder, layout)
+
+    write_manifest(output_folder, manifest)
+    return generated_files
+
+# SVG sheet, in the style of the keymap-drawer/ SVGs the CI workflow generates:
+# one <g class="layer-..."> per layer, key groups centred on their position with
+# a side rect, a top rect and tap/hold text, styled by the same CSS classes.
+SVG_LABEL_H = 36 # Layer header above each layer's keys
+SVG_STYLE = """svg.keymap {
+    font-family: Ubuntu Mono, Inconsolata, Consolas, Liberation Mono, Menlo, monospace;
+    font-size: 12px;
+    font-weight: bold;
+    text-rendering: optimizeLegibility;
+    fill: #24292e;
+}
+rect.key {
+    fill: #f6f8fa;
+    stroke: #c9cccf;
+    stroke-width: 1;
+}
+rect.side {
+    filter: brightness(90%);
+}
+rect.held {
+    fill: #ffc;
+}
+rect.ghost {
+    stroke-dasharray: 4, 4;
+    stroke-width: 2;
+}
+text {
+    text-anchor: middle;
+    dominant-baseline: middle;
+}
+text.label {
+    font-weight: bold;
+    text-anchor: start;
+    stroke: white;
+    stroke-width: 4;
+    paint-order: stroke;
+}
+text.hold {
+    font-size: 11px;
+    dominant-baseline: auto;
+}
+text.layer-activator {
+    text-decoration: underline;
+}
+text.trans {
+    fill: #7b7e81;
+}"""
+
+def svg_key_label(key):
+    # -> (tap, hold, classes) for one binding, from the same labels the PNGs use
+    label = clean_label(key)
+    hold = ''
+    if '\n' in label: # &lt: layer on hold, key on tap
+        hold, label = label.split('\n', 1)
+    shown, _, _ = key_style(label)
+    if shown == "▽":
+        return shown, hold, 'trans'
+    if not shown:
+        return '', hold, 'ghost' if key.strip() == '&none' else ''
+    if key.startswith(('&mo ', '&to ', '&tog ')):
+        return shown, hold, 'layer-activator'
+    return shown, hold, ''
+
+@functools.lru_cache(maxsize=None)
+def _svg_key_body(tap, hold, classes, held):
+    # Shared glyph cache: everything inside a key group except its position,
+    # so a label that repeats across keys and layers is formatted once
+    half_w, half_h = KEY_W / 2 - 2, KEY_H / 2 - 2
+    rect_class = ' '.join(c for c in ('key', classes if classes == 'trans' else '', 'held' if held else '') if c)
+    ghost = ' ghost' if classes == 'ghost' else ''
+    parts = [
+        f'<rect rx="6" ry="6" x="{-half_w:g}" y="{-half_h:g}" width="{2 * half_w:g}" height="{2 * half_h:g}" class="{rect_class} side{ghost}"/>',
+        f'<rect rx="4" ry="4" x="{-half_w + 6:g}" y="{-half_h + 2:g}" width="{2 * half_w - 12:g}" height="{2 * half_h - 12:g}" class="{rect_class}{ghost}"/>',
+    ]
+    if tap:
+        text_class = ' '.join(c for c in ('key', classes if classes in ('trans', '') else '', 'tap',
+                                          classes if classes == 'layer-activator' else '') if c)
+        parts.append(f'<text x="0" y="-4" class="{text_class}">{html.escape(tap)}</text>')
+    if hold:
+        parts.append(f'<text x="0" y="{half_h - 2:g}" class="key hold">{html.escape(hold)}</text>')
+    return '\n'.join(parts)
+
+def held_positions(layers):
+    # -> {layer index: positions of the keys that hold it down} (&mo N / &lt N on other layers)
+    held = {}
+    for i, (_, keys) in enumerate(layers):
+        for pos, key in enumerate(keys):
+            parts = key.split()
+            if len(parts) >= 2 and parts[0] in ('&mo', '&lt') and parts[1].isdigit() and int(parts[1]) != i:
+                held.setdefault(int(parts[1]), set()).add(pos)
+    return held
+
+def layers_svg(layers, layout_name='corne'):
+    coords = LAYOUTS[layout_name]['coords']
+    width, height = LAYOUTS[layout_name]['size']
+    block_h = SVG_LABEL_H + height
+    total_h = block_h * len(layers)
+    held = held_positions(layers)
+
+    out = [f'<svg width="{width}" height="{total_h}" viewBox="0 0 {width} {total_h}" class="keymap" '
+           'xmlns="http://www.w3.org/2000/svg">',
+           f'<style>{SVG_STYLE}</style>']
+    for i, (layer_name, keys) in enumerate(layers):
+        out.append(f'<g transform="translate(0, {i * block_h})" class="layer-{html.escape(layer_name)}">')
+        out.append(f'<text x="{MARGIN}" y="{SVG_LABEL_H // 2 + 4}" class="label" id="{html.escape(layer_name)}">'
+                   f'{html.escape(layer_name)}:</text>')
+        out.append(f'<g transform="translate(0, {SVG_LABEL_H})">')
+        for pos, key in enumerate(keys[:len(coords)]):
+            x, y = coords[pos]
+            body = _svg_key_body(*svg_key_label(key), pos in held.get(i, ()))
+            out.append(f'<g transform="translate({x + KEY_W / 2:g}, {y + KEY_H / 2:g})" class="key keypos-{pos}">\n{body}\n</g>')
+        out.append('</g>\n</g>')
+    out.append('</svg>\n')
+    return '\n'.join(out)
+
+def sprite_sheet(layers, layout_name='corne', parallel=False, workers=None):
+    # -> (PIL image with the layer images stacked top to bottom, offset map)
+    width, height = LAYOUTS[layout_name]['size']
+    calls = [(name, keys, layout_name) for name, keys in layers]
+    images = _run_parallel(draw_layer_image, calls, workers) if parallel and len(calls) > 1 else None
+    if images is None:
+        images = [draw_layer_image(*args) for args in calls]
+
+    sheet = Image.new('RGB', (width, height * len(layers)))
+    offsets = []
+    for i, ((name, _), img) in enumerate(zip(layers, images)):
+        sheet.paste(img, (0, i * height))
+        offsets.append({'name': name, 'x': 0, 'y': i * height, 'w': width, 'h': height})
+    return sheet, {'layout': layout_name, 'size': [width, height * len(layers)], 'layers': offsets}
+
+def sheet_fingerprint(fmt, layers, layout_name):
+    h = hashlib.sha1(f"{RENDER_VERSION}\0{fmt}\0{layout_name}\0".encode())
+    for name, keys in layers:
+        h.update(layer_fingerprint(name, keys, layout_name).encode())
+    return h.hexdigest()
+
+def read_sheet_manifest(output_folder):
+    try:
+        with open(os.path.join(output_folder, SHEET_MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+def write_sheet_manifest(output_folder, manifest):
+    with atomic_write(os.path.join(output_folder, SHEET_MANIFEST_FILE)) as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+def read_sprite_map(output_folder):
+    with open(os.path.join(output_folder, SHEET_FILES['sprite'][1])) as f:
+        return json.load(f)
+
+def draw_sheet(keymap_file, output_folder, fmt='svg', parallel=False, workers=None, force=False, layout=None):
+    # -> generated file names (SHEET_FILES[fmt]); redrawn only when a layer changed
+    os.makedirs(output_folder, exist_ok=True)
+    layers = keymap_dt.load_layers(keymap_file)
+    layout = layout or detect_layout(keymap_file, layers)
+    generated_files = SHEET_FILES[fmt]
+
+    fingerprint = sheet_fingerprint(fmt, layers, layout)
+    up_to_date = all(os.path.exists(os.path.join(output_folder, name)) for name in generated_files)
+    if not force and up_to_date and read_sheet_manifest(output_folder).get(fmt) == fingerprint:
+        return generated_files
+
+    if fmt == 'svg':
+        with atomic_write(os.path.join(output_folder, generated_files[0])) as f:
+            f.write(layers_svg(layers, layout))
+    else:
+        sheet, sprite_map = sprite_sheet(layers, layout, parallel, workers)
+        with atomic_write(os.path.join(output_folder, generated_files[0]), 'wb') as f:
+            sheet.save(f, format='PNG')
+        with atomic_write(os.path.join(output_folder, generated_files[1])) as f:
+            json.dump(sprite_map, f, indent=2)
+
+    # One file set per conversion: drop per-layer PNGs from an earlier draw_layers
+    write_manifest(output_folder, {})
+    write_sheet_manifest(output_folder, {fmt: fingerprint})
     return generated_files
 
 if __name__ == "__main__":
-    draw_layers("config/corne.keymap", "static/images")
+    import argparse
+    parser = argparse.ArgumentParser(description="Render keymap layers to images")
+    parser.add_argument('keymap', nargs='?', default="config/corne.keymap")
+    parser.add_argument('output', nargs='?', default="static/images")
+    parser.add_argument('--sheet', choices=list(SHEET_FILES), help="One SVG or sprite-sheet PNG instead of a PNG per layer")
+    args = parser.parse_args()
+    if args.sheet:
+        print(draw_sheet(args.keymap, args.output, args.sheet, parallel=True))
+    else:
+        draw_layers(args.keymap, args.output, parallel=True)
@@ -0,0 +1,162 @@
+import argparse
+import os
+import sys
+import time
+import uf2
+import mount_watcher
+from atomic_io import FileLock, LockBusy
+
+# Flashes the halves of a build one after the other without a click per side:
+# wait for the bootloader drive, copy the UF2 in fsync'd chunks while
+# reporting progress, wait for the drive to detach (the bootloader resets
+# once it has the whole image), then go straight on to the next half.
+#   python3 flash_session.py [--build firmware_latest] [left right]
+FIRMWARE_DIR = 'firmware_latest'
+BUILDS_DIR = 'builds'
+SIDES = ('left', 'right')
+
+COPY_CHUNK = 64 * 1024
+MOUNT_TIMEOUT = 300 # Per half: time to plug it in and double-tap reset
+SETTLE_TIMEOUT = 0.5 # Upper bound on waiting for a drive that is mounted but not yet writable
+DETACH_TIMEOUT = 30
+INFO_FILE = 'INFO_UF2.TXT'
+
+flash_lock = FileLock('flash') # One drive, one session at a time
+
+class FlashError(Exception):
+    pass
+
+def firmware_dir(build):
+    if build == FIRMWARE_DIR or not build:
+        return FIRMWARE_DIR
+    return os.path.join(BUILDS_DIR, build)
+
+def firmware_file(build, side):
+    return os.path.join(firmware_dir(build), f"corne_{side}.uf2")
+
+def copy_uf2(source, dest, progress=None):
+    # Chunked copy with fsync -> bytes written. The bootloader may reset and
+    # drop the drive as soon as the last block lands, so failing to flush or
+    # close after every byte was written still counts as a complete copy.
+    total = os.path.getsize(source)
+    written = 0
+    out = open(dest, 'wb')
+    try:
+        with open(source, 'rb') as f:
+            while True:
+                chunk = f.read(COPY_CHUNK)
+                if not chunk:
+                    break
+                out.write(chunk)
+                written += len(chunk)
+                if progress:
+                    progress(written, total)
+        out.flush()
+        os.fsync(out.fileno())
+    except OSError:
+        if written < total:
+            raise
+    finally:
+        try:
+            out.close()
+        except OSError:
+            if written < total:
+                raise
+    return written
+
+def settled(path):
+    # A mount directory can appear before the filesystem is mounted on it:
+    # usable once INFO_UF2.TXT is there, or it's a writable mount point
+    if os.path.exists(os.path.join(path, INFO_FILE)):
+        return True
+    return os.path.ismount(path) and os.access(path, os.W_OK)
+
+def wait_settled(watcher, timeout=SETTLE_TIMEOUT):
+    # -> True once the drive is usable, False if we gave up waiting (the copy is tried anyway)
+    deadline = time.monotonic() + timeout
+    while not settled(watcher.path):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+def run_session(build=FIRMWARE_DIR, sides=SIDES, watcher=None, family=uf2.DEFAULT_FAMILY, report=None,
+                mount_timeout=MOUNT_TIMEOUT, detach_timeout=DETACH_TIMEOUT):
+    # -> per-side results. report(dict) gets every step: side, stage
+    # (waiting/copying/detaching/done), and bytes/total while copying.
+    watcher = watcher or mount_watcher.from_config()
+    report = report or (lambda status: None)
+
+    # Check every image up front so a bad right half doesn't stop us after the left one
+    sources = {}
+    for side in sides:
+        sources[side] = firmware_file(build, side)
+        try:
+            uf2.check(sources[side], family)
+        except uf2.UF2Error as e:
+            raise FlashError(f"{os.path.basename(sources[side])}: {e}") from None
+
+    try:
+        lock = flash_lock.acquire(blocking=False)
+    except LockBusy:
+        raise FlashError("Another flashing session is running") from None
+    try:
+        results = []
+        for side in sides:
+            started = time.monotonic()
+            # The previous half's drive is already confirmed gone, so this is the next one
+            report({'side': side, 'stage': 'waiting', 'path': watcher.path})
+            if not watcher.wait(mounted=True, timeout=mount_timeout):
+                raise FlashError(f"Timed out waiting for the {side} half's {watcher.volume} drive")
+            wait_settled(watcher)
+
+            source = sources[side]
+            dest = os.path.join(watcher.path, os.path.basename(source))
+            try:
+                written = copy_uf2(source, dest, lambda done, total: report(
+                    {'side': side, 'stage': 'copying', 'bytes': done, 'total': total}))
+            except OSError as e:
+                raise FlashError(f"Copying to the {side} half failed: {e}") from None
+
+            report({'side': side, 'stage': 'detaching'})
+            if not watcher.wait(mounted=False, timeout=detach_timeout):
+                raise FlashError(f"The {side} half didn't reset after the copy, the bootloader may have rejected the image")
+
+            result = {'side': side, 'stage': 'done', 'bytes': written, 'seconds': round(time.monotonic() - started, 1)}
+            report(result)
+            results.append(result)
+        return results
+    finally:
+        flash_lock.release(lock)
+
+def print_status(status):
+    side = status['side'].upper()
+    if status['stage'] == 'waiting':
+        print(f"  {side}: connect it and double-tap reset (waiting for {status['path']})...")
+    elif status['stage'] == 'copying':
+        end = "\n" if status['bytes'] == status['total'] else ""
+        print(f"\r  {side}: copying {status['bytes'] * 100 // status['total']:3d}%", end=end, flush=True)
+    elif status['stage'] == 'detaching':
+        print(f"  {side}: waiting for the drive to detach...")
+    elif status['stage'] == 'done':
+        print(f"  {side}: done ({status['seconds']}s)")
+
+def main(argv=None, default_sides=SIDES):
+    parser = argparse.ArgumentParser(description="Flash keyboard halves one after the other")
+    parser.add_argument('sides', nargs='*', help=f"Halves in flashing order, default {' '.join(default_sides)}")
+    parser.add_argument('--build', default=FIRMWARE_DIR, help="builds/ folder name, default firmware_latest")
+    args = parser.parse_args(argv)
+    sides = args.sides or list(default_sides)
+    if any(side not in SIDES for side in sides):
+        parser.error(f"sides must be {' or '.join(SIDES)}")
+
+    print(f"--- Flashing {' then '.join(s.upper() for s in sides)} using {firmware_dir(args.build)} ---")
+    try:
+        run_session(args.build, sides, report=print_status)
+    except FlashError as e:
+        print(f"  Error: {e}")
+        sys.exit(1)
+    print("  Done! All halves updated.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import json
+import multiprocessing
+import os
+
+# Production server settings: `./serve.sh` (gunicorn -c gunicorn.conf.py app:app).
+# nginx (deploy/nginx.conf) sits in front and serves static/ and the UF2
+# files itself, so workers only see the dynamic routes.
+#
+# Graceful restart (reload code, finish in-flight requests): kill -HUP $(cat .cache/gunicorn.pid)
+# Graceful stop: kill -TERM $(cat .cache/gunicorn.pid)
+
+def _config():
+    try:
+        with open('config.json') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+_cfg = _config()
+
+bind = os.environ.get('BIND', f"127.0.0.1:{_cfg.get('port', 5000)}")
+
+# Threaded workers: the SSE log stream holds a connection open for the whole
+# build, which would pin a sync worker. Layer rendering already fans out to
+# draw_keymap's process pool, so a few workers are enough.
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_WORKERS', _cfg.get('workers', min(4, multiprocessing.cpu_count()))))
+threads = int(os.environ.get('WEB_THREADS', _cfg.get('threads', 8)))
+
+# Background jobs (job_queue.py) and local builds run on threads inside the
+# worker that started them, so never recycle workers on a request count, and
+# give them time on shutdown. Pushed builds are recorded in .cache/builds.sqlite3
+# and another worker takes them over within a minute if theirs goes away.
+max_requests = 0
+timeout = 120 # Requests only queue work now; this is for large uploads on slow links
+graceful_timeout = 60
+keepalive = 5
+
+pidfile = '.cache/gunicorn.pid'
+os.makedirs(os.path.dirname(pidfile), exist_ok=True)
+accesslog = '-'
+errorlog = '-'
+loglevel = 'info'
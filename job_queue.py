@@ -0,0 +1,144 @@
+import concurrent.futures
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Background jobs for work that shouldn't hold an HTTP request open: converting
+# and rendering a .vil, publishing and pushing a build. Routes enqueue and return
+# a job id right away; clients poll /jobs/<id> or subscribe to /jobs/<id>/events.
+# Job state lives in SQLite so every WSGI worker process can report on a job,
+# whichever worker's thread pool is running it.
+JOBS_DB = '.cache/jobs.sqlite3'
+JOB_MAX_AGE = 7 * 24 * 3600 # Finished jobs older than this are dropped on startup
+SCHEMA_VERSION = 2 # Bump when the jobs table changes; jobs are transient, so it is recreated
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+FINISHED = (DONE, FAILED)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT,
+    state TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    progress TEXT,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs(created);
+"""
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _to_job(row):
+    job = dict(row)
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    job['progress'] = json.loads(job['progress']) if job['progress'] else None
+    del job['pid']
+    return job
+
+class JobQueue:
+    def __init__(self, db_path=JOBS_DB, workers=2):
+        self.db_path = db_path
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._current = threading.local()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        with self._connect() as db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                db.execute("DROP TABLE IF EXISTS jobs")
+                db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            db.executescript(SCHEMA)
+            self._recover(db)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One short-lived connection per call, committed on success and always closed
+        db = sqlite3.connect(self.db_path, timeout=10)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _recover(self, db):
+        # Jobs owned by a process that is gone (restart, crash) will never finish
+        now = time.time()
+        stale = [(now, r['id']) for r in db.execute("SELECT id, pid FROM jobs WHERE state IN (?, ?)", (QUEUED, RUNNING))
+                 if not _alive(r['pid'])]
+        db.executemany(f"UPDATE jobs SET state = '{FAILED}', finished = ?, error = 'Interrupted by a server restart' "
+                       "WHERE id = ?", stale)
+        db.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (now - JOB_MAX_AGE,))
+
+    def _update(self, job_id, **fields):
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with self._connect() as db:
+            db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def submit(self, kind, fn, *args, owner=None, **kwargs):
+        # -> job id. fn runs on the pool; its return value (JSON-serialisable) is the job result
+        job_id = uuid.uuid4().hex
+        with self._connect() as db:
+            db.execute("INSERT INTO jobs (id, kind, owner, state, pid, created) VALUES (?, ?, ?, ?, ?, ?)",
+                       (job_id, kind, owner, QUEUED, os.getpid(), time.time()))
+        self._pool.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update(job_id, state=RUNNING, started=time.time())
+        self._current.job_id = job_id
+        try:
+            # Recording the result is part of the job: a result that won't
+            # serialise or a failed write must fail it, not leave it running
+            result = json.dumps(fn(*args, **kwargs))
+            self._update(job_id, state=DONE, finished=time.time(), result=result)
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            try:
+                self._update(job_id, state=FAILED, finished=time.time(), error=str(e) or type(e).__name__)
+            except Exception:
+                logger.exception("Could not record the failure of job %s", job_id)
+        finally:
+            self._current.job_id = None
+
+    def report(self, progress):
+        # Called from inside a job: record its progress (JSON-serialisable) for pollers
+        job_id = getattr(self._current, 'job_id', None)
+        if job_id:
+            self._update(job_id, progress=json.dumps(progress))
+
+    def get(self, job_id):
+        # -> job dict, or None for an unknown id
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _to_job(row) if row else None
+
+    def list(self, owner=None, limit=50):
+        # -> newest first, optionally only one session's jobs
+        sql = "SELECT * FROM jobs"
+        params = []
+        if owner is not None:
+            sql += " WHERE owner = ?"
+            params.append(owner)
+        sql += " ORDER BY created DESC LIMIT ?"
+        with self._connect() as db:
+            rows = db.execute(sql, (*params, limit)).fetchall()
+        return [_to_job(r) for r in rows]
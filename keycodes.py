@@ -0,0 +1,232 @@
+import functools
+import hashlib
+import json
+import re
+
+# Shared QMK/Vial -> ZMK keycode translator used by app.py and convert_vil.py.
+# Keycode strings are tokenized once and every result is memoized, so a whole
+# template (a few hundred distinct codes) is mostly cache hits.
+
+# Mapping QMK/VIAL keycodes to ZMK
+KEY_MAP = {
+    "KC_TRNS": "&trans",
+    "KC_NO": "&none",
+    "KC_ENT": "&kp RET",
+    "KC_ENTER": "&kp RET",
+    "KC_BSPACE": "&kp BSPC",
+    "KC_SPC": "&kp SPACE",
+    "KC_SPACE": "&kp SPACE",
+    "KC_MINUS": "&kp MINUS",
+    "KC_EQUAL": "&kp EQUAL",
+    "KC_LBRC": "&kp LBKT",
+    "KC_LBRACKET": "&kp LBKT",
+    "KC_RBRC": "&kp RBKT",
+    "KC_RBRACKET": "&kp RBKT",
+    "KC_BSLASH": "&kp BSLH",
+    "KC_SCOLON": "&kp SEMI",
+    "KC_QUOTE": "&kp SQT",
+    "KC_GRAVE": "&kp GRAVE",
+    "KC_COMMA": "&kp COMMA",
+    "KC_DOT": "&kp DOT",
+    "KC_SLASH": "&kp FSLH",
+    "KC_CAPS": "&kp CAPS",
+    "KC_LCTRL": "&kp LCTRL",
+    "KC_LSHIFT": "&kp LSHIFT",
+    "KC_LALT": "&kp LALT",
+    "KC_LGUI": "&kp LGUI",
+    "KC_RCTRL": "&kp RCTRL",
+    "KC_RSHIFT": "&kp RSHIFT",
+    "KC_RALT": "&kp RALT",
+    "KC_RGUI": "&kp RGUI",
+    "KC_APP": "&kp K_APP",
+    "KC_ESC": "&kp ESC",
+    "KC_GESC": "&kp ESC", # Graze ESC
+    "KC_TAB": "&kp TAB",
+    "KC_UP": "&kp UP",
+    "KC_DOWN": "&kp DOWN",
+    "KC_LEFT": "&kp LEFT",
+    "KC_RIGHT": "&kp RIGHT",
+    "KC_PGUP": "&kp PG_UP",
+    "KC_PGDOWN": "&kp PG_DN",
+    "KC_HOME": "&kp HOME",
+    "KC_END": "&kp END",
+    "KC_INS": "&kp INS",
+    "KC_DEL": "&kp DEL",
+    "KC_DELETE": "&kp DEL",
+    "KC_PSCR": "&kp PSCRN",
+    "KC_SLCK": "&kp SLCK",
+    "KC_PAUSE": "&kp PAUSE",
+    # Mouse keys
+    "KC_BTN1": "&mkp LCLK",
+    "KC_BTN2": "&mkp RCLK",
+    "KC_BTN3": "&mkp MCLK",
+    "KC_WH_U": "&msc SCRL_UP",
+    "KC_WH_D": "&msc SCRL_DOWN",
+    "KC_WH_L": "&msc SCRL_LEFT",
+    "KC_WH_R": "&msc SCRL_RIGHT",
+    "KC_MS_U": "&mmv MOVE_UP",
+    "KC_MS_D": "&mmv MOVE_DOWN",
+    "KC_MS_L": "&mmv MOVE_LEFT",
+    "KC_MS_R": "&mmv MOVE_RIGHT",
+    # Media
+    "KC_MPLY": "&kp C_PP",
+    "KC_MUTE": "&kp C_MUTE",
+    "KC_VOLD": "&kp C_VOL_DN",
+    "KC__VOLDOWN": "&kp C_VOL_DN",
+    "KC_VOLU": "&kp C_VOL_UP",
+    "KC__VOLUP": "&kp C_VOL_UP",
+    "KC_MNXT": "&kp C_NEXT",
+    "KC_MPRV": "&kp C_PREV",
+    "KC_MSTP": "&kp C_STOP",
+    "KC_MFFD": "&kp C_FF",
+    "KC_MRWD": "&kp C_RW",
+    "KC_BRIU": "&kp C_BRI_UP",
+    "KC_BRID": "&kp C_BRI_DN",
+    # Editing
+    "KC_UNDO": "&kp LC(Z)",
+    "KC_CUT": "&kp LC(X)",
+    "KC_COPY": "&kp LC(C)",
+    "KC_PSTE": "&kp LC(V)",
+    "KC_AGIN": "&kp LC(Y)",
+    # Keypad
+    "KC_KP_PLUS": "&kp KP_PLUS",
+    "KC_KP_ASTERISK": "&kp KP_MULTIPLY",
+    "KC_KP_MINUS": "&kp KP_MINUS",
+    "KC_KP_SLASH": "&kp KP_SLASH",
+    "KC_KP_EQUAL": "&kp KP_EQUAL",
+    "KC_KP_DOT": "&kp KP_DOT",
+    "KC_KP_ENTER": "&kp KP_ENTER"
+}
+
+# Modifiers: LCTL(KC_X) -> &kp LC(X)
+# ZMK modifiers are: LS(x), LC(x), LA(x), LG(x)
+MOD_MAP = {
+    "LCTL": "LC", "RCTL": "RC",
+    "LSFT": "LS", "RSFT": "RS",
+    "LALT": "LA", "RALT": "RA",
+    "LGUI": "LG", "RGUI": "RG"
+}
+
+# Bump when the translation rules below change in a way KEY_MAP doesn't show
+TRANSLATOR_REVISION = 2
+KEY_MAP_VERSION = hashlib.sha1(
+    json.dumps([TRANSLATOR_REVISION, KEY_MAP, MOD_MAP], sort_keys=True).encode()
+).hexdigest()[:12]
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_]+|\S")
+_FKEY_RE = re.compile(r"F\d+$")
+_MACRO_RE = re.compile(r"M(\d+)$")
+_UNKNOWN_RE = re.compile(r"&none /\* (.*) \*/$")
+
+def tokenize(qc):
+    # "LT(2, KC_ESC)" -> ["LT", "(", "2", ",", "KC_ESC", ")"]
+    return _TOKEN_RE.findall(qc)
+
+def _parse_expr(tokens, pos):
+    # expr := NAME | NAME '(' expr (',' expr)* ')'
+    if pos >= len(tokens) or tokens[pos] in "(),":
+        raise ValueError("expected keycode name")
+    name = tokens[pos]
+    pos += 1
+    args = []
+    if pos < len(tokens) and tokens[pos] == "(":
+        pos += 1
+        while True:
+            arg, pos = _parse_expr(tokens, pos)
+            args.append(arg)
+            if pos < len(tokens) and tokens[pos] == ",":
+                pos += 1
+                continue
+            if pos < len(tokens) and tokens[pos] == ")":
+                pos += 1
+                break
+            raise ValueError("unbalanced parentheses")
+    return (name, tuple(args)), pos
+
+@functools.lru_cache(maxsize=None)
+def parse(qc):
+    # "LCTL(KC_LALT)" -> ("LCTL", (("KC_LALT", ()),))
+    tokens = tokenize(qc)
+    node, pos = _parse_expr(tokens, 0)
+    if pos != len(tokens):
+        raise ValueError(f"trailing input in {qc!r}")
+    return node
+
+def _source(node):
+    name, args = node
+    if not args:
+        return name
+    return f"{name}({', '.join(_source(a) for a in args)})"
+
+def _key_name(node):
+    # Inner key of a mod/layer-tap: "&kp LC(X)" -> "LC(X)"
+    return _translate_node(node).replace("&kp ", "")
+
+def _translate_node(node):
+    name, args = node
+
+    if not args:
+        if name in KEY_MAP:
+            return KEY_MAP[name]
+
+        # Vial macro M3 -> &macro3 (nodes come from vil_behaviors)
+        macro = _MACRO_RE.match(name)
+        if macro:
+            return f"&macro{macro.group(1)}"
+
+        # Simple KC_ prefix strip for letters/numbers/F-keys
+        if name.startswith("KC_"):
+            suffix = name[3:]
+            if len(suffix) == 1 and suffix.isalnum(): return f"&kp {suffix}"
+            if _FKEY_RE.match(suffix): return f"&kp {suffix}"
+            if suffix.isdigit(): return f"&kp N{suffix}"
+
+        return f"&none /* {name} */"
+
+    # Tap dance TD(0) -> &td0 (nodes come from vil_behaviors)
+    if name == "TD" and len(args) == 1 and args[0][0].isdigit():
+        return f"&td{args[0][0]}"
+
+    # Layer MO(1) -> &mo 1
+    if name == "MO" and len(args) == 1:
+        return f"&mo {_source(args[0])}"
+
+    # Layer Tap LT2(KC_SPACE) -> &lt 2 SPACE, also LT(2, KC_SPACE)
+    if name.startswith("LT"):
+        layer = name[2:]
+        if layer.isdigit() and len(args) == 1:
+            return f"&lt {layer} {_key_name(args[0])}"
+        if not layer and len(args) == 2:
+            return f"&lt {_source(args[0])} {_key_name(args[1])}"
+
+    if name in MOD_MAP and len(args) == 1:
+        return f"&kp {MOD_MAP[name]}({_key_name(args[0])})"
+
+    # Default Layer DF(1) -> &to 1
+    if name == "DF" and len(args) == 1:
+        return f"&to {_source(args[0])}"
+
+    return f"&none /* {_source(node)} */"
+
+@functools.lru_cache(maxsize=None)
+def parse_keycode(qc):
+    if isinstance(qc, int):
+        if qc == -1: return "" # Skip gaps
+        return f"&kp {qc}" # Fallback for raw ints if needed
+
+    # Fast path for the plain codes that make up most of a layout
+    if qc in KEY_MAP:
+        return KEY_MAP[qc]
+
+    try:
+        return _translate_node(parse(qc))
+    except ValueError:
+        return f"&none /* {qc} */"
+
+def parse_layer(layer):
+    # Flatten rows to a simple list of bindings, skipping visual gaps (-1)
+    return [parse_keycode(k) for row in layer for k in row if k != -1]
+
+def unknown_keycodes(bindings):
+    # Source keycodes that had no translation (emitted as "&none /* src */")
+    return [m.group(1) for m in map(_UNKNOWN_RE.match, bindings) if m]
@@ -0,0 +1,431 @@
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+# Parser for ZMK .keymap devicetree source, shared by the drawer, the converter
+# and anything else that needs layers and bindings out of a keymap.
+# One regex pass tokenizes the file (comments, preprocessor lines, strings,
+# &references, punctuation, words), then a recursive-descent pass builds the
+# node tree. Layers are the children of any node with compatible = "zmk,keymap",
+# whatever they are named. Object-like #defines are expanded inside cell arrays.
+#
+# load(path) caches the parsed document by file mtime; when the file changed
+# only inside one node's braces, just that node's body is parsed again.
+
+_TOKEN_RE = re.compile(r'''
+    (?P<ws>\s+)
+  | (?P<comment>/\*.*?\*/|//[^\n]*)
+  | (?P<directive>^[ \t]*\#[ \t]*(?:define|include|undef|if|ifdef|ifndef|elif|else|endif|pragma)\b(?:\\\n|[^\n])*)
+  | (?P<string>"(?:\\.|[^"\\\n])*")
+  | (?P<ref>&[A-Za-z_][\w.-]*)
+  | (?P<punct>[{}<>;=,:()\[\]/])
+  | (?P<word>[^\s{}<>;=,:()\[\]"&/]+)
+  | (?P<other>.)
+''', re.X | re.S | re.M)
+
+_DEFINE_RE = re.compile(r'#\s*define\s+([A-Za-z_]\w*)(\([^)]*\))?[ \t]*((?:\\\n|[^\n])*)')
+MAX_EXPANSION_DEPTH = 8
+
+Token = namedtuple('Token', 'kind text start end')
+
+# Labels ZMK's behaviors.dtsi defines; a keymap has to define anything else it names
+BUILTIN_BEHAVIORS = frozenset({
+    'kp', 'mo', 'lt', 'to', 'tog', 'sl', 'sk', 'mt', 'kt', 'key_toggle', 'none', 'trans', 'bt', 'out',
+    'ext_power', 'rgb_ug', 'bl', 'caps_word', 'key_repeat', 'gresc', 'sys_reset', 'reset', 'bootloader',
+    'soft_off', 'studio_unlock', 'mkp', 'mmv', 'msc', 'macro_tap', 'macro_press', 'macro_release',
+    'macro_tap_time', 'macro_wait_time', 'macro_pause_for_release',
+})
+
+class KeymapSyntaxError(ValueError):
+    pass
+
+class Binding(namedtuple('Binding', 'behavior params')):
+    # &behavior param... e.g. Binding('kp', ('LC(LALT)',)) -> "&kp LC(LALT)"
+    __slots__ = ()
+
+    def __str__(self):
+        return ' '.join(('&' + self.behavior,) + self.params)
+
+Layer = namedtuple('Layer', 'name display_name bindings node')
+
+class Node:
+    # name is "/" for the root, "&label" for an override, otherwise the node name.
+    # props: {name: [values]}, a value being a str (string literal or &ref) or
+    # a list of cells. start/end span the whole node in the source; body_start
+    # and body_end the text between its braces.
+    __slots__ = ('name', 'label', 'props', 'children', 'start', 'end', 'body_start', 'body_end')
+
+    def __init__(self, name, label=None):
+        self.name = name
+        self.label = label
+        self.props = {}
+        self.children = []
+        self.start = self.end = self.body_start = self.body_end = 0
+
+    def __repr__(self):
+        return f"Node({self.name!r}, {len(self.props)} props, {len(self.children)} children)"
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def prop_string(self, name):
+        values = self.props.get(name) or []
+        return values[0][1:-1] if values and isinstance(values[0], str) and values[0].startswith('"') else None
+
+    def bindings(self, prop='bindings'):
+        # -> [Binding] across every <...> array of the property
+        result = []
+        for value in self.props.get(prop) or []:
+            if isinstance(value, list):
+                result.extend(_split_bindings(value))
+        return result
+
+class Keymap:
+    def __init__(self, nodes, defines, text):
+        self.nodes = nodes
+        self.defines = defines # name -> (params or None, body)
+        self.length = len(text)
+
+    def walk(self):
+        for node in self.nodes:
+            yield from node.walk()
+
+    def keymap_nodes(self):
+        return [n for n in self.walk() if n.prop_string('compatible') == 'zmk,keymap']
+
+    def layers(self):
+        return [Layer(child.name, child.prop_string('display-name'), child.bindings(), child)
+                for node in self.keymap_nodes() for child in node.children if 'bindings' in child.props]
+
+    def labels(self):
+        return {n.label for n in self.walk() if n.label}
+
+    def references(self):
+        # -> every &label named in a property or as an override node
+        refs = set()
+        for node in self.walk():
+            if node.name.startswith('&'):
+                refs.add(node.name[1:])
+            for values in node.props.values():
+                for value in values:
+                    cells = value if isinstance(value, list) else [value]
+                    refs.update(c[1:] for c in cells if isinstance(c, str) and c.startswith('&'))
+        return refs
+
+    def undefined_references(self):
+        return self.references() - self.labels() - BUILTIN_BEHAVIORS
+
+    def layer_bindings(self):
+        # -> [(layer name, [binding text])], the shape the drawer works with
+        return [(layer.name, [str(b) for b in layer.bindings]) for layer in self.layers()]
+
+def tokenize(text, start=0, end=None):
+    # -> [Token] without whitespace and comments. With an end, the stretch has
+    # to stand on its own: a comment or string running past end is an error.
+    tokens = []
+    for m in _TOKEN_RE.finditer(text, start):
+        if end is not None and m.start() >= end:
+            break
+        kind = m.lastgroup
+        if end is not None and m.end() > end:
+            line = text.count('\n', 0, m.start()) + 1
+            raise KeymapSyntaxError(f"line {line}: {kind} runs past the end of the region")
+        if kind == 'ws' or kind == 'comment':
+            continue
+        if kind == 'other':
+            line = text.count('\n', 0, m.start()) + 1
+            raise KeymapSyntaxError(f"line {line}: unexpected {m.group()!r}")
+        tokens.append(Token(kind, m.group(), m.start(), m.end()))
+    return tokens
+
+def _collapse(text):
+    return re.sub(r'\s+', '', re.sub(r'/\*.*?\*/', '', text, flags=re.S))
+
+def _split_bindings(cells):
+    # Cells of a <...> array -> Bindings: each &ref starts one, the cells after it are its parameters
+    bindings = []
+    for cell in cells:
+        if cell.startswith('&'):
+            bindings.append(Binding(cell[1:], ()))
+        elif bindings:
+            last = bindings[-1]
+            bindings[-1] = Binding(last.behavior, last.params + (cell,))
+    return bindings
+
+class _Parser:
+    def __init__(self, text, tokens, defines):
+        self.text = text
+        self.tokens = tokens
+        self.pos = 0
+        self.defines = defines
+
+    def error(self, message, token=None):
+        token = token or (self.tokens[self.pos] if self.pos < len(self.tokens) else None)
+        offset = token.start if token else len(self.text)
+        line = self.text.count('\n', 0, offset) + 1
+        found = f"found {token.text!r}" if token else "at end of file"
+        raise KeymapSyntaxError(f"line {line}: {message}, {found}")
+
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            self.error("incomplete input")
+        self.pos += 1
+        return token
+
+    def expect(self, text):
+        token = self.next()
+        if token.text != text:
+            self.error(f"expected {text!r}", token)
+        return token
+
+    def directive(self, token):
+        m = _DEFINE_RE.match(token.text.strip())
+        if m:
+            body = re.sub(r'\\\n', ' ', m.group(3))
+            body = re.sub(r'//[^\n]*$', '', re.sub(r'/\*.*?\*/', '', body, flags=re.S)).strip()
+            self.defines[m.group(1)] = (m.group(2), body)
+
+    def document(self):
+        nodes = []
+        while self.peek() is not None:
+            token = self.peek()
+            if token.kind == 'directive':
+                self.directive(self.next())
+            elif token.text == ';':
+                self.next()
+            else:
+                nodes.append(self.node())
+        return nodes
+
+    def node(self):
+        first = self.peek()
+        label = None
+        if self.peek(1) is not None and self.peek(1).text == ':':
+            label = self.next().text
+            self.next()
+        name = self.next()
+        if name.kind not in ('word', 'ref') and name.text != '/':
+            self.error("expected a node name", name)
+        node = Node(name.text, label)
+        node.start = first.start
+        node.body_start = self.expect('{').end
+        self.body(node)
+        node.body_end = self.expect('}').start
+        node.end = self.expect(';').end
+        return node
+
+    def body(self, node):
+        # Properties and child nodes up to (not including) the closing brace
+        while True:
+            token = self.peek()
+            if token is None or token.text == '}':
+                return
+            if token.kind == 'directive':
+                self.directive(self.next())
+                continue
+            following = self.peek(1)
+            if following is not None and following.text in ('{', ':'):
+                node.children.append(self.node())
+                continue
+            name = self.next()
+            if name.kind not in ('word', 'ref'):
+                self.error("expected a property or node", name)
+            values = []
+            if self.peek() is not None and self.peek().text == '=':
+                self.next()
+                values.append(self.value())
+                while self.peek() is not None and self.peek().text == ',':
+                    self.next()
+                    values.append(self.value())
+            self.expect(';')
+            node.props[name.text] = values
+
+    def value(self):
+        token = self.next()
+        if token.kind in ('string', 'ref'):
+            return token.text
+        if token.text == '<':
+            return self.cells()
+        if token.text == '[':
+            data = []
+            while self.peek() is not None and self.peek().text != ']':
+                data.append(self.next().text)
+            self.expect(']')
+            return data
+        self.error("expected a value", token)
+
+    def cells(self):
+        cells = []
+        while True:
+            token = self.peek()
+            if token is None:
+                self.error("unterminated <...>")
+            if token.text == '>':
+                self.next()
+                return cells
+            cells.extend(self.cell())
+
+    def cell(self, depth=0):
+        # -> one or more cells: a word or &ref with any (...) glued on, or a
+        # #define expanded into its own cells
+        token = self.next()
+        if token.text == '(':
+            return [self.group(token)]
+        if token.kind not in ('word', 'ref'):
+            self.error("unexpected token in <...>", token)
+        text = token.text
+        if self.peek() is not None and self.peek().text == '(' and self.peek().start == token.end:
+            return [text + self.group(self.next())]
+        define = self.defines.get(text)
+        if define and define[0] is None and define[1] and depth < MAX_EXPANSION_DEPTH:
+            return self.expand(define[1], depth + 1)
+        return [text]
+
+    def group(self, opening):
+        # Balanced (...) starting at `opening`, returned as source text without whitespace
+        level = 1
+        while level:
+            token = self.next()
+            if token.text == '(':
+                level += 1
+            elif token.text == ')':
+                level -= 1
+        return _collapse(self.text[opening.start:token.end])
+
+    def expand(self, body, depth):
+        inner = _Parser(body, tokenize(body), self.defines)
+        cells = []
+        while inner.peek() is not None:
+            cells.extend(inner.cell(depth))
+        return cells
+
+def parse(text):
+    # -> Keymap for a whole .keymap source
+    defines = {}
+    parser = _Parser(text, tokenize(text), defines)
+    return Keymap(parser.document(), defines, text)
+
+def parse_bindings(text, defines=None):
+    # "&kp A &lt 1 SPACE" -> [Binding], with the same normalization as in a keymap
+    parser = _Parser(text, tokenize(text), dict(defines or {}))
+    cells = []
+    while parser.peek() is not None:
+        cells.extend(parser.cell())
+    return _split_bindings(cells)
+
+def _common_prefix(a, b):
+    # Binary search on slice equality: the comparisons run in C, not per character in Python
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[low:mid] == b[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+def _changed_region(old, new):
+    # -> (start, old_end, new_end) of the one edited stretch of text
+    start = _common_prefix(old, new)
+    limit = min(len(old), len(new)) - start
+    suffix = _common_prefix(old[::-1][:limit], new[::-1][:limit])
+    return start, len(old) - suffix, len(new) - suffix
+
+def _shifted(node, target, fresh, old_end, delta):
+    # Copy of node with every offset past the edit moved by delta, and the
+    # target's body taken from the freshly parsed node. Props of other nodes
+    # are shared, never changed.
+    copy = Node(node.name, node.label)
+    copy.start, copy.body_start, copy.body_end, copy.end = node.start, node.body_start, node.body_end, node.end
+    if node.start >= old_end:
+        copy.start += delta
+        copy.body_start += delta
+    if node.body_end >= old_end:
+        copy.body_end += delta
+        copy.end += delta
+    if node is target:
+        copy.props, copy.children = fresh.props, fresh.children
+    else:
+        copy.props = node.props
+        copy.children = [_shifted(child, target, fresh, old_end, delta) for child in node.children]
+    return copy
+
+def reparse(doc, old_text, new_text):
+    # -> Keymap for new_text, the same as parse(new_text). If the edit lies
+    # inside a single node's braces and touches no preprocessor line, only that
+    # node's body is parsed again and the rest of the tree is copied with its
+    # offsets shifted; otherwise the whole text is parsed. doc is left as it was.
+    start, old_end, new_end = _changed_region(old_text, new_text)
+    if start == old_end == new_end:
+        return doc
+    if '#' in old_text[start:old_end] or '#' in new_text[start:new_end]:
+        return parse(new_text)
+
+    # Deepest node whose body holds the whole edit
+    target = None
+    nodes = doc.nodes
+    while True:
+        inside = next((n for n in nodes if n.body_start <= start and old_end <= n.body_end), None)
+        if inside is None:
+            break
+        target = inside
+        nodes = inside.children
+    if target is None:
+        return parse(new_text)
+
+    delta = new_end - old_end
+    fresh = Node(target.name, target.label)
+    try:
+        # Any token error (say a new unterminated comment or string) may be
+        # fine in the whole file, so it only means this shortcut doesn't apply
+        tokens = tokenize(new_text, target.body_start, target.body_end + delta)
+        if any(t.kind == 'directive' for t in tokens):
+            return parse(new_text)
+        parser = _Parser(new_text, tokens, dict(doc.defines))
+        parser.body(fresh)
+        if parser.peek() is not None:
+            raise KeymapSyntaxError("unbalanced braces")
+    except KeymapSyntaxError:
+        return parse(new_text) # Raises with the real location if the file is broken
+
+    nodes = [_shifted(node, target, fresh, old_end, delta) for node in doc.nodes]
+    return Keymap(nodes, doc.defines, new_text)
+
+# Parsed documents by path: (stat key, text, Keymap), least recently used first.
+# Every upload session has its own keymap path, so the cache is bounded like
+# conversion_cache: past MAX_CACHED documents the oldest is dropped.
+MAX_CACHED = 32
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def load(path):
+    # -> Keymap for a .keymap file, reparsed only when its mtime/size changed.
+    # A changed file gets a new document; one handed out earlier never changes.
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    path = os.path.abspath(path)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached:
+            _cache.move_to_end(path)
+            if cached[0] == key:
+                return cached[2]
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        doc = reparse(cached[2], cached[1], text) if cached else parse(text)
+        _cache[path] = (key, text, doc)
+        while len(_cache) > MAX_CACHED:
+            _cache.popitem(last=False)
+        return doc
+
+def load_layers(path):
+    # -> [(layer name, [binding text])]
+    return load(path).layer_bindings()
@@ -0,0 +1,137 @@
+import ctypes
+import ctypes.util
+import getpass
+import json
+import os
+import struct
+import sys
+import threading
+import time
+
+# Watches for the bootloader drive (a nice!nano double-tapped into its UF2
+# bootloader shows up as a NICENANO volume) and wakes waiters the moment it
+# appears or goes away. On Linux this is inotify on the mount root; elsewhere
+# (macOS /Volumes) the root is re-checked every POLL_INTERVAL seconds.
+# config.json: "mount_root" (directory volumes appear in), "bootloader_volume".
+DEFAULT_VOLUME = 'NICENANO'
+POLL_INTERVAL = 0.5
+
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+_EVENT = struct.Struct('iIII') # wd, mask, cookie, name length
+
+def default_mount_root():
+    if sys.platform == 'darwin':
+        return '/Volumes'
+    # udisks mounts removable drives under /run/media/<user> or /media/<user>
+    user = getpass.getuser()
+    for root in (f'/run/media/{user}', f'/media/{user}'):
+        if os.path.isdir(root):
+            return root
+    return '/media'
+
+def _inotify():
+    # -> libc handle with inotify, or None (not Linux / not available)
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+class MountWatcher:
+    def __init__(self, root=None, volume=None):
+        self.root = root or default_mount_root()
+        self.volume = volume or DEFAULT_VOLUME
+        self.path = os.path.join(self.root, self.volume)
+        self._changed = threading.Condition()
+        self._mounted = os.path.exists(self.path)
+        self._version = 0 # Bumped on every mount/unmount
+        self._thread = None
+
+    def _start(self):
+        # Lazily, so importing the app (or a WSGI master process) starts no threads
+        with self._changed:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._watch, name='mount-watcher', daemon=True)
+                self._thread.start()
+
+    def _update(self):
+        mounted = os.path.exists(self.path)
+        with self._changed:
+            if mounted != self._mounted:
+                self._mounted = mounted
+                self._version += 1
+                self._changed.notify_all()
+
+    def _watch(self):
+        libc = _inotify()
+        while True:
+            if libc is None or not os.path.isdir(self.root) or not self._watch_inotify(libc):
+                # No inotify, or the root itself is missing: poll until it is back
+                self._update()
+                time.sleep(POLL_INTERVAL)
+
+    def _watch_inotify(self, libc):
+        # Blocks reading events for as long as the watch lives; False if it couldn't be set up
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            return False
+        try:
+            if libc.inotify_add_watch(fd, os.fsencode(self.root), WATCH_MASK) < 0:
+                return False
+            self._update() # Anything that changed before the watch existed
+            while True:
+                data = os.read(fd, 4096)
+                offset = 0
+                while offset < len(data):
+                    _, mask, _, length = _EVENT.unpack_from(data, offset)
+                    name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+                    offset += _EVENT.size + length
+                    if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF | IN_UNMOUNT):
+                        self._update()
+                        return True # Root went away, start over
+                    if mask & IN_Q_OVERFLOW or name == os.fsencode(self.volume):
+                        self._update()
+        except OSError:
+            return True
+        finally:
+            os.close(fd)
+
+    def mounted(self):
+        self._start()
+        with self._changed:
+            return self._mounted
+
+    def wait(self, mounted=True, timeout=None):
+        # Block until the drive is (un)mounted; -> True, or False on timeout
+        self._start()
+        with self._changed:
+            return self._changed.wait_for(lambda: self._mounted == mounted, timeout)
+
+    def changes(self, version=None, timeout=None):
+        # Block until the state differs from `version` -> (mounted, version);
+        # returns the current state unchanged on timeout
+        self._start()
+        with self._changed:
+            self._changed.wait_for(lambda: self._version != version, timeout)
+            return self._mounted, self._version
+
+def from_config(path='config.json'):
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        config = {}
+    return MountWatcher(config.get('mount_root'), config.get('bootloader_volume'))
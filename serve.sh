@@ -0,0 +1,31 @@
+#!/bin/bash
+
+# Production mode: gunicorn with several workers (settings in gunicorn.conf.py),
+# meant to sit behind nginx (deploy/nginx.conf). start.sh stays the dev server.
+#
+#   ./serve.sh            start (or gracefully reload if already running)
+#   ./serve.sh stop       graceful stop
+
+PIDFILE=.cache/gunicorn.pid
+
+if [ -f "$PIDFILE" ] && kill -0 "$(cat $PIDFILE)" 2>/dev/null; then
+    if [ "$1" == "stop" ]; then
+        echo "Stopping gunicorn $(cat $PIDFILE)..."
+        kill -TERM "$(cat $PIDFILE)"
+    else
+        # New workers start with the new code, old ones finish their requests
+        echo "Reloading gunicorn $(cat $PIDFILE)..."
+        kill -HUP "$(cat $PIDFILE)"
+    fi
+    exit 0
+fi
+if [ "$1" == "stop" ]; then
+    echo "Not running."
+    exit 0
+fi
+
+# Install dependencies if needed (quietly)
+pip install -q flask gunicorn
+
+echo "Starting ZMK Configurator with gunicorn..."
+exec python3 -m gunicorn -c gunicorn.conf.py app:app
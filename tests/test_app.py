@@ -0,0 +1,145 @@
+import json
+import os
+import struct
+import threading
+
+import pytest
+
+import uf2
+from job_queue import JobQueue, DONE
+from mount_watcher import MountWatcher
+
+# The app keeps its state in relative paths (.cache/, builds/, ...), so it is
+# imported and driven from an empty working directory.
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    try:
+        import app
+        yield app
+    finally:
+        os.chdir(cwd)
+
+@pytest.fixture
+def client(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, 'jobs', JobQueue(str(tmp_path / 'jobs.sqlite3')))
+    monkeypatch.setattr(app_module, 'JOB_STREAM_INTERVAL', 0.01)
+    monkeypatch.setattr(app_module, 'LOG_STREAM_INTERVAL', 0.01)
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['sid'] = tmp_path.name
+    return client
+
+def log_file(app_module, client):
+    with client.session_transaction() as session:
+        path = os.path.join(app_module.SESSIONS_DIR, session['sid'], app_module.BUILD_LOG_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def events(response):
+    # -> the JSON payloads of an SSE response, as they arrive
+    for chunk in response.response:
+        for line in chunk.decode().splitlines():
+            if line.startswith('data: '):
+                yield json.loads(line[len('data: '):])
+
+def test_build_status_returns_only_new_log_text(app_module, client):
+    path = log_file(app_module, client)
+    with open(path, 'wb') as f:
+        f.write(b'one\n')
+    first = client.get('/build_status').get_json()
+    assert (first['logs'], first['offset'], first['reset']) == ('one\n', 4, False)
+
+    with open(path, 'ab') as f:
+        f.write(b'two\n\xc3') # Half of an "é"
+    second = client.get(f"/build_status?offset={first['offset']}").get_json()
+    assert (second['logs'], second['offset']) == ('two\n', 8)
+
+    with open(path, 'ab') as f:
+        f.write(b'\xa9\n')
+    third = client.get(f"/build_status?offset={second['offset']}").get_json()
+    assert third['logs'] == '\xe9\n'
+
+    # A new build truncated the log: start over and tell the client
+    with open(path, 'wb') as f:
+        f.write(b'new\n')
+    fourth = client.get(f"/build_status?offset={third['offset']}").get_json()
+    assert (fourth['logs'], fourth['offset'], fourth['reset']) == ('new\n', 4, True)
+
+def test_build_log_stream_pushes_appended_text(app_module, client):
+    path = log_file(app_module, client)
+    with open(path, 'w') as f:
+        f.write('start\n')
+    response = client.get('/build_log_stream', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    stream = events(response)
+    assert next(stream)['logs'] == 'start\n'
+    with open(path, 'a') as f:
+        f.write('more\n')
+    message = next(stream)
+    assert (message['logs'], message['offset']) == ('more\n', 11)
+    response.close()
+
+def test_job_events_follow_the_job_until_it_finishes(app_module, client):
+    release = threading.Event()
+    def work():
+        app_module.jobs.report({'step': 1})
+        release.wait(5)
+        return {'ok': True}
+    with client.session_transaction() as session:
+        job_id = app_module.jobs.submit('test', work, owner=session['sid'])
+
+    stream = events(client.get(f"/jobs/{job_id}/events", buffered=False))
+    seen = [next(stream)]
+    while seen[-1]['progress'] is None:
+        seen.append(next(stream))
+    assert seen[-1]['progress'] == {'step': 1}
+    release.set()
+    seen += list(stream) # Ends by itself once the job is finished
+    assert seen[-1]['state'] == DONE
+    assert seen[-1]['result'] == {'ok': True}
+    assert client.get(f"/jobs/{job_id}").get_json()['state'] == DONE
+
+def test_jobs_of_other_sessions_are_not_visible(app_module, client):
+    job_id = app_module.jobs.submit('test', lambda: None, owner='someone-else')
+    assert client.get(f"/jobs/{job_id}").status_code == 404
+    assert client.get(f"/jobs/{job_id}/events").status_code == 404
+    assert client.get('/jobs').get_json() == {'jobs': []}
+
+def image(count, family='nrf52840', payload=256):
+    blocks = []
+    for i in range(count):
+        header = struct.pack('<8I', uf2.MAGIC_START0, uf2.MAGIC_START1, uf2.FLAG_FAMILY_ID_PRESENT,
+                             0x1000 + i * 256, payload, i, count, uf2.FAMILIES[family])
+        blocks.append(header + bytes(476) + struct.pack('<I', uf2.MAGIC_END))
+    return b''.join(blocks)
+
+@pytest.fixture
+def drive(app_module, tmp_path, monkeypatch):
+    firmware = tmp_path / 'firmware_latest'
+    firmware.mkdir()
+    monkeypatch.setattr(app_module, 'FIRMWARE_DIR', str(firmware))
+    monkeypatch.setattr(app_module, 'mount_watcher', MountWatcher(str(tmp_path / 'media'), 'NICENANO'))
+    os.makedirs(app_module.mount_watcher.path)
+    return firmware
+
+@pytest.mark.parametrize('data, error', [
+    (image(4, family='rp2040'), 'built for rp2040'),
+    (image(4, payload=477), 'payload of 477 bytes'),
+    (image(4)[:3 * uf2.BLOCK_SIZE], 'truncated: 3 of 4 blocks'),
+])
+def test_flash_refuses_bad_images_before_copying(app_module, client, drive, data, error):
+    (drive / 'corne_left.uf2').write_bytes(data)
+    response = client.post('/flash/left', json={})
+    assert response.status_code == 422
+    assert error in response.get_json()['message']
+    assert os.listdir(app_module.mount_watcher.path) == []
+
+def test_flash_copies_a_good_image(app_module, client, drive):
+    (drive / 'corne_right.uf2').write_bytes(image(4))
+    response = client.post('/flash/right', json={})
+    assert response.get_json()['status'] == 'success'
+    with open(os.path.join(app_module.mount_watcher.path, 'corne_right.uf2'), 'rb') as f:
+        assert f.read() == image(4)
@@ -0,0 +1,58 @@
+import os
+import shutil
+
+from artifact_store import ArtifactStore, build_folders, file_hash, read_manifest
+
+# Identical firmware across builds is stored once and hardlinked into every
+# build folder; gc() only drops blobs nothing refers to any more.
+
+def make_build(path, files):
+    os.makedirs(path)
+    for name, data in files.items():
+        with open(os.path.join(path, name), 'wb') as f:
+            f.write(data)
+    return str(path)
+
+def test_identical_artifacts_share_one_blob(tmp_path):
+    store = ArtifactStore(str(tmp_path / 'store'))
+    first = make_build(tmp_path / 'builds' / 'a', {'corne_left.uf2': b'LEFT', 'corne_right.uf2': b'RIGHT'})
+    second = make_build(tmp_path / 'builds' / 'b', {'corne_left.uf2': b'LEFT', 'corne_right.uf2': b'RIGHT2'})
+    store.ingest_tree(first)
+    manifest = store.ingest_tree(second)
+
+    assert manifest == {'corne_left.uf2': file_hash(os.path.join(second, 'corne_left.uf2')),
+                        'corne_right.uf2': file_hash(os.path.join(second, 'corne_right.uf2'))}
+    assert read_manifest(second) == manifest
+    assert os.path.samefile(os.path.join(first, 'corne_left.uf2'), os.path.join(second, 'corne_left.uf2'))
+    assert os.path.samefile(os.path.join(second, 'corne_left.uf2'), store.blob_path(manifest['corne_left.uf2']))
+    assert not os.path.samefile(os.path.join(first, 'corne_right.uf2'), os.path.join(second, 'corne_right.uf2'))
+    # Ingesting again changes nothing
+    assert store.ingest_tree(second) == manifest
+
+def test_link_tree_mirrors_a_build(tmp_path):
+    store = ArtifactStore(str(tmp_path / 'store'))
+    build = make_build(tmp_path / 'builds' / 'a', {'corne_left.uf2': b'LEFT', 'build_info.json': b'{}'})
+    latest = str(tmp_path / 'firmware_latest')
+    make_build(latest, {'corne_left.uf2': b'OLD', 'stale.uf2': b'STALE'})
+
+    store.link_tree(build, latest)
+    assert sorted(os.listdir(latest)) == ['artifacts.json', 'build_info.json', 'corne_left.uf2']
+    assert os.path.samefile(os.path.join(build, 'corne_left.uf2'), os.path.join(latest, 'corne_left.uf2'))
+    assert not [n for n in os.listdir(tmp_path) if n.startswith('.firmware_latest')]
+
+def test_gc_keeps_referenced_and_linked_blobs(tmp_path):
+    store = ArtifactStore(str(tmp_path / 'store'))
+    builds = tmp_path / 'builds'
+    kept = store.ingest_tree(make_build(builds / 'a', {'corne_left.uf2': b'KEPT'}))['corne_left.uf2']
+    gone = store.ingest_tree(make_build(builds / 'b', {'corne_left.uf2': b'GONE'}))['corne_left.uf2']
+    linked = store.ingest_tree(make_build(builds / 'c', {'corne_left.uf2': b'LINKED'}))['corne_left.uf2']
+    shutil.rmtree(builds / 'b')
+    os.remove(builds / 'c' / 'artifacts.json') # Unlisted, but still hardlinked from c/
+
+    folders = build_folders(str(builds), str(tmp_path / 'firmware_latest'))
+    assert store.gc(folders, dry_run=True) == (1, len(b'GONE'))
+    assert os.path.exists(store.blob_path(gone))
+    assert store.gc(folders) == (1, len(b'GONE'))
+    assert not os.path.exists(store.blob_path(gone))
+    assert os.path.exists(store.blob_path(kept)) and os.path.exists(store.blob_path(linked))
+    assert store.gc(folders) == (0, 0)
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from atomic_io import FileLock, LockBusy, atomic_write, replace_dir
+
+# Readers must only ever see a complete file or directory, and a lock has to
+# hold against other threads and other processes alike.
+
+def test_failed_write_leaves_the_old_file(tmp_path):
+    path = tmp_path / 'keymap'
+    path.write_text('old')
+    with pytest.raises(RuntimeError):
+        with atomic_write(str(path)) as f:
+            f.write('half')
+            raise RuntimeError
+    assert path.read_text() == 'old'
+    assert os.listdir(tmp_path) == ['keymap']
+
+def test_replace_dir_swaps_in_the_new_tree(tmp_path):
+    dest = tmp_path / 'images'
+    for version in ('one', 'two'):
+        tmp = tmp_path / f'tmp-{version}'
+        tmp.mkdir()
+        (tmp / f'{version}.png').write_text(version)
+        replace_dir(str(tmp), str(dest))
+        assert os.listdir(dest) == [f'{version}.png']
+    assert os.listdir(tmp_path) == ['images']
+
+def test_lock_excludes_other_threads(tmp_path):
+    lock = FileLock('test', str(tmp_path))
+    inside = []
+    most = []
+    def worker(n):
+        with lock:
+            inside.append(n)
+            time.sleep(0.01)
+            most.append(len(inside))
+            inside.remove(n)
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert most == [1] * 8
+
+def test_lock_held_by_another_process_is_busy(tmp_path):
+    lock = FileLock('test', str(tmp_path))
+    holder = subprocess.Popen(
+        [sys.executable, '-c', 'import sys, time; from atomic_io import FileLock; '
+         'lock = FileLock("test", sys.argv[1]); lock.acquire(); print("held", flush=True); time.sleep(0.5)', str(tmp_path)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline() == 'held\n'
+        with pytest.raises(LockBusy):
+            lock.acquire(blocking=False)
+        with pytest.raises(LockBusy):
+            lock.acquire(timeout=0.1)
+        # Released when the holder exits
+        handle = lock.acquire(timeout=5)
+        lock.release(handle)
+    finally:
+        holder.wait()
+
+def test_written_files_keep_their_mode(tmp_path):
+    new = tmp_path / 'new.svg'
+    with atomic_write(str(new)) as f:
+        f.write('<svg/>')
+    assert os.stat(new).st_mode & 0o777 == 0o644
+    os.chmod(new, 0o600)
+    with atomic_write(str(new)) as f:
+        f.write('<svg></svg>')
+    assert os.stat(new).st_mode & 0o777 == 0o600
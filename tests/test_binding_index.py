@@ -0,0 +1,96 @@
+import os
+import shutil
+import threading
+
+from binding_index import BindingIndex, BUILD, KEYMAP, TEMPLATE
+from build_orchestrator import KEYMAPS_DIR
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_FILE = os.path.join(ROOT, 'vail_templates', 'three_layers.vil')
+
+def make_index(tmp_path):
+    # Each BindingIndex stands in for one worker process: its own lock, a shared database
+    return BindingIndex(str(tmp_path / 'vail_templates'), str(tmp_path / 'config'), str(tmp_path / 'builds'),
+                        db_path=str(tmp_path / 'index.sqlite3'))
+
+def test_concurrent_updates_of_one_file_from_several_workers(tmp_path):
+    os.makedirs(tmp_path / 'vail_templates')
+    path = str(tmp_path / 'vail_templates' / 'three_layers.vil')
+    shutil.copy(TEMPLATE_FILE, path)
+    indexes = [make_index(tmp_path) for _ in range(6)]
+    errors = []
+
+    def worker(index):
+        for n in range(5):
+            os.utime(path, ns=(n, n * 1000 + id(index) % 997)) # A new mtime: every update re-indexes
+            try:
+                index.update(path)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in indexes]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert indexes[0].stats()['sources'] == 1
+    matches, _ = indexes[0].search('&kp', kind=TEMPLATE, refresh=False)
+    assert matches
+
+KEYMAP_TEXT = """/ {
+    keymap {
+        compatible = "zmk,keymap";
+        base { bindings = <&kp Q &kp LC(C_MUTE) &mo 1>; };
+        media { bindings = <&kp C_MUTE &trans &kp C_PP>; };
+    };
+};
+"""
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+    return str(path)
+
+def where(matches):
+    return [(os.path.basename(m['source']), m['layer'], m['position'], m['binding']) for m in matches]
+
+def test_search_by_binding_behavior_and_keycode(tmp_path):
+    write(tmp_path / 'config' / 'corne.keymap', KEYMAP_TEXT)
+    index = make_index(tmp_path)
+    assert where(index.search('&kp  c_mute')[0]) == [('corne.keymap', 1, 0, '&kp C_MUTE')]
+    assert where(index.search('C_MUTE')[0]) == [('corne.keymap', 0, 1, '&kp LC(C_MUTE)'), ('corne.keymap', 1, 0, '&kp C_MUTE')]
+    assert where(index.search('C_MUTE', layer=0)[0]) == [('corne.keymap', 0, 1, '&kp LC(C_MUTE)')]
+    assert index.search('&kp', kind=TEMPLATE)[0] == []
+    matches, truncated = index.search('&kp', limit=2)
+    assert len(matches) == 2 and truncated
+    assert index.search('&mo')[0][0]['layer_name'] == 'base'
+
+def test_update_replaces_what_a_file_was_found_by(tmp_path):
+    path = write(tmp_path / 'config' / 'corne.keymap', KEYMAP_TEXT)
+    index = make_index(tmp_path)
+    index.refresh()
+    write(path, KEYMAP_TEXT.replace('&kp C_PP', '&kp C_NEXT'))
+    index.update(path)
+    assert index.search('C_PP', refresh=False)[0] == []
+    assert where(index.search('C_NEXT', refresh=False)[0]) == [('corne.keymap', 1, 2, '&kp C_NEXT')]
+    os.remove(path)
+    index.update(path)
+    assert index.stats()['sources'] == 0
+
+def test_refresh_finds_templates_keymaps_and_build_copies(tmp_path):
+    os.makedirs(tmp_path / 'vail_templates')
+    shutil.copy(TEMPLATE_FILE, tmp_path / 'vail_templates')
+    write(tmp_path / 'config' / 'corne.keymap', KEYMAP_TEXT)
+    write(tmp_path / 'config' / 'broken.keymap', '/ { keymap {')
+    index = make_index(tmp_path)
+    assert index.search('C_MUTE', kind=KEYMAP)[0]
+    assert index.search('&kp', kind=TEMPLATE)[0]
+    assert [os.path.basename(e['path']) for e in index.stats()['errors']] == ['broken.keymap']
+
+    build = tmp_path / 'builds' / 'first_build'
+    write(build / KEYMAPS_DIR / 'corne.keymap', KEYMAP_TEXT.replace('&kp Q', '&kp C_VOL_UP'))
+    index.update_build(str(build))
+    matches, _ = index.search('&kp C_VOL_UP', kind=BUILD, refresh=False)
+    assert [(m['source'], m['position']) for m in matches] == [(str(build / KEYMAPS_DIR / 'corne.keymap'), 0)]
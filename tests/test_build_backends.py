@@ -0,0 +1,90 @@
+import json
+import os
+import time
+
+import pytest
+
+from build_backends import LocalWestBackend, load_matrix
+from build_catalog import BuildCatalog
+from build_orchestrator import RUNNING
+
+# A local build only runs west for the matrix entries whose inputs changed;
+# the others are carried over from the newest build that had the same entry
+# hash. West itself is replaced by a fake that writes a UF2 per entry.
+
+BUILD_YAML = """include:
+  - board: nice_nano_v2
+    shield: corne_left
+  - board: nice_nano_v2
+    shield: corne_right
+  - board: nice_nano_v2
+    shield: settings_reset
+"""
+
+class FakeWest(LocalWestBackend):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.built = []
+
+    def _prepare_workspace(self, build):
+        pass
+
+    def _build_entry(self, build, entry, ninja_jobs=None):
+        self.built.append(entry['artifact'])
+        path = os.path.join(self.workspace, entry['artifact'] + '.uf2')
+        with open(path, 'w') as f:
+            f.write(f"{entry['artifact']} built for {build.title}")
+        return entry, path
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # Entry hashes are taken relative to the working directory
+    os.makedirs('config')
+    for name, text in [('corne.keymap', '/ { keymap { }; };\n'), ('corne.conf', ''), ('west.yml', 'manifest: {}\n')]:
+        with open(os.path.join('config', name), 'w') as f:
+            f.write(text)
+    with open('build.yaml', 'w') as f:
+        f.write(BUILD_YAML)
+    catalog = BuildCatalog('builds', 'catalog.sqlite3')
+    return FakeWest('build.log', find_artifact=catalog.find_artifact)
+
+def run(backend, title, **kwargs):
+    build = backend.start(title, **kwargs)
+    deadline = time.time() + 10
+    while backend.get(build.id).state == RUNNING and time.time() < deadline:
+        time.sleep(0.01)
+    return backend.get(build.id)
+
+def firmware(build, artifact):
+    with open(os.path.join(build.build_dir, artifact + '.uf2')) as f:
+        return f.read()
+
+def test_only_changed_entries_are_rebuilt(backend):
+    left, right, reset = (e['artifact'] for e in load_matrix())
+    first = run(backend, 'first')
+    assert first.error is None
+    assert sorted(backend.built) == [left, right, reset]
+
+    backend.built.clear()
+    with open('config/corne.keymap', 'a') as f:
+        f.write('// changed\n')
+    second = run(backend, 'second')
+    assert sorted(backend.built) == [left, right]
+    assert second.reused == [reset]
+    assert firmware(second, left) == f"{left} built for second"
+    assert firmware(second, reset) == f"{reset} built for first"
+    with open(os.path.join(second.build_dir, 'build_info.json')) as f:
+        assert json.load(f)['reused'] == [reset]
+
+    backend.built.clear()
+    third = run(backend, 'third')
+    assert backend.built == []
+    assert third.reused == [left, right, reset]
+    assert firmware(third, left) == f"{left} built for second"
+
+def test_forced_build_reuses_nothing(backend):
+    run(backend, 'first')
+    backend.built.clear()
+    forced = run(backend, 'forced', force=True)
+    assert len(backend.built) == 3
+    assert forced.reused == []
@@ -0,0 +1,80 @@
+import json
+import os
+
+import build_catalog
+from build_catalog import BuildCatalog
+
+# find_by_inputs lets a build with unchanged inputs skip the push, so a hit has
+# to have firmware for the whole matrix, not just some .uf2
+
+def make_build(builds_dir, name, timestamp, uf2s, matrix=('corne_left', 'corne_right')):
+    path = os.path.join(builds_dir, name)
+    os.makedirs(path)
+    with open(os.path.join(path, 'build_info.json'), 'w') as f:
+        json.dump({'title': name, 'timestamp': timestamp, 'inputs_hash': 'abc',
+                   'matrix': {artifact: 'h-' + artifact for artifact in matrix}}, f)
+    for uf2 in uf2s:
+        with open(os.path.join(path, uf2), 'wb') as f:
+            f.write(b'UF2')
+
+def catalog(tmp_path):
+    return BuildCatalog(str(tmp_path / 'builds'), str(tmp_path / 'catalog.sqlite3'))
+
+def test_complete_build_is_found(tmp_path):
+    make_build(tmp_path / 'builds', 'full', '2026-01-01T10:00:00', ['corne_left.uf2', 'corne_right.uf2'])
+    assert catalog(tmp_path).find_by_inputs('abc') == 'full'
+    assert catalog(tmp_path).find_by_inputs('other') is None
+
+def test_partial_build_is_skipped_for_an_older_complete_one(tmp_path):
+    make_build(tmp_path / 'builds', 'full', '2026-01-01T10:00:00', ['corne_left.uf2', 'corne_right.uf2'])
+    make_build(tmp_path / 'builds', 'partial', '2026-01-02T10:00:00', ['corne_left.uf2'])
+    assert catalog(tmp_path).find_by_inputs('abc') == 'full'
+
+def test_build_without_a_matrix_never_counts(tmp_path):
+    make_build(tmp_path / 'builds', 'legacy', '2026-01-01T10:00:00', ['corne_left.uf2'], matrix=())
+    assert catalog(tmp_path).find_by_inputs('abc') is None
+
+# The catalog is the only thing page loads read: it has to follow folders
+# added and removed by hand, and a new instance (another worker, a restart)
+# must not re-read folders it already has.
+
+def test_query_filters_and_orders_newest_first(tmp_path):
+    builds = tmp_path / 'builds'
+    make_build(builds, '2026-01-01_run3', '2026-01-01T10:00:00', [])
+    make_build(builds, '2026-02-01_run4', '2026-02-01T10:00:00', [])
+    make_build(builds, '2026-03-01_run5', '2026-03-01T10:00:00', [])
+    found, total = catalog(tmp_path).query(limit=2)
+    assert total == 3
+    assert [b['name'] for b in found] == ['2026-03-01_run5', '2026-02-01_run4']
+    found, total = catalog(tmp_path).query(since='2026-01-15', until='2026-02-28')
+    assert [b['name'] for b in found] == ['2026-02-01_run4'] and total == 1
+    found, _ = catalog(tmp_path).query(title='run3')
+    assert [b['name'] for b in found] == ['2026-01-01_run3']
+
+def test_folders_added_and_removed_by_hand_are_picked_up(tmp_path):
+    builds = tmp_path / 'builds'
+    make_build(builds, 'a', '2026-01-01T10:00:00', [])
+    cat = catalog(tmp_path)
+    assert cat.query()[1] == 1
+    make_build(builds, 'b', '2026-01-02T10:00:00', [])
+    assert [b['name'] for b in cat.query()[0]] == ['b', 'a']
+    os.remove(builds / 'a' / 'build_info.json')
+    os.rmdir(builds / 'a')
+    assert [b['name'] for b in cat.query()[0]] == ['b']
+
+def test_a_new_instance_does_not_reread_known_folders(tmp_path, monkeypatch):
+    make_build(tmp_path / 'builds', 'a', '2026-01-01T10:00:00', [])
+    catalog(tmp_path).query()
+    read = []
+    read_info = build_catalog._read_info
+    monkeypatch.setattr(build_catalog, '_read_info', lambda path, name: read.append(name) or read_info(path, name))
+    assert catalog(tmp_path).query()[1] == 1
+    assert read == []
+
+def test_corrupt_build_info_is_listed_with_an_error(tmp_path):
+    path = tmp_path / 'builds' / 'broken'
+    path.mkdir(parents=True)
+    (path / 'build_info.json').write_text('{not json')
+    (found,), _ = catalog(tmp_path).query()
+    assert found['name'] == 'broken'
+    assert found['error'].startswith('Corrupt build_info.json')
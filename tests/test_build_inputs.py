@@ -0,0 +1,65 @@
+import shutil
+
+import pytest
+
+from build_inputs import entry_hash, entry_input_files, inputs_hash, matrix_hashes
+
+# Entry hashes decide which matrix entries are rebuilt, so they must not
+# drift between runs or checkouts, and must only follow the files ZMK reads
+# for that entry.
+
+BUILD_YAML = """include:
+  - board: nice_nano_v2
+    shield: corne_left
+  - board: nice_nano_v2
+    shield: corne_right
+  - board: nice_nano_v2
+    shield: settings_reset
+"""
+
+ENTRIES = [
+    {'board': 'nice_nano_v2', 'shield': f'corne_{side}', 'snippet': '', 'cmake_args': '',
+     'artifact': f'corne_{side}-nice_nano_v2-zmk'} for side in ('left', 'right')
+] + [{'board': 'nice_nano_v2', 'shield': 'settings_reset', 'snippet': '', 'cmake_args': '',
+      'artifact': 'settings_reset-nice_nano_v2-zmk'}]
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'repo'
+    (root / 'config').mkdir(parents=True)
+    (root / 'config' / 'corne.keymap').write_text('/ { keymap { }; };\n')
+    (root / 'config' / 'corne.conf').write_text('CONFIG_ZMK_SLEEP=y\n')
+    (root / 'config' / 'settings_reset.conf').write_text('')
+    (root / 'config' / 'west.yml').write_text('manifest: {}\n')
+    (root / 'build.yaml').write_text(BUILD_YAML)
+    return root
+
+def test_hashes_are_stable_across_runs_and_checkouts(tmp_path, tree):
+    before = matrix_hashes(ENTRIES, str(tree))
+    assert matrix_hashes(ENTRIES, str(tree)) == before
+    copy = shutil.copytree(tree, tmp_path / 'elsewhere')
+    assert matrix_hashes(ENTRIES, str(copy)) == before
+    assert inputs_hash(str(copy)) == inputs_hash(str(tree))
+    # Key order of the entry doesn't matter
+    assert entry_hash(dict(reversed(list(ENTRIES[0].items()))), str(tree)) == before[ENTRIES[0]['artifact']]
+
+def test_entries_only_follow_the_files_they_read(tree):
+    left, right, reset = (e['artifact'] for e in ENTRIES)
+    assert entry_input_files(ENTRIES[0], str(tree)) == ['config/corne.conf', 'config/corne.keymap', 'config/west.yml']
+    before = matrix_hashes(ENTRIES, str(tree))
+
+    (tree / 'config' / 'settings_reset.conf').write_text('CONFIG_ZMK_SLEEP=n\n')
+    after = matrix_hashes(ENTRIES, str(tree))
+    assert [after[a] == before[a] for a in (left, right, reset)] == [True, True, False]
+
+    (tree / 'config' / 'corne.keymap').write_text('/ { keymap { base { }; }; };\n')
+    again = matrix_hashes(ENTRIES, str(tree))
+    assert [again[a] == after[a] for a in (left, right, reset)] == [False, False, True]
+
+    (tree / 'config' / 'west.yml').write_text('manifest: {remotes: []}\n')
+    assert all(h != again[a] for a, h in matrix_hashes(ENTRIES, str(tree)).items())
+
+def test_renaming_an_input_changes_the_hash(tree):
+    before = inputs_hash(str(tree))
+    (tree / 'config' / 'corne.conf').rename(tree / 'config' / 'totem.conf')
+    assert inputs_hash(str(tree)) != before
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from build_orchestrator import Build, BuildOrchestrator, BuildStore, RUNNING, SUCCESS
+
+# A pushed build has to outlive the worker that started following it: its
+# state goes to a BuildStore, every worker reads builds from there, and a new
+# orchestrator adopts the unfinished builds of a process that is gone.
+
+class FakeForge:
+    # Stands in for GhCli: one run that completes after `polls` status checks
+    def __init__(self, polls=1):
+        self.polls = polls
+
+    def find_run(self, commit):
+        return {'run_id': 42, 'run_number': 7, 'url': None, 'title': 'Test build', 'workflow': 'Build'}
+
+    def run_status(self, run_id):
+        self.polls -= 1
+        done = self.polls <= 0
+        return {'status': 'completed' if done else 'in_progress', 'conclusion': 'success' if done else None,
+                'jobs': [{'name': 'corne_left', 'status': 'completed' if done else 'in_progress', 'conclusion': None}]}
+
+    def download(self, run_id, dest, log_file):
+        with open(os.path.join(dest, 'corne_left.uf2'), 'wb') as f:
+            f.write(b'UF2')
+
+def dead_pid():
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+@pytest.fixture
+def orchestrator(tmp_path):
+    def make(forge):
+        return BuildOrchestrator(forge=forge, log_file=str(tmp_path / 'build.log'), builds_dir=str(tmp_path / 'builds'),
+                                 latest_dir=str(tmp_path / 'latest'), open_browser=False, store=store)
+    store = BuildStore(str(tmp_path / 'builds.sqlite3'))
+    make.store = store
+    return make
+
+def test_builds_are_visible_to_other_orchestrators(orchestrator):
+    build = orchestrator(FakeForge()).submit('abc123', 'Test build', keymaps={'corne.keymap': 'keymap'})
+    other = orchestrator(FakeForge())
+    assert other.get(build.id).commit == 'abc123'
+    assert other.get(build.id).keymaps == {'corne.keymap': 'keymap'}
+    assert [b.id for b in other.list()] == [build.id]
+
+def test_unfinished_build_of_a_dead_process_is_resumed(orchestrator):
+    # A build some other process had seen start running, then that process went away
+    store = orchestrator.store
+    build = Build('abc123', 'Test build', os.devnull)
+    build.state, build.run_id, build.jobs = RUNNING, 42, {'corne_left': ('in_progress', None)}
+    store.save('remote', build)
+    with store._connect() as db:
+        db.execute("UPDATE builds SET pid = ? WHERE id = ?", (dead_pid(), build.id))
+
+    resumed = orchestrator(FakeForge(polls=1))
+    resumed.resume()
+    done = resumed.wait(build.id, timeout=10)
+    assert done.state == SUCCESS
+    assert done.artifacts == ['corne_left.uf2']
+    assert store.get('remote', build.id).state == SUCCESS
+
+def test_build_of_a_live_process_is_not_adopted(orchestrator):
+    build = orchestrator(FakeForge(polls=1000)).submit('abc123', 'Test build')
+    assert orchestrator.store.orphans('remote') == []
+    assert orchestrator.store.get('remote', build.id).state != SUCCESS
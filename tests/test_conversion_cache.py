@@ -0,0 +1,55 @@
+import os
+import types
+
+import conversion_cache
+from conversion_cache import cache_key, generator_version, lookup, restore, store
+
+VIL = b'{"layout": []}'
+
+def make_entry(tmp_path, key, cache_dir):
+    keymap = tmp_path / 'work' / 'corne.keymap'
+    images = tmp_path / 'work' / 'images'
+    os.makedirs(images, exist_ok=True)
+    keymap.write_text('/ { };')
+    (images / 'layer_0.png').write_bytes(b'PNG')
+    store(key, str(keymap), str(images), ['layer_0.png'], 1, cache_dir=cache_dir)
+
+def test_hit_restores_the_stored_keymap_and_images(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    key = cache_key(VIL, 'km1')
+    assert lookup(key, cache_dir) is None
+    make_entry(tmp_path, key, cache_dir)
+
+    meta = lookup(key, cache_dir)
+    assert meta['layer_count'] == 1
+    out = tmp_path / 'restored'
+    assert restore(meta, str(out / 'corne.keymap'), str(out / 'images')) == ['layer_0.png']
+    assert (out / 'corne.keymap').read_text() == '/ { };'
+    assert (out / 'images' / 'layer_0.png').read_bytes() == b'PNG'
+
+def test_key_changes_with_every_input():
+    base = cache_key(VIL, 'km1', 'png', 'gen1')
+    assert cache_key(VIL, 'km1', 'png', 'gen1') == base
+    assert cache_key(VIL + b' ', 'km1', 'png', 'gen1') != base
+    assert cache_key(VIL, 'km2', 'png', 'gen1') != base
+    assert cache_key(VIL, 'km1', 'svg', 'gen1') != base
+    assert cache_key(VIL, 'km1', 'png', 'gen2') != base
+
+def test_generator_change_misses_the_old_entry(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    make_entry(tmp_path, cache_key(VIL, 'km1', 'png', 'gen1'), cache_dir)
+    assert lookup(cache_key(VIL, 'km1', 'png', 'gen1'), cache_dir) is not None
+    assert lookup(cache_key(VIL, 'km1', 'png', 'gen2'), cache_dir) is None
+
+def test_generator_version_follows_module_source(tmp_path):
+    source = tmp_path / 'renderer.py'
+    source.write_text('LAYOUTS = {}\n')
+    module = types.SimpleNamespace(__file__=str(source))
+    before = generator_version([module])
+    assert generator_version([module]) == before
+    source.write_text('LAYOUTS = {"corne": []}\n')
+    assert generator_version([module]) != before
+
+def test_default_key_covers_the_renderer():
+    assert conversion_cache.draw_keymap in conversion_cache.GENERATOR_MODULES
+    assert cache_key(VIL, 'km1') == cache_key(VIL, 'km1', 'png', conversion_cache.GENERATOR_VERSION)
@@ -0,0 +1,36 @@
+import json
+import os
+import shutil
+
+import keymap_dt
+from convert_vil import convert_batch, output_names
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE = os.path.join(ROOT, 'vail_templates', 'three_layers.vil')
+
+def test_same_name_in_different_directories_gets_separate_outputs(tmp_path):
+    # a/corne.vil and b/corne.vil converted in parallel must not overwrite each other
+    for folder, key in (('a', 'KC_A'), ('b', 'KC_B')):
+        os.makedirs(tmp_path / folder)
+        with open(TEMPLATE) as f:
+            data = json.load(f)
+        data['layout'][0][0][1] = key
+        with open(tmp_path / folder / 'corne.vil', 'w') as f:
+            json.dump(data, f)
+
+    out = tmp_path / 'out'
+    results = convert_batch([str(tmp_path / 'a' / 'corne.vil'), str(tmp_path / 'b' / 'corne.vil')], str(out), jobs=2)
+    assert [r['error'] for r in results] == [None, None]
+    assert sorted(r['keymap'] for r in results) == [str(out / 'a' / 'corne.keymap'), str(out / 'b' / 'corne.keymap')]
+    second = {folder: keymap_dt.load(str(out / folder / 'corne.keymap')).layers()[0].bindings[1]
+             for folder in ('a', 'b')}
+    assert (str(second['a']), str(second['b'])) == ('&kp A', '&kp B')
+
+def test_files_from_one_directory_keep_plain_names(tmp_path):
+    files = [str(tmp_path / 'one.vil'), str(tmp_path / 'two.vil')]
+    for path in files:
+        shutil.copy(TEMPLATE, path)
+    assert output_names(files) == {files[0]: 'one', files[1]: 'two'}
+    results = convert_batch(files, str(tmp_path / 'out'), jobs=2)
+    assert sorted(os.listdir(tmp_path / 'out')) == ['one.keymap', 'two.keymap']
+    assert all(r['error'] is None for r in results)
@@ -0,0 +1,123 @@
+import glob
+import os
+
+import pytest
+from PIL import Image
+
+import draw_keymap
+import keycodes
+from bench_draw_keymap import legacy_clean_label
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The one-pass label regex only matches the old one-replacement-at-a-time
+# cleanup when no two patterns overlap in the text, so check every binding
+# the converter can write and the config keymaps actually use.
+
+def real_bindings():
+    bindings = set()
+    for path in glob.glob(os.path.join(ROOT, 'config', '*.keymap')):
+        with open(path) as f:
+            for _, keys in draw_keymap.parse_layers(f.read()):
+                bindings.update(keys)
+    for binding in keycodes.KEY_MAP.values():
+        bindings.add(binding)
+        if binding.startswith('&kp '):
+            key = binding[len('&kp '):]
+            bindings.update({f"&kp LC({key})", f"&kp LS(LG({key}))", f"&lt 1 {key}", f"&mt LSHIFT {key}"})
+    return sorted(bindings)
+
+def test_labels_match_sequential_replacement_for_real_bindings():
+    bindings = real_bindings()
+    assert len(bindings) > 200
+    for binding in bindings:
+        assert draw_keymap.clean_label(binding) == legacy_clean_label(binding), binding
+
+@pytest.mark.parametrize('text, label', [('&kp C_NEXT', 'Next'), ('&kp LC(BSPC)', 'C-Bksp'), ('&kp SQT', "'")])
+def test_labels(text, label):
+    assert draw_keymap.clean_label(text) == label
+
+# draw_layers fingerprints every layer in a manifest next to the images and
+# only redraws the ones whose bindings changed or whose image is gone
+KEYMAP = """/ {
+    keymap {
+        compatible = "zmk,keymap";
+        base { bindings = <&kp Q &kp W &mo 1>; };
+        nav { bindings = <&kp LEFT &kp RIGHT &trans>; };
+        num { bindings = <&kp N1 &kp N2 &trans>; };
+    };
+};
+"""
+
+def write_keymap(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return str(path)
+
+@pytest.fixture
+def rendered(monkeypatch):
+    calls = []
+    render_layer = draw_keymap.render_layer
+    def counting(layer_name, *args):
+        calls.append(layer_name)
+        return render_layer(layer_name, *args)
+    monkeypatch.setattr(draw_keymap, 'render_layer', counting)
+    return calls
+
+def test_only_changed_layers_are_redrawn(tmp_path, rendered):
+    out = str(tmp_path / 'out')
+    first = write_keymap(tmp_path / 'v1' / 'corne.keymap', KEYMAP)
+    assert draw_keymap.draw_layers(first, out) == ['base.png', 'nav.png', 'num.png']
+    assert rendered == ['base', 'nav', 'num']
+
+    rendered.clear()
+    draw_keymap.draw_layers(first, out)
+    assert rendered == []
+
+    changed = write_keymap(tmp_path / 'v2' / 'corne.keymap', KEYMAP.replace('&kp N2', '&kp N3'))
+    draw_keymap.draw_layers(changed, out)
+    assert rendered == ['num']
+
+    # A missing image is redrawn even though the manifest still lists it
+    rendered.clear()
+    os.remove(os.path.join(out, 'nav.png'))
+    draw_keymap.draw_layers(changed, out)
+    assert rendered == ['nav']
+
+def test_images_of_removed_layers_are_deleted(tmp_path, rendered):
+    out = str(tmp_path / 'out')
+    draw_keymap.draw_layers(write_keymap(tmp_path / 'v1' / 'corne.keymap', KEYMAP), out)
+    fewer = KEYMAP.replace("        num { bindings = <&kp N1 &kp N2 &trans>; };\n", "")
+    assert draw_keymap.draw_layers(write_keymap(tmp_path / 'v2' / 'corne.keymap', fewer), out) == ['base.png', 'nav.png']
+    assert not os.path.exists(os.path.join(out, 'num.png'))
+    assert sorted(draw_keymap.read_manifest(out)) == ['base', 'nav']
+
+def test_svg_sheet_has_every_layer_and_is_only_rewritten_on_change(tmp_path, monkeypatch):
+    out = str(tmp_path / 'out')
+    keymap = write_keymap(tmp_path / 'v1' / 'corne.keymap', KEYMAP)
+    assert draw_keymap.draw_sheet(keymap, out, 'svg') == ['layers.svg']
+    with open(os.path.join(out, 'layers.svg')) as f:
+        svg = f.read()
+    assert [f'class="layer-{name}"' in svg for name in ('base', 'nav', 'num')] == [True] * 3
+    assert ' held"' in svg # &mo 1 on base holds that key down on nav
+
+    drawn = []
+    layers_svg = draw_keymap.layers_svg
+    monkeypatch.setattr(draw_keymap, 'layers_svg', lambda *args: drawn.append(1) or layers_svg(*args))
+    draw_keymap.draw_sheet(keymap, out, 'svg')
+    assert drawn == []
+    draw_keymap.draw_sheet(write_keymap(tmp_path / 'v2' / 'corne.keymap', KEYMAP.replace('&kp W', '&kp E')), out, 'svg')
+    assert drawn == [1]
+
+def test_sprite_sheet_replaces_per_layer_images(tmp_path):
+    out = str(tmp_path / 'out')
+    keymap = write_keymap(tmp_path / 'v1' / 'corne.keymap', KEYMAP)
+    draw_keymap.draw_layers(keymap, out)
+    assert draw_keymap.draw_sheet(keymap, out, 'sprite') == ['layers.png', 'layers.json']
+    assert not [name for name in os.listdir(out) if name in ('base.png', 'nav.png', 'num.png')]
+
+    sprite_map = draw_keymap.read_sprite_map(out)
+    width, height = draw_keymap.LAYOUTS[sprite_map['layout']]['size']
+    assert [(s['name'], s['y']) for s in sprite_map['layers']] == [('base', 0), ('nav', height), ('num', 2 * height)]
+    with Image.open(os.path.join(out, 'layers.png')) as sheet:
+        assert sheet.size == (width, 3 * height)
@@ -0,0 +1,106 @@
+import os
+import shutil
+import struct
+import time
+
+import pytest
+
+import flash_session
+import uf2
+from atomic_io import FileLock
+
+# A session walks each half through waiting -> copying -> detaching -> done.
+# FakeDrive plays the bootloader: the volume appears when a half is waited
+# for, and goes away again once a complete image was copied onto it.
+
+def image(count, family='nrf52840'):
+    blocks = []
+    for i in range(count):
+        header = struct.pack('<8I', uf2.MAGIC_START0, uf2.MAGIC_START1, uf2.FLAG_FAMILY_ID_PRESENT,
+                             0x1000 + i * 256, 256, i, count, uf2.FAMILIES[family])
+        blocks.append(header + bytes([i % 256]) * 476 + struct.pack('<I', uf2.MAGIC_END))
+    return b''.join(blocks)
+
+class FakeDrive:
+    def __init__(self, root, info_file=True, resets=True):
+        self.volume = 'NICENANO'
+        self.path = os.path.join(root, self.volume)
+        self.info_file = info_file
+        self.resets = resets
+        self.copied = []
+
+    def wait(self, mounted=True, timeout=None):
+        if mounted:
+            os.makedirs(self.path)
+            if self.info_file:
+                open(os.path.join(self.path, flash_session.INFO_FILE), 'w').close()
+            return True
+        if not self.resets:
+            return False
+        self.copied += [name for name in os.listdir(self.path) if name.endswith('.uf2')]
+        shutil.rmtree(self.path)
+        return True
+
+@pytest.fixture
+def build(tmp_path, monkeypatch):
+    monkeypatch.setattr(flash_session, 'flash_lock', FileLock('flash', str(tmp_path / 'locks')))
+    firmware = tmp_path / 'firmware_latest'
+    firmware.mkdir()
+    for side in flash_session.SIDES:
+        (firmware / f"corne_{side}.uf2").write_bytes(image(40))
+    return str(firmware)
+
+def test_halves_are_flashed_in_order(tmp_path, build):
+    drive = FakeDrive(str(tmp_path))
+    steps = []
+    results = flash_session.run_session(build, watcher=drive, report=steps.append)
+
+    assert drive.copied == ['corne_left.uf2', 'corne_right.uf2']
+    assert [r['bytes'] for r in results] == [40 * uf2.BLOCK_SIZE] * 2
+    stages = [(s['side'], s['stage']) for s in steps]
+    for side in flash_session.SIDES:
+        own = [stage for s, stage in stages if s == side]
+        assert own[0] == 'waiting' and own[-2:] == ['detaching', 'done']
+        assert set(own[1:-2]) == {'copying'}
+    assert stages.index(('right', 'waiting')) > stages.index(('left', 'done'))
+
+def test_drive_without_info_file_does_not_stall_the_copy(tmp_path, build):
+    drive = FakeDrive(str(tmp_path), info_file=False)
+    started = time.monotonic()
+    flash_session.run_session(build, sides=['left'], watcher=drive)
+    assert time.monotonic() - started < flash_session.SETTLE_TIMEOUT + 0.5
+    assert drive.copied == ['corne_left.uf2']
+
+def test_drive_that_never_detaches_fails_the_session(tmp_path, build):
+    drive = FakeDrive(str(tmp_path), resets=False)
+    steps = []
+    with pytest.raises(flash_session.FlashError, match="left half didn't reset"):
+        flash_session.run_session(build, watcher=drive, report=steps.append)
+    assert steps[-1] == {'side': 'left', 'stage': 'detaching'}
+    assert not any(s['side'] == 'right' for s in steps)
+
+def test_bad_image_is_rejected_before_waiting_for_a_drive(tmp_path, build):
+    with open(os.path.join(build, 'corne_right.uf2'), 'wb') as f:
+        f.write(image(3, family='rp2040'))
+    steps = []
+    with pytest.raises(flash_session.FlashError, match='corne_right.uf2: .*rp2040'):
+        flash_session.run_session(build, watcher=FakeDrive(str(tmp_path)), report=steps.append)
+    assert steps == []
+
+def test_second_session_is_refused_while_one_runs(tmp_path, build):
+    held = flash_session.flash_lock.acquire()
+    try:
+        with pytest.raises(flash_session.FlashError, match='Another flashing session'):
+            flash_session.run_session(build, watcher=FakeDrive(str(tmp_path)))
+    finally:
+        flash_session.flash_lock.release(held)
+    flash_session.run_session(build, watcher=FakeDrive(str(tmp_path)))
+
+def test_settled_as_soon_as_the_info_file_shows_up(tmp_path):
+    drive = FakeDrive(str(tmp_path))
+    os.makedirs(drive.path)
+    assert not flash_session.wait_settled(drive, timeout=0.1)
+    open(os.path.join(drive.path, flash_session.INFO_FILE), 'w').close()
+    started = time.monotonic()
+    assert flash_session.wait_settled(drive, timeout=5)
+    assert time.monotonic() - started < 0.1
@@ -0,0 +1,24 @@
+import time
+
+from job_queue import JobQueue, DONE, FAILED
+
+def wait(queue, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['state'] in (DONE, FAILED):
+            return job
+        time.sleep(0.02)
+    return queue.get(job_id)
+
+def test_result_is_recorded(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    job = wait(queue, queue.submit('test', lambda: {'ok': True}))
+    assert job['state'] == DONE
+    assert job['result'] == {'ok': True}
+
+def test_unserialisable_result_fails_the_job(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    job = wait(queue, queue.submit('test', lambda: {'path': object()}))
+    assert job['state'] == FAILED
+    assert 'not JSON serializable' in job['error']
@@ -0,0 +1,67 @@
+import os
+import random
+import shutil
+
+import pytest
+
+import keymap_dt
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KEYMAP = os.path.join(ROOT, 'config', 'corne.keymap')
+
+def test_load_cache_is_bounded_and_keeps_recent_documents(tmp_path, monkeypatch):
+    monkeypatch.setattr(keymap_dt, '_cache', keymap_dt.OrderedDict())
+    paths = []
+    for i in range(keymap_dt.MAX_CACHED + 5):
+        path = str(tmp_path / f'{i}.keymap')
+        shutil.copy(KEYMAP, path)
+        paths.append(path)
+        keymap_dt.load(path)
+    first_kept = paths[5]
+    doc = keymap_dt.load(first_kept) # Touching it makes it the most recent
+    keymap_dt.load(KEYMAP)
+
+    assert len(keymap_dt._cache) == keymap_dt.MAX_CACHED
+    assert str(tmp_path / '0.keymap') not in keymap_dt._cache
+    assert keymap_dt.load(first_kept) is doc
+
+# reparse must give exactly what parse gives for the edited text (or fail the
+# same way), and must not touch the document it was handed
+EDIT_SNIPPETS = ['"', '/*', '*/', '//', '\n', '{', '}', ';', '<', '>', '&kp A', ' ', 'x', '#define Y 1\n', '*/ "']
+
+def dump(doc):
+    def node(n):
+        return (n.name, n.label, repr(n.props), n.start, n.body_start, n.body_end, n.end,
+                [node(c) for c in n.children])
+    return [node(n) for n in doc.nodes], doc.defines, doc.length
+
+def outcome(fn):
+    try:
+        return dump(fn())
+    except keymap_dt.KeymapSyntaxError:
+        return 'error'
+
+@pytest.mark.parametrize('name', ['corne.keymap', 'eyelash_corne.keymap', 'totem.keymap'])
+def test_reparse_matches_a_full_parse_over_random_edits(name):
+    with open(os.path.join(ROOT, 'config', name), encoding='utf-8') as f:
+        text = f.read()
+    doc = keymap_dt.parse(text)
+    before = dump(doc)
+    rng = random.Random(name)
+    for _ in range(400):
+        start = rng.randrange(len(text))
+        end = min(len(text), start + rng.randrange(12))
+        new = text[:start] + rng.choice(EDIT_SNIPPETS + ['']) + text[end:]
+        assert outcome(lambda: keymap_dt.reparse(doc, text, new)) == outcome(lambda: keymap_dt.parse(new)), \
+            f"edit at {start}:{end}"
+    assert dump(doc) == before
+
+def test_edit_that_leaves_an_unterminated_string_in_a_node_body_falls_back():
+    # Replacing "*/ ..." in a comment with a quote: the body on its own no
+    # longer tokenizes, the whole file still parses
+    with open(KEYMAP, encoding='utf-8') as f:
+        text = f.read()
+    start = text.index('/* KC_BTN5 */') + len('/* KC_BTN5 ')
+    new = text[:start] + '"' + text[start + 2:]
+    doc = keymap_dt.parse(text)
+    assert outcome(lambda: keymap_dt.reparse(doc, text, new)) == outcome(lambda: keymap_dt.parse(new))
@@ -0,0 +1,63 @@
+import os
+import shutil
+
+import pytest
+
+import mount_watcher
+
+# The volume showing up or going away under the mount root has to wake
+# wait() promptly, with inotify and with the polling fallback alike, and the
+# watcher has to survive the mount root itself disappearing.
+
+@pytest.fixture(params=['inotify', 'polling'])
+def make_watcher(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(mount_watcher, 'POLL_INTERVAL', 0.02)
+    if request.param == 'polling':
+        monkeypatch.setattr(mount_watcher, '_inotify', lambda: None)
+    elif mount_watcher._inotify() is None:
+        pytest.skip("inotify not available")
+    root = tmp_path / 'media'
+    root.mkdir()
+    def make():
+        watcher = mount_watcher.MountWatcher(str(root), 'NICENANO')
+        assert not watcher.mounted() # Starts the watch thread
+        return watcher
+    return make
+
+def test_mkdir_and_rmdir_of_the_volume_wake_waiters(make_watcher):
+    watcher = make_watcher()
+    assert not watcher.wait(mounted=True, timeout=0.2)
+    os.mkdir(watcher.path)
+    assert watcher.wait(mounted=True, timeout=5)
+    os.rmdir(watcher.path)
+    assert watcher.wait(mounted=False, timeout=5)
+
+def test_other_volumes_are_ignored(make_watcher):
+    watcher = make_watcher()
+    _, version = watcher.changes(timeout=0)
+    os.mkdir(os.path.join(watcher.root, 'USBSTICK'))
+    assert watcher.changes(version, timeout=0.3) == (False, version)
+
+def test_changes_reports_every_transition(make_watcher):
+    watcher = make_watcher()
+    _, version = watcher.changes(timeout=0)
+    os.mkdir(watcher.path)
+    mounted, version = watcher.changes(version, timeout=5)
+    assert mounted
+    os.rmdir(watcher.path)
+    mounted, _ = watcher.changes(version, timeout=5)
+    assert not mounted
+
+def test_root_disappearing_and_coming_back(make_watcher):
+    watcher = make_watcher()
+    os.mkdir(watcher.path)
+    assert watcher.wait(mounted=True, timeout=5)
+    shutil.rmtree(watcher.root)
+    assert watcher.wait(mounted=False, timeout=5)
+    os.makedirs(watcher.path)
+    assert watcher.wait(mounted=True, timeout=5)
+    # Watched again once the root is back, not just found by the one check
+    os.rmdir(watcher.path)
+    assert watcher.wait(mounted=False, timeout=5)
+    os.mkdir(watcher.path)
+    assert watcher.wait(mounted=True, timeout=5)
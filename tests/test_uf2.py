@@ -0,0 +1,35 @@
+import hashlib
+import struct
+
+import pytest
+
+import uf2
+
+def image(count, family='nrf52840'):
+    blocks = []
+    for i in range(count):
+        header = struct.pack('<8I', uf2.MAGIC_START0, uf2.MAGIC_START1, uf2.FLAG_FAMILY_ID_PRESENT,
+                             0x1000 + i * 256, 256, i, count, uf2.FAMILIES[family])
+        blocks.append(header + bytes([i % 256]) * 476 + struct.pack('<I', uf2.MAGIC_END))
+    return b''.join(blocks)
+
+@pytest.mark.parametrize('count', [1, 64, 65, 300])
+def test_hash_from_the_block_walk_matches_the_file(tmp_path, count):
+    data = image(count)
+    path = tmp_path / 'fw.uf2'
+    path.write_bytes(data)
+    info = uf2.check(str(path))
+    assert info['sha256'] == hashlib.sha256(data).hexdigest()
+    assert info['blocks'] == count
+
+def test_truncated_file_is_rejected(tmp_path):
+    path = tmp_path / 'fw.uf2'
+    path.write_bytes(image(100)[:10 * uf2.BLOCK_SIZE])
+    with pytest.raises(uf2.UF2Error, match='truncated: 10 of 100 blocks'):
+        uf2.check(str(path))
+
+def test_wrong_family_is_rejected(tmp_path):
+    path = tmp_path / 'fw.uf2'
+    path.write_bytes(image(3, family='rp2040'))
+    with pytest.raises(uf2.UF2Error, match='built for rp2040'):
+        uf2.check(str(path))
@@ -0,0 +1,120 @@
+import glob
+import json
+import os
+import re
+
+import pytest
+
+import keymap_dt
+from convert_vil import convert_file, translate_file
+from vil_reader import load_sections
+
+# Round trip: every template in vail_templates/ is converted with convert_file,
+# the written keymap is parsed back with keymap_dt and checked against what the
+# converter meant to emit. The shipped templates use none of the Vial-only
+# sections, so each one is also run with tap dances, macros, combos and key
+# overrides injected.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATES = sorted(glob.glob(os.path.join(ROOT, 'vail_templates', '*.vil')))
+
+# Source keycodes of the sections vil_behaviors supports; the translator must
+# never fall back to "&none /* ... */" for them
+SUPPORTED_FALLBACK_RE = re.compile(r'&none /\* (TD\(\d+\)|M\d+) \*/')
+REFERENCE_RE = re.compile(r'^(td|macro|ko)\d+(_\d+)?$')
+
+def with_behaviors(template, tmp_path):
+    # Copy of the template whose first layer uses a tap dance (including one
+    # with no entry), a macro past the end of the macro list, a combo and two
+    # key overrides sharing a trigger (on layers 0 and 1)
+    with open(template) as f:
+        data = json.load(f)
+    layer = data['layout'][0]
+    layer[0][1], layer[0][2], layer[0][3] = 'TD(0)', 'TD(40)', 'M20'
+    layer[3][4] = data['layout'][1][3][4] = 'KC_BSPACE'
+    data['tap_dance'] = [['KC_A', 'KC_LSHIFT', 'KC_B', 'KC_NO', 180], ['KC_C']]
+    data['macro'] = [[['text', 'hi']], [['tap', 'KC_A'], ['delay', 50], ['tap', 'KC_B']]]
+    data['combo'] = [['KC_T', 'KC_Y', 'KC_NO', 'KC_NO', 'KC_ESC']]
+    trigger = {'trigger': 'KC_BSPACE', 'layers': 0xFFFF, 'negative_mod_mask': 0, 'options': 0x87}
+    data['key_override'] = [
+        dict(trigger, replacement='KC_DELETE', trigger_mods=2, suppressed_mods=2),
+        dict(trigger, replacement='KC_HOME', trigger_mods=1, suppressed_mods=1, layers=0b10),
+    ]
+    path = tmp_path / ('behaviors_' + os.path.basename(template))
+    path.write_text(json.dumps(data))
+    return str(path)
+
+@pytest.fixture(params=[(t, injected) for t in TEMPLATES for injected in (False, True)],
+                ids=lambda p: os.path.basename(p[0]) + ('+behaviors' if p[1] else ''))
+def converted(request, tmp_path):
+    # -> (vil path, translated layers, parsed keymap)
+    template, injected = request.param
+    vil = with_behaviors(template, tmp_path) if injected else template
+    keymap_file = tmp_path / 'out.keymap'
+    layers = convert_file(vil, str(keymap_file))
+    return vil, layers, keymap_dt.parse(keymap_file.read_text())
+
+def test_templates_exist():
+    assert TEMPLATES
+
+def test_layer_and_binding_counts(converted):
+    vil, layers, doc = converted
+    parsed = doc.layers()
+    assert len(parsed) == len(layers) == len(load_sections(vil, ('layout',))['layout'])
+    for layer, keys in zip(parsed, layers):
+        assert len(layer.bindings) == len(keys)
+        assert [str(b) for b in layer.bindings] == [str(b) for key in keys for b in keymap_dt.parse_bindings(key)]
+
+def test_behavior_references_resolve(converted):
+    _, layers, doc = converted
+    labels = doc.labels()
+    emitted = {ref for ref in doc.references() if REFERENCE_RE.match(ref)}
+    assert emitted <= labels
+    assert not doc.undefined_references()
+    for keys in layers:
+        for key in keys:
+            for binding in keymap_dt.parse_bindings(key):
+                if REFERENCE_RE.match(binding.behavior):
+                    assert binding.behavior in labels
+
+def test_combos_resolve(converted):
+    vil, layers, doc = converted
+    combos = [n for n in doc.walk() if n.prop_string('compatible') == 'zmk,combos']
+    entries = load_sections(vil, ('combo',)).get('combo') or []
+    wanted = [i for i, e in enumerate(entries) if len(e) >= 5 and e[4] != 'KC_NO' and sum(k != 'KC_NO' for k in e[:4]) >= 2]
+    nodes = {n.name: n for c in combos for n in c.children}
+    assert sorted(nodes) == sorted(f'combo_{i}' for i in wanted)
+    for node in nodes.values():
+        positions = [int(p) for p in node.props['key-positions'][0]]
+        assert all(0 <= p < len(layers[0]) for p in positions)
+        assert len(node.bindings()) == 1
+
+def test_no_fallback_for_supported_sections(converted):
+    _, layers, doc = converted
+    for keys in layers:
+        assert not [k for k in keys if SUPPORTED_FALLBACK_RE.match(k)]
+    for node in doc.walk():
+        for values in node.props.values():
+            for value in values:
+                cells = ' '.join(value) if isinstance(value, list) else str(value)
+                assert not SUPPORTED_FALLBACK_RE.search(cells)
+
+def test_shared_trigger_overrides_chain(tmp_path):
+    vil = with_behaviors(TEMPLATES[0], tmp_path)
+    behaviors, layers = translate_file(vil)
+    doc = keymap_dt.parse('/ {\n' + behaviors + '};\n')
+    morphs = {n.label: n for n in doc.walk() if n.prop_string('compatible') == 'zmk,behavior-mod-morph'}
+    assert set(morphs) == {'ko0', 'ko1'}
+    # ko1 only applies on layer 1, where it falls through to ko0
+    assert str(morphs['ko1'].bindings()[0]) == '&ko0'
+    assert '&ko0' in layers[0] and '&ko1' in layers[1]
+
+def test_injected_behaviors_translate_to_real_bindings(tmp_path):
+    behaviors, _ = translate_file(with_behaviors(TEMPLATES[0], tmp_path))
+    doc = keymap_dt.parse('/ {\n' + behaviors + '};\n')
+    nodes = {n.label or n.name: n for n in doc.walk()}
+    bindings = lambda name: [str(b) for b in nodes[name].bindings()]
+    assert bindings('combo_0') == ['&kp ESC']
+    assert bindings('td0') == ['&td0_hold1 LSHIFT A', '&kp B']
+    assert bindings('ko0') == ['&kp BSPC', '&kp DEL']
+    assert bindings('ko1') == ['&ko0', '&kp HOME']
+    assert bindings('macro1')[:3] == ['&macro_tap', '&kp A', '&macro_wait_time 50']
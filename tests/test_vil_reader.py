@@ -0,0 +1,84 @@
+import glob
+import io
+import json
+import os
+
+import pytest
+
+import vil_reader
+from vil_reader import iter_layers, load_sections
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATES = sorted(glob.glob(os.path.join(ROOT, 'vail_templates', '*.vil')))
+
+# Chunk sizes small enough that keys, strings, escapes and numbers all end up
+# split across chunk boundaries
+CHUNK_SIZES = [1, 2, 3, 7, 64, vil_reader.CHUNK_SIZE]
+
+TRICKY = {
+    'version': 1,
+    'uid': 12345678901234567890,
+    'notes': 'quote " backslash \\ brace { bracket ] comma , unicode é☃ \U0001F600',
+    'settings': {'1': 200, '2': [0.5, -1e-3, True, False, None], 'nested': {'a': [[], {}, [[[1]]]]}},
+    'layout': [[['KC_A', -1, 'LT(1, KC_SPACE)']], [['KC_TRNS', '"]}', 'KC_NO']]],
+    'macro': [[['text', 'a "quoted" ] text']], []],
+    'tap_dance': [['KC_A', 'KC_B', 'KC_NO', 'KC_NO', 200]],
+    'empty': '',
+}
+
+def write(tmp_path, data, name='test.vil'):
+    path = tmp_path / name
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding='utf-8')
+    return str(path)
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_sections_match_json_load_across_chunk_boundaries(tmp_path, chunk_size):
+    path = write(tmp_path, TRICKY)
+    wanted = ['settings', 'macro', 'tap_dance', 'notes', 'uid', 'empty']
+    assert load_sections(path, wanted, chunk_size) == {k: TRICKY[k] for k in wanted}
+    assert list(iter_layers(path, chunk_size)) == TRICKY['layout']
+
+@pytest.mark.parametrize('template', TEMPLATES, ids=os.path.basename)
+@pytest.mark.parametrize('chunk_size', [5, 4096])
+def test_templates_match_json_load(template, chunk_size):
+    with open(template) as f:
+        data = json.load(f)
+    assert list(iter_layers(template, chunk_size)) == data['layout']
+    sections = [k for k in data if k != 'layout']
+    assert load_sections(template, sections, chunk_size) == {k: data[k] for k in sections}
+
+def test_skipped_sections_are_not_decoded(tmp_path, monkeypatch):
+    # Only the wanted section reaches the decoder, and it reaches it once as a
+    # whole (the object keys are the other strings decoded on the way)
+    path = write(tmp_path, TRICKY)
+    decoded = []
+    monkeypatch.setattr(vil_reader, '_decode', lambda text: decoded.append(text) or json.loads(text))
+    assert load_sections(path, ['tap_dance'], 3) == {'tap_dance': TRICKY['tap_dance']}
+    assert [json.loads(text) for text in decoded if text[0] != '"'] == [TRICKY['tap_dance']]
+    assert {json.loads(text) for text in decoded if text[0] == '"'} <= set(TRICKY)
+
+def test_large_section_is_decoded_once(tmp_path, monkeypatch):
+    big = {'macro': [[['text', 'x' * 100]] for _ in range(20000)], 'layout': []}
+    path = write(tmp_path, big)
+    calls = []
+    monkeypatch.setattr(vil_reader, '_decode', lambda text: calls.append(text[0]) or json.loads(text))
+    assert load_sections(path, ['macro'], 256) == {'macro': big['macro']}
+    assert calls.count('[') == 1
+
+def test_reading_stops_after_the_layout(tmp_path):
+    data = dict(TRICKY)
+    path = write(tmp_path, {'layout': data['layout'], 'macro': data['macro']})
+    with open(path) as f:
+        text = f.read()
+    stream = io.StringIO(text[:text.index('"macro"')] + '"macro": [ this is never read')
+    reader = vil_reader._Stream(stream, 4)
+    keys = reader.items()
+    assert next(keys) == 'layout'
+    assert list(reader.elements()) == data['layout']
+
+@pytest.mark.parametrize('text', ['{"layout": [[1, 2]', '{"a": "unterminated', '{"a": [1, 2}', '[1]'])
+def test_broken_input_is_a_value_error(tmp_path, text):
+    path = tmp_path / 'broken.vil'
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        load_sections(str(path), ['a', 'layout'], 3)
@@ -0,0 +1,145 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import threading
+
+# UF2 firmware checks run before anything is copied to the bootloader drive:
+# a truncated download or a file built for another chip costs a reset cycle
+# plus a re-flash. The file is memory-mapped and every 512-byte block header
+# is read in place (magic numbers, sequence number, block count, family ID);
+# the same walk feeds each block to the SHA-256, so the file is read once.
+# https://github.com/microsoft/uf2#file-format
+BLOCK_SIZE = 512
+MAGIC_START0 = 0x0A324655
+MAGIC_START1 = 0x9E5D5157
+MAGIC_END = 0x0AB16F30
+MAX_PAYLOAD = 476
+HASH_CHUNK = 64 * BLOCK_SIZE # Blocks are hashed in runs; a hashlib update per block costs more than the read saves
+
+FLAG_NOT_MAIN_FLASH = 0x00000001
+FLAG_FAMILY_ID_PRESENT = 0x00002000
+
+# nice!nano and the eyelash corne are nRF52840 boards
+FAMILIES = {
+    'nrf52840': 0xADA52840,
+    'nrf52833': 0x621E937A,
+    'rp2040': 0xE48BFF56,
+}
+DEFAULT_FAMILY = 'nrf52840'
+
+_HEADER = struct.Struct('<8I') # magic0, magic1, flags, target addr, payload size, block no, num blocks, family
+_END = struct.Struct('<I')
+
+class UF2Error(Exception):
+    pass
+
+def _parse(buf, family_id, digest):
+    # -> info dict, raises UF2Error. One pass over the blocks, no copies; the
+    # blocks are also fed to digest (a hashlib object) on the way.
+    size = len(buf)
+    if size == 0:
+        raise UF2Error("empty file")
+    if size % BLOCK_SIZE:
+        raise UF2Error(f"truncated: {size} bytes is not a whole number of {BLOCK_SIZE}-byte blocks")
+
+    total = size // BLOCK_SIZE
+    expected = None
+    families = set()
+    payload = 0
+    for index in range(total):
+        offset = index * BLOCK_SIZE
+        if offset % HASH_CHUNK == 0:
+            digest.update(buf[offset:offset + HASH_CHUNK])
+        magic0, magic1, flags, _, payload_size, block_no, num_blocks, family = _HEADER.unpack_from(buf, offset)
+        if magic0 != MAGIC_START0 or magic1 != MAGIC_START1 or _END.unpack_from(buf, offset + BLOCK_SIZE - 4)[0] != MAGIC_END:
+            raise UF2Error(f"block {index}: bad magic, not a UF2 file or corrupt")
+        if expected is None:
+            expected = num_blocks
+        if num_blocks != expected:
+            raise UF2Error(f"block {index}: block count {num_blocks}, earlier blocks say {expected}")
+        if block_no != index:
+            raise UF2Error(f"block {index}: sequence number {block_no}, blocks missing or out of order")
+        if payload_size > MAX_PAYLOAD:
+            raise UF2Error(f"block {index}: payload of {payload_size} bytes")
+        if flags & FLAG_NOT_MAIN_FLASH:
+            continue
+        if flags & FLAG_FAMILY_ID_PRESENT:
+            families.add(family)
+        payload += payload_size
+
+    if expected != total:
+        raise UF2Error(f"truncated: {total} of {expected} blocks")
+    if family_id is not None:
+        if not families:
+            raise UF2Error("no family ID, can't tell which chip it was built for")
+        wrong = families - {family_id}
+        if wrong:
+            names = {v: k for k, v in FAMILIES.items()}
+            found = ', '.join(names.get(f, f"0x{f:08X}") for f in sorted(wrong))
+            raise UF2Error(f"built for {found}, not {names.get(family_id, f'0x{family_id:08X}')}")
+    return {'blocks': total, 'payload_bytes': payload, 'families': sorted(families)}
+
+# Results by content hash, and content hash by (device, inode, size, mtime) so
+# an unchanged file is only stat()ed. Hardlinked copies of an artifact share
+# both; a plain copy costs one pass over its blocks.
+CACHE_SIZE = 256
+_by_stat = {}
+_by_hash = {}
+_cache_lock = threading.Lock()
+
+def _remember(cache, key, value):
+    with _cache_lock:
+        if len(cache) >= CACHE_SIZE:
+            cache.clear()
+        cache[key] = value
+
+def check(path, family=DEFAULT_FAMILY):
+    # -> info dict ('sha256', 'blocks', 'payload_bytes', 'families') for a
+    # flashable file, raises UF2Error otherwise. family=None skips the family check.
+    family_id = FAMILIES[family] if family is not None else None
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        raise UF2Error(f"can't read {path}: {e.strerror}") from None
+    stat_key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    digest = _by_stat.get(stat_key)
+    result = _by_hash.get((digest, family_id)) if digest else None
+    if result is None:
+        try:
+            with open(path, 'rb') as f:
+                if st.st_size == 0:
+                    raise UF2Error("empty file")
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                    sha = hashlib.sha256()
+                    try:
+                        result = _parse(view, family_id, sha)
+                    except UF2Error as e:
+                        # The walk stopped early: hash the whole (rejected) file again
+                        result = e
+                        sha = hashlib.sha256(view)
+                    digest = sha.hexdigest()
+                    if not isinstance(result, UF2Error):
+                        result['sha256'] = digest
+                    _remember(_by_hash, (digest, family_id), result)
+        except OSError as e:
+            raise UF2Error(f"can't read {path}: {e.strerror}") from None
+        _remember(_by_stat, stat_key, digest)
+
+    if isinstance(result, UF2Error):
+        raise UF2Error(str(result))
+    return dict(result)
+
+if __name__ == "__main__":
+    # python3 uf2.py firmware_latest/*.uf2
+    failed = False
+    for path in sys.argv[1:]:
+        try:
+            info = check(path)
+            print(f"{path}: OK, {info['blocks']} blocks, {info['payload_bytes']} bytes, sha256 {info['sha256'][:12]}")
+        except UF2Error as e:
+            print(f"{path}: {e}")
+            failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,252 @@
+import re
+from keycodes import parse_keycode
+
+# Turns the Vial-only sections of a .vil export (tap_dance, combo, macro,
+# key_override) into ZMK devicetree nodes, so a converted keymap needs no
+# hand edits. Layers are the translated binding lists from keycodes.parse_layer;
+# a binding's index in that list is its ZMK key position.
+SECTIONS = ('tap_dance', 'combo', 'macro', 'key_override')
+
+MACRO_WAIT_MS = 15 # ZMK's default; restored after a Vial "delay" step
+TAP_DANCE_TERM_MS = 200 # Vial's default, for a TD(n) whose entry is missing
+KO_ENABLED = 1 << 7 # Vial key_override option bit
+
+# QMK 8-bit mod mask (LCTL LSFT LALT LGUI RCTL RSFT RALT RGUI) -> ZMK names
+MOD_BITS = ['MOD_LCTL', 'MOD_LSFT', 'MOD_LALT', 'MOD_LGUI', 'MOD_RCTL', 'MOD_RSFT', 'MOD_RALT', 'MOD_RGUI']
+
+# Characters of a Vial "text" macro step -> ZMK key codes
+TEXT_KEYS = {
+    ' ': 'SPACE', '\n': 'RET', '\t': 'TAB',
+    '!': 'EXCL', '@': 'AT', '#': 'HASH', '$': 'DOLLAR', '%': 'PERCENT', '^': 'CARET',
+    '&': 'AMPS', '*': 'STAR', '(': 'LPAR', ')': 'RPAR', '-': 'MINUS', '_': 'UNDER',
+    '=': 'EQUAL', '+': 'PLUS', '[': 'LBKT', ']': 'RBKT', '{': 'LBRC', '}': 'RBRC',
+    '\\': 'BSLH', '|': 'PIPE', ';': 'SEMI', ':': 'COLON', "'": 'SQT', '"': 'DQT',
+    ',': 'COMMA', '<': 'LT', '.': 'DOT', '>': 'GT', '/': 'FSLH', '?': 'QMARK',
+    '`': 'GRAVE', '~': 'TILDE',
+}
+
+_REF_RE = re.compile(r"&(td|macro)(\d+)$")
+
+def _binding(qc):
+    binding = parse_keycode(qc)
+    return binding or "&none"
+
+def _is_none(qc):
+    return qc in (None, -1, "", "KC_NO") or _binding(qc) == "&none"
+
+def _split(binding):
+    # "&kp LS(ENTER)" -> ("&kp", ["LS(ENTER)"])
+    parts = binding.split()
+    return parts[0], parts[1:]
+
+def _mods(mask):
+    names = [MOD_BITS[i] for i in range(8) if mask & (1 << i)]
+    return f"<({'|'.join(names)})>" if names else None
+
+def _node(label, name, props):
+    lines = [f"                {label}: {name} {{"]
+    lines += [f"                        {prop};" for prop in props]
+    lines.append("                };")
+    return lines
+
+def _referenced(layers, kind):
+    refs = set()
+    for layer in layers:
+        for binding in layer:
+            m = _REF_RE.match(binding)
+            if m and m.group(1) == kind:
+                refs.add(int(m.group(2)))
+    return refs
+
+# --- tap dance ----------------------------------------------------------------
+
+def _tap_slot(label, name, tap_qc, hold_qc, term):
+    # -> (binding, extra nodes). A Vial slot with a hold action becomes a
+    # hold-tap; ZMK hold-taps pass one parameter each to the hold and tap behavior.
+    tap = _binding(tap_qc)
+    if _is_none(hold_qc):
+        return tap, []
+    hold = _binding(hold_qc)
+    (hold_behavior, hold_args), (tap_behavior, tap_args) = _split(hold), _split(tap)
+    if len(hold_args) != 1 or len(tap_args) != 1:
+        # Can't express as a hold-tap; keep whichever action exists
+        return (hold if _is_none(tap_qc) else tap), []
+    node = _node(label, name, [
+        'compatible = "zmk,behavior-hold-tap"',
+        '#binding-cells = <2>',
+        f'tapping-term-ms = <{term}>',
+        'flavor = "hold-preferred"',
+        f'bindings = <{hold_behavior}>, <{tap_behavior}>',
+    ])
+    return f"&{label} {hold_args[0]} {tap_args[0]}", node
+
+def tap_dance_nodes(entries, referenced):
+    # Vial: [on_tap, on_hold, on_double_tap, on_tap_hold, tapping_term]. Every
+    # referenced TD(n) gets a node, even one the export has no (whole) entry for,
+    # so the keymap never points at an undefined &tdN.
+    nodes = []
+    for i in sorted(set(range(len(entries))) | referenced):
+        entry = entries[i] if i < len(entries) else []
+        if len(entry) < 5:
+            entry = ["KC_NO", "KC_NO", "KC_NO", "KC_NO", TAP_DANCE_TERM_MS]
+        on_tap, on_hold, on_double, on_tap_hold, term = entry[:5]
+        slots = []
+        extra = []
+        for n, (tap_qc, hold_qc) in enumerate([(on_tap, on_hold), (on_double, on_tap_hold)], 1):
+            binding, node = _tap_slot(f"td{i}_hold{n}", f"tap_dance_{i}_hold_{n}", tap_qc, hold_qc, term)
+            slots.append(binding)
+            extra += node
+        while slots and slots[-1] == "&none":
+            slots.pop()
+        if not slots and i not in referenced:
+            continue
+        nodes += extra
+        nodes += _node(f"td{i}", f"tap_dance_{i}", [
+            'compatible = "zmk,behavior-tap-dance"',
+            '#binding-cells = <0>',
+            f'tapping-term-ms = <{term}>',
+            f"bindings = {', '.join(f'<{b}>' for b in slots or ['&none'])}",
+        ])
+    return nodes
+
+# --- key overrides ------------------------------------------------------------
+
+def key_override_nodes(entries, layers):
+    # -> (nodes, layers with trigger keys swapped for the mod-morph). ZMK
+    # mod-morphs fire on *any* of the mods where QMK wants all trigger mods,
+    # and negative mods have no equivalent. Overrides sharing a trigger key
+    # chain: a later one's default binding is the earlier one's mod-morph.
+    nodes = []
+    layers = [list(layer) for layer in layers]
+    original = [list(layer) for layer in layers]
+    for i, ko in enumerate(entries):
+        if not isinstance(ko, dict) or not ko.get('options', 0) & KO_ENABLED:
+            continue
+        mods = _mods(ko.get('trigger_mods', 0))
+        if _is_none(ko.get('trigger')) or not mods:
+            continue
+        trigger, replacement = _binding(ko['trigger']), _binding(ko.get('replacement'))
+        keep = _mods(ko.get('trigger_mods', 0) & ~ko.get('suppressed_mods', 0))
+
+        # Trigger positions grouped by what is there now: the trigger itself,
+        # or an earlier override's mod-morph (one node per distinct default)
+        layer_mask = ko.get('layers', 0xFFFF)
+        defaults = {}
+        for n, layer in enumerate(original):
+            if layer_mask & (1 << n):
+                for pos, binding in enumerate(layer):
+                    if binding == trigger:
+                        defaults.setdefault(layers[n][pos], []).append((n, pos))
+
+        for k, (default, positions) in enumerate((defaults or {trigger: []}).items()):
+            suffix = f"_{k}" if k else ""
+            props = [
+                'compatible = "zmk,behavior-mod-morph"',
+                '#binding-cells = <0>',
+                f'bindings = <{default}>, <{replacement}>',
+                f'mods = {mods}',
+            ]
+            if keep:
+                props.append(f'keep-mods = {keep}')
+            nodes += _node(f"ko{i}{suffix}", f"key_override_{i}{suffix}", props)
+            for n, pos in positions:
+                layers[n][pos] = f"&ko{i}{suffix}"
+    return nodes, layers
+
+# --- macros -------------------------------------------------------------------
+
+def _text_bindings(text):
+    bindings = []
+    for ch in text:
+        if ch.isalpha() and ch.isascii():
+            bindings.append(f"&kp LS({ch})" if ch.isupper() else f"&kp {ch.upper()}")
+        elif ch.isdigit():
+            bindings.append(f"&kp N{ch}")
+        elif ch in TEXT_KEYS:
+            bindings.append(f"&kp {TEXT_KEYS[ch]}")
+    return bindings
+
+def macro_steps(actions):
+    # Vial actions ["text", s] / ["tap"|"down"|"up", kc...] / ["delay", ms] -> ZMK macro bindings
+    steps = []
+    for action in actions:
+        if not action:
+            continue
+        kind, args = action[0], action[1:]
+        if kind == 'text':
+            keys = _text_bindings(''.join(str(a) for a in args))
+            if keys:
+                steps.append(f"<&macro_tap {' '.join(keys)}>")
+        elif kind in ('tap', 'down', 'up'):
+            keys = [_binding(kc) for kc in args if not _is_none(kc)]
+            if keys:
+                op = {'tap': '&macro_tap', 'down': '&macro_press', 'up': '&macro_release'}[kind]
+                steps.append(f"<{op} {' '.join(keys)}>")
+        elif kind == 'delay' and args:
+            steps += [f"<&macro_wait_time {int(args[0])}>", "<&macro_tap &none>", f"<&macro_wait_time {MACRO_WAIT_MS}>"]
+    return steps
+
+def macro_nodes(entries, referenced):
+    # Like tap dances, a referenced M(n) past the end of the export still gets a node
+    nodes = []
+    for i in sorted(set(range(len(entries))) | referenced):
+        actions = entries[i] if i < len(entries) else []
+        steps = macro_steps(actions or [])
+        if not steps and i not in referenced:
+            continue
+        nodes += _node(f"macro{i}", f"macro_{i}", [
+            'compatible = "zmk,behavior-macro"',
+            '#binding-cells = <0>',
+            f'wait-ms = <{MACRO_WAIT_MS}>',
+            f"bindings = {', '.join(steps or ['<&macro_tap &none>'])}",
+        ])
+    return nodes
+
+# --- combos -------------------------------------------------------------------
+
+def combo_nodes(entries, layers):
+    # Vial combos name keycodes; ZMK combos name key positions, taken from the
+    # first layer that has every trigger key
+    nodes = []
+    for i, entry in enumerate(entries):
+        if len(entry) < 5 or _is_none(entry[4]):
+            continue
+        triggers = [_binding(kc) for kc in entry[:4] if not _is_none(kc)]
+        if len(triggers) < 2:
+            continue
+        for n, layer in enumerate(layers):
+            if all(t in layer for t in triggers):
+                positions = [layer.index(t) for t in triggers]
+                break
+        else:
+            nodes.append(f"                /* combo_{i}: {' + '.join(triggers)} not found on any layer */")
+            continue
+        props = [
+            f"key-positions = <{' '.join(map(str, sorted(positions)))}>",
+            f"bindings = <{_binding(entry[4])}>",
+        ]
+        if n:
+            props.append(f"layers = <{n}>")
+        nodes.append(f"                combo_{i} {{")
+        nodes += [f"                        {prop};" for prop in props]
+        nodes.append("                };")
+    return nodes
+
+# --- all together -------------------------------------------------------------
+
+def _block(name, lines, header=()):
+    if not lines:
+        return []
+    return [f"        {name} {{", *header, *lines, "        };", ""]
+
+def behaviors_source(sections, layers):
+    # -> (devicetree text to put before the keymap node, layers to put in it)
+    nodes, layers = key_override_nodes(sections.get('key_override') or [], layers)
+    nodes = tap_dance_nodes(sections.get('tap_dance') or [], _referenced(layers, 'td')) + nodes
+    macros = macro_nodes(sections.get('macro') or [], _referenced(layers, 'macro'))
+    combos = combo_nodes(sections.get('combo') or [], layers)
+
+    lines = _block('behaviors', nodes)
+    lines += _block('macros', macros)
+    lines += _block('combos', combos, ['                compatible = "zmk,combos";'])
+    return ''.join(line + '\n' for line in lines), layers
@@ -0,0 +1,183 @@
+import json
+import re
+
+# Incremental reader for Vial .vil exports. A .vil is one JSON object whose
+# sections (layout, macro, tap_dance, combo, key_override, settings, ...) are
+# all loaded by json.load even when only `layout` is needed. This reader walks
+# the object in fixed-size chunks, decodes only the requested sections, skips
+# the rest without building Python objects, and can hand out layers one at a
+# time. It stops reading as soon as the requested sections have been seen.
+# A container or string is decoded once, after a scan has found where it ends.
+CHUNK_SIZE = 64 * 1024
+
+_WS_RE = re.compile(r'[ \t\n\r]*')
+_STRUCT_RE = re.compile(r'["\[\]{},]') # Characters that matter while skipping a value
+_STRING_END_RE = re.compile(r'["\\]')
+_decoder = json.JSONDecoder()
+_decode = json.loads
+
+class _Stream:
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.mark = None # Start of a value being collected; kept across fills
+        self.eof = False
+
+    def _fill(self):
+        # Read another chunk, dropping what has already been consumed. While a
+        # value is being collected the reads grow with the buffer, so a large
+        # section is copied O(log n) times, not once per chunk.
+        if self.eof:
+            return False
+        keep = self.pos if self.mark is None else self.mark
+        chunk = self.f.read(self.chunk_size if self.mark is None else max(self.chunk_size, len(self.buf)))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[keep:] + chunk
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark = 0
+        return True
+
+    def _error(self, message):
+        raise ValueError(f"Invalid .vil JSON: {message}")
+
+    def peek(self):
+        # -> next non-whitespace character (not consumed), '' at end of input
+        while True:
+            self.pos = _WS_RE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, ch):
+        if self.peek() != ch:
+            self._error(f"expected {ch!r} at {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        # Decode one complete JSON value. Containers and strings are scanned to
+        # their end first (skip() tracks the bracket depth), then decoded once.
+        ch = self.peek()
+        if ch and ch in '[{"':
+            self.mark = self.pos
+            try:
+                self.skip()
+                text = self.buf[self.mark:self.pos]
+            finally:
+                self.mark = None
+            try:
+                return _decode(text)
+            except ValueError as e:
+                self._error(str(e))
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # A number (or literal) touching the end of the buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    self._error(str(e))
+            self._fill() # Scalars only: a few bytes at most
+
+    def skip(self):
+        # Step over one JSON value without decoding it
+        ch = self.peek()
+        if ch not in '[{"':
+            return self.value() # Scalars are small
+        depth = 0
+        while True:
+            m = _STRUCT_RE.search(self.buf, self.pos)
+            if not m:
+                self.pos = len(self.buf)
+                if not self._fill():
+                    self._error("unexpected end of input")
+                continue
+            self.pos = m.end()
+            ch = m.group()
+            if ch == '"':
+                self._skip_string()
+                if depth == 0:
+                    return
+            elif ch in '[{':
+                depth += 1
+            elif ch in ']}':
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def _skip_string(self):
+        # Called just past an opening quote
+        while True:
+            m = _STRING_END_RE.search(self.buf, self.pos)
+            if not m or (m.group() == '\\' and m.end() >= len(self.buf)):
+                if not self._fill():
+                    self._error("unterminated string")
+                continue
+            self.pos = m.end() + (1 if m.group() == '\\' else 0)
+            if m.group() == '"':
+                return
+
+    def items(self):
+        # Iterate the keys of the top-level object; the caller must consume or skip each value
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            ch = self.peek()
+            self.pos += 1
+            if ch == '}':
+                return
+            if ch != ',':
+                self._error(f"expected ',' or '}}' at {ch!r}")
+
+    def elements(self):
+        # Iterate an array's elements, decoding each one as it is reached
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            ch = self.peek()
+            self.pos += 1
+            if ch == ']':
+                return
+            if ch != ',':
+                self._error(f"expected ',' or ']' at {ch!r}")
+
+def iter_layers(vil_file, chunk_size=CHUNK_SIZE):
+    # Yield the raw `layout` layers (lists of rows) one by one. Reading stops
+    # after the layout, so the sections behind it are never even read.
+    with open(vil_file, 'r') as f:
+        stream = _Stream(f, chunk_size)
+        for key in stream.items():
+            if key == 'layout':
+                yield from stream.elements()
+                return
+            stream.skip()
+
+def load_sections(vil_file, sections, chunk_size=CHUNK_SIZE):
+    # -> {section: value} for just the requested top-level sections
+    wanted = set(sections)
+    found = {}
+    with open(vil_file, 'r') as f:
+        stream = _Stream(f, chunk_size)
+        for key in stream.items():
+            if key in wanted:
+                found[key] = stream.value()
+                if len(found) == len(wanted):
+                    break
+            else:
+                stream.skip()
+    return found